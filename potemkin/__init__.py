@@ -1,5 +1,36 @@
 """
 Potemkin decorator to allow using cloudformation for initial conditions in boto integration testing
+
+The decorators and AWS Config helpers are loaded on first use, so importing potemkin (e.g. for terraform or
+the utilities only) does not import boto3.
 """
-from .cloudformationstack import CloudFormationStack
-from .terraformresources import TerraformResources
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'CloudFormationStack': 'cloudformationstack',
+    'CloudFormationStackGraph': 'stackgraph',
+    'NodeOutput': 'stackgraph',
+    'StackNode': 'stackgraph',
+    'TerraformResources': 'terraformresources',
+    'all_rule_results': 'configservice',
+    'config_rule_wait_for_absent_resources': 'configservice',
+    'config_rule_wait_for_compliance_results': 'configservice',
+    'config_rule_wait_for_resource': 'configservice',
+    'config_rules_wait_for_compliance_results': 'configservice',
+    'evaluate_config_rule_and_wait_for_resource': 'configservice',
+    'iter_config_rules_compliance_results': 'configservice'
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_LAZY_ATTRIBUTES[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
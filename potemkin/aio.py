@@ -0,0 +1,399 @@
+"""
+asyncio counterparts of the decorators and AWS Config waiters, so one test can bring up several
+stacks and terraform roots and wait on several config rules at once, on a single event loop
+"""
+import asyncio
+import contextlib
+import functools
+import os
+import signal
+import subprocess
+from collections import deque
+
+from . import configservice as config
+from .cassette import active_cassette
+from .cloudformationstack import CloudFormationStack
+from .instrumentation import instrumentation
+from .terraformresources import DESTROY_ARGS, TerraformResources
+from .terraformrunner import KILL_GRACE_SECONDS, STDERR_TAIL_LINES, TerraformResult, TerraformRunner
+from .waiters import StackWaiter, template_resource_types
+
+
+STREAM_LIMIT = 2 ** 24
+
+
+async def _in_thread(function, *args, **kwargs):
+    """ Run a blocking call, e.g. a single boto3 API call, on the event loop's default executor """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+
+class AsyncStackWaiter(StackWaiter):
+    """ StackWaiter that sleeps with asyncio.sleep instead of blocking a thread between polls """
+
+    async def wait(self, poll, deadline, resource_types=()):
+        """ Sleep, then poll, until poll reports done or the deadline is spent
+
+        :param poll: blocking callable returning (done, value), run on the executor
+        :param deadline: budget in seconds
+        :param resource_types: resource types involved, passed on to the strategy
+        :returns: (done, value) of the last poll """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        value = None
+        for delay in self.strategy.delays(resource_types):
+            remaining = deadline - (loop.time() - start)
+            if remaining <= 0:
+                return False, value
+            await asyncio.sleep(min(delay, remaining))
+            done, value = await _in_thread(poll)
+            if done:
+                return True, value
+
+
+class AsyncCloudFormationStack(CloudFormationStack):
+    """Decorator for async tests that spins up a CloudFormation stack for initial conditions, then
+    tears it down after test, without blocking the event loop.
+
+    provisioned() is the same as an async context manager, so a test can bring up several stacks
+    concurrently:
+
+        async with contextlib.AsyncExitStack() as stacks:
+            network, data = await asyncio.gather(
+                stacks.enter_async_context(network_stack.provisioned()),
+                stacks.enter_async_context(data_stack.provisioned()))
+
+    share, pool_size, reuse_stack and cache are not supported; use CloudFormationStack for those.
+    """
+
+    def __init__(self,
+                 relative_path_to_initial_condition_cfn_template,
+                 stack_name_stem=None,
+                 parameters=None,
+                 aws_profile=None,
+                 teardown=True,
+                 teardown_fail=True,
+                 timeout=5,
+                 background_teardown=False,
+                 wait_strategy=None,
+                 fail_fast=True,
+                 delete_failed_stack=False):
+        """ Constructor, see CloudFormationStack """
+        super().__init__(relative_path_to_initial_condition_cfn_template,
+                         stack_name_stem=stack_name_stem,
+                         parameters=parameters,
+                         aws_profile=aws_profile,
+                         teardown=teardown,
+                         teardown_fail=teardown_fail,
+                         timeout=timeout,
+                         background_teardown=background_teardown,
+                         wait_strategy=wait_strategy,
+                         fail_fast=fail_fast,
+                         delete_failed_stack=delete_failed_stack)
+        self._async_waiter = AsyncStackWaiter(self._waiter.strategy)
+
+    def __call__(self, user_defined_test_function):
+        """ Decorate an async test function taking (stack_outputs, stack_name) """
+
+        async def decorated_test_function():
+            async with self.provisioned() as (stack_name, stack_outputs):
+                with self._timer('test', stack_name):
+                    await user_defined_test_function(stack_outputs, stack_name)
+
+        return decorated_test_function
+
+    @contextlib.asynccontextmanager
+    async def provisioned(self):
+        """ Create the stack on entry and tear it down on exit, yields (stack_name, outputs) """
+        cassette = active_cassette()
+        if cassette.replaying:
+            yield cassette.stack(await _in_thread(self._cassette_key))
+            return
+
+        template_body = await _in_thread(self._template_body)
+        stack_name = self._unique_stack_name(self._stack_name)
+        stack_outputs = await self._create_stack_async(stack_name, self._parameters, template_body)
+        if cassette.recording:
+            cassette.record_stack(self._cassette_key(), stack_name, stack_outputs)
+        try:
+            yield stack_name, stack_outputs
+        except Exception as error:
+            print(error)
+            await self._teardown_stack_async(stack_name, failed=True)
+            raise
+        await self._teardown_stack_async(stack_name)
+
+    async def _create_stack_async(self, stack_name, parameters, template_body):
+        """ Call CreateStack and wait for completion, see CloudFormationStack._create_stack
+
+        :returns: dictionary of outputs """
+        cloudformation = await _in_thread(self._cloudformation)
+        with self._timer('create_stack', stack_name):
+            await _in_thread(self._start_create, cloudformation, stack_name, parameters,
+                             template_body)
+        resource_types = template_resource_types(template_body)
+        stack_dict = None
+        with self._timer('wait', stack_name):
+            if self._fail_fast:
+                poll = self._creation_poll(cloudformation, stack_name)
+                _, failed_event = await self._async_waiter.wait(poll, deadline=self._timeout * 60,
+                                                                resource_types=resource_types)
+                if failed_event:
+                    await _in_thread(self._abort_create, stack_name, failed_event)
+            else:
+                poll = self._status_poll(stack_name, 'CREATE_IN_PROGRESS')
+                _, stack_dict = await self._async_waiter.wait(poll, deadline=self._timeout * 60,
+                                                              resource_types=resource_types)
+        with self._timer('outputs', stack_name):
+            return await _in_thread(self._stack_outputs, stack_name, stack_dict)
+
+    async def _teardown_stack_async(self, stack_name, failed=False):
+        """ Delete the stack and wait for completion, see CloudFormationStack._teardown_stack """
+        if not self._deletes_now(stack_name, failed):
+            return
+        cloudformation = await _in_thread(self._cloudformation)
+        with self._timer('delete', stack_name):
+            await _in_thread(cloudformation.delete_stack, StackName=stack_name)
+            _, stack_dict = await self._async_waiter.wait(
+                self._status_poll(stack_name, 'DELETE_IN_PROGRESS'), deadline=self._timeout * 60)
+        await _in_thread(self._check_deleted, stack_name, stack_dict)
+
+
+class AsyncTerraformRunner(TerraformRunner):
+    """ TerraformRunner on an asyncio subprocess: the event loop reads terraform's output, no thread
+    waits on it """
+
+    async def run(self, args, cwd, json_stream=False, capture=False, ok_returncodes=(0,)):
+        """ Run terraform with args in cwd, see TerraformRunner.run """
+        command = ' '.join(['terraform'] + args)
+        print(f'terraform command: {command}')
+        process = await asyncio.create_subprocess_exec('terraform', *args,
+                                                       stdout=subprocess.PIPE,
+                                                       stderr=subprocess.PIPE,
+                                                       cwd=cwd,
+                                                       env=self._env,
+                                                       limit=STREAM_LIMIT,
+                                                       start_new_session=os.name == 'posix')
+
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        result = TerraformResult()
+        captured = []
+
+        async def read_stdout():
+            async for raw_line in process.stdout:
+                self._handle_line(raw_line, result, json_stream, captured if capture else None)
+
+        async def read_stderr():
+            async for raw_line in process.stderr:
+                stderr_tail.append(self._decode(raw_line))
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(asyncio.gather(read_stdout(), read_stderr(), process.wait()),
+                                   self._timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await self._kill_async(process)
+        except Exception:
+            await self._kill_async(process)
+            raise
+
+        result.stdout = '\n'.join(captured)
+        result.returncode = process.returncode
+        self._check_result(command, result, stderr_tail, timed_out, ok_returncodes)
+        return result
+
+    @staticmethod
+    async def _kill_async(process):
+        """ Deadline passed: terminate terraform and its providers, kill them if they linger """
+        if os.name != 'posix':
+            process.kill()
+            await process.wait()
+            return
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            await asyncio.wait_for(process.wait(), KILL_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            os.killpg(process.pid, signal.SIGKILL)
+            await process.wait()
+        except ProcessLookupError:
+            pass
+
+
+class AsyncTerraformResources(TerraformResources):
+    """Decorator for async tests that creates infrastructure via terraform apply for initial
+    conditions, then tears it down after test.  terraform runs as an asyncio subprocess, so several
+    roots can be applied at once.
+
+    provisioned() is the same as an async context manager yielding tf_outputs.  reuse is not
+    supported; use TerraformResources for that. """
+
+    def __init__(self,
+                 relative_path_to_terraform_root,
+                 parameters=None,
+                 aws_profile=None,
+                 teardown=True,
+                 teardown_fail=True,
+                 background_teardown=False,
+                 working_dir=None,
+                 init_cache=True,
+                 cache_dir=None,
+                 timeout=None):
+        """ Constructor, see TerraformResources """
+        super().__init__(relative_path_to_terraform_root,
+                         parameters=parameters,
+                         aws_profile=aws_profile,
+                         teardown=teardown,
+                         teardown_fail=teardown_fail,
+                         background_teardown=background_teardown,
+                         working_dir=working_dir,
+                         init_cache=init_cache,
+                         cache_dir=cache_dir,
+                         timeout=timeout)
+
+    def __call__(self, user_defined_test_function):
+        """ Decorate an async test function taking tf_outputs """
+
+        async def decorated_test_function():
+            async with self.provisioned() as tf_outputs:
+                with self._timer('test'):
+                    await user_defined_test_function(tf_outputs=tf_outputs)
+
+        return decorated_test_function
+
+    @contextlib.asynccontextmanager
+    async def provisioned(self):
+        """ Apply the root on entry and destroy it on exit, yielding tf_outputs """
+        cassette = active_cassette()
+        if cassette.replaying:
+            yield cassette.terraform(await _in_thread(self._cassette_key))
+            return
+
+        working_copy = await _in_thread(self._working_copy)
+        try:
+            # init goes through the init cache's file locks, and is rarely run for real
+            await _in_thread(self._terraform_init, working_copy)
+            tf_outputs = await self._terraform_apply_async(working_copy)
+        except Exception:
+            print(f'terraform state left in {working_copy}')
+            raise
+        if cassette.recording:
+            cassette.record_terraform(await _in_thread(self._cassette_key), tf_outputs)
+
+        try:
+            yield tf_outputs
+        except Exception as error:
+            print(error)
+            await self._terraform_destroy_async(working_copy, failed=True)
+            raise
+        await self._terraform_destroy_async(working_copy)
+
+    async def _terraform_apply_async(self, working_copy):
+        """ Apply with parameters, see TerraformResources._terraform_apply """
+        result = await self._terraform_async(self._apply_args(), working_copy, json_stream=True)
+        if result.outputs is None:
+            return await self._terraform_outputs_async(working_copy)
+        return result.outputs
+
+    async def _terraform_outputs_async(self, working_copy):
+        """ Get terraform outputs and convert to dict """
+        result = await self._terraform_async(['output', '-json'], working_copy, capture=True)
+        return self._parse_outputs(result.stdout)
+
+    async def _terraform_destroy_async(self, working_copy, failed=False):
+        """ Destroy unless teardown is disabled, see TerraformResources._terraform_destroy """
+        if not self._destroys_now(working_copy, failed):
+            return
+        await self._terraform_async(DESTROY_ARGS, working_copy)
+        await _in_thread(self._remove_working_copy, working_copy)
+
+    async def _terraform_async(self, args, cwd, **run_options):
+        """ Run terraform on an asyncio subprocess, see TerraformResources._terraform """
+        runner = AsyncTerraformRunner(env=self._environment(),
+                                      timeout=self._timeout * 60 if self._timeout else None)
+        with self._timer(args[0]):
+            return await runner.run(args, cwd, **run_options)
+
+
+async def _wait_for_rule(configservice, rule_name, resource_ids, done, result, policy):
+    """
+    Poll the rule until done(found_records) or the policy is used up, sleeping with asyncio.sleep in
+    between
+
+    :param configservice: boto client for AWS Config
+    :param rule_name: config rule to poll
+    :param resource_ids: resource ids of interest
+    :param done: callable(found_records) returning True once the wait is satisfied
+    :param result: callable(found_records) producing the return value, from the last poll on
+                   timeout
+    :param policy: RetryPolicy scheduling the polls
+    :returns: result(found_records)
+    """
+    async def poll():
+        instrumentation.increment('rule', rule_name, 'polls')
+        return await _in_thread(config.scan_rule_results, configservice, rule_name, resource_ids)
+
+    with instrumentation.timer('rule', rule_name, 'wait'):
+        outcome = await policy.replace(predicate=done).run_async(poll)
+    return result(outcome.value if outcome.value is not None else {})
+
+
+async def config_rule_wait_for_absent_resources(configservice, rule_name, resource_ids,
+                                                wait_period=None, max_attempts=None,
+                                                evaluate=False, retry_policy=None):
+    """ Async config_rule_wait_for_absent_resources, see potemkin.configservice """
+    configservice = config.config_client(configservice)
+    if evaluate:
+        await _in_thread(config.start_evaluations, configservice, rule_name)
+    return await _wait_for_rule(configservice, rule_name, *config.absent_wait(resource_ids),
+                                policy=config.rule_policy(wait_period, max_attempts, retry_policy))
+
+
+async def config_rule_wait_for_compliance_results(configservice, rule_name, expected_results,
+                                                  wait_period=None, max_attempts=None,
+                                                  evaluate=False, retry_policy=None):
+    """ Async config_rule_wait_for_compliance_results, see potemkin.configservice """
+    configservice = config.config_client(configservice)
+    if evaluate:
+        await _in_thread(config.start_evaluations, configservice, rule_name)
+    return await _wait_for_rule(configservice, rule_name,
+                                *config.compliance_wait(rule_name, expected_results),
+                                policy=config.rule_policy(wait_period, max_attempts, retry_policy))
+
+
+async def config_rules_wait_for_compliance_results(configservice, expected_results_by_rule,
+                                                   wait_period=None, max_attempts=None,
+                                                   evaluate=False,
+                                                   max_concurrency=config.MAX_CONCURRENT_RULES,
+                                                   retry_policy=None):
+    """ Async config_rules_wait_for_compliance_results, see potemkin.configservice
+
+    :returns: dictionary of rule_name: True if the rule's results are as expected """
+    configservice = config.config_client(configservice)
+    if evaluate:
+        await _in_thread(config.start_evaluations, configservice, *expected_results_by_rule)
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def verdict(rule_name, expected_results):
+        async with slots:
+            return await config_rule_wait_for_compliance_results(
+                configservice, rule_name, expected_results, wait_period=wait_period,
+                max_attempts=max_attempts, retry_policy=retry_policy)
+
+    verdicts = await asyncio.gather(*(verdict(rule_name, expected_results)
+                                      for rule_name, expected_results
+                                      in expected_results_by_rule.items()))
+    return dict(zip(expected_results_by_rule, verdicts))
+
+
+async def config_rule_wait_for_resource(configservice, resource_id, rule_name):
+    """ Async config_rule_wait_for_resource, see potemkin.configservice """
+    return await _wait_for_rule(config.config_client(configservice), rule_name,
+                                *config.resource_wait(resource_id), policy=config.rule_policy())
+
+
+async def evaluate_config_rule_and_wait_for_resource(configservice, resource_id, rule_name):
+    """ Async evaluate_config_rule_and_wait_for_resource, see potemkin.configservice """
+    configservice = config.config_client(configservice)
+    await _in_thread(config.start_evaluations, configservice, rule_name)
+    return await config_rule_wait_for_resource(configservice, resource_id, rule_name)
@@ -0,0 +1,194 @@
+"""
+Record and replay of decorator outputs and AWS Config responses, so test logic can be iterated on without AWS
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+from .instrumentation import instrumentation
+from .terraformcache import file_lock
+from .utilities import fingerprint
+
+
+OFF = 'off'
+RECORD = 'record'
+REPLAY = 'replay'
+MODES = (OFF, RECORD, REPLAY)
+CASSETTE_VERSION = 2
+SECTIONS = ('stacks', 'terraform', 'calls')
+
+
+class CassetteMissError(Exception):
+    """ Replay was asked for something the cassette never recorded """
+
+    def __init__(self, what):
+        self.what = what
+        self.name = 'cassette_miss'
+
+    def __str__(self):
+        return f'{self.name}: nothing recorded for {self.what}, record the cassette again'
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    return str(value)
+
+
+def _decode(value):
+    if set(value) == {'__datetime__'}:
+        return datetime.fromisoformat(value['__datetime__'])
+    return value
+
+
+class Cassette:
+    """ A json file of stack outputs, terraform outputs and API responses, kept per test.
+
+    Entries are filed under the test that was running (its pytest node id, see instrumentation.current_test),
+    so tests that create the same template or wait on the same rule for different states each replay their
+    own.  Within a test, stacks and terraform roots are keyed by a fingerprint of their template or root
+    content and parameters.  API calls are keyed by service, operation and parameters, and only the last
+    response to each is kept: that is the state the test's waiter settled on, so replaying it satisfies the
+    waiter on its first poll. """
+
+    def __init__(self, path=None, mode=OFF):
+        """ Constructor
+
+        :param path: cassette file
+        :param mode: 'record', 'replay' or 'off' (default 'off') """
+        if mode not in MODES:
+            raise ValueError(f'cassette mode must be one of {", ".join(MODES)}')
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._data = {'version': CASSETTE_VERSION, 'stacks': {}, 'terraform': {}, 'calls': {}}
+        if mode == REPLAY:
+            with open(path, 'r') as cassette_file:
+                self._data = json.load(cassette_file, object_hook=_decode)
+            if self._data.get('version') != CASSETTE_VERSION:
+                raise ValueError(f'{path} was recorded in an older cassette format, record it again')
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def record_stack(self, key, stack_name, outputs):
+        self._record('stacks', key, {'stack_name': stack_name, 'outputs': outputs})
+
+    def stack(self, key):
+        """ (stack_name, outputs) the running test recorded for key """
+        recorded = self._recorded('stacks', key, 'stack')
+        return recorded['stack_name'], recorded['outputs']
+
+    def record_terraform(self, key, outputs):
+        self._record('terraform', key, outputs)
+
+    def terraform(self, key):
+        """ tf_outputs the running test recorded for key """
+        return self._recorded('terraform', key, 'terraform root')
+
+    def record_call(self, key, response):
+        self._record('calls', key, response)
+
+    def call(self, key):
+        """ Last response the running test recorded for an API call key """
+        return self._recorded('calls', key, 'API call')
+
+    def _record(self, section, key, value):
+        with self._lock:
+            self._data[section].setdefault(_test_id(), {})[key] = value
+
+    def _recorded(self, section, key, what):
+        test_id = _test_id()
+        with self._lock:
+            recorded = self._data[section].get(test_id, {}).get(key)
+        if recorded is None:
+            raise CassetteMissError(f'{what} {key} in test {test_id}' if test_id else f'{what} {key}')
+        return recorded
+
+    def save(self):
+        """ Write the cassette, compactly.  Entries of tests that were not recorded again are kept, so
+        pytest-xdist workers and runs recording a subset of the tests add to the cassette instead of replacing it """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, file_lock(f'{self.path}.lock'):
+            data = {'version': CASSETTE_VERSION}
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as cassette_file:
+                    data = json.load(cassette_file, object_hook=_decode)
+                if data.get('version') != CASSETTE_VERSION:
+                    data = {'version': CASSETTE_VERSION}
+            for section in SECTIONS:
+                data[section] = dict(data.get(section, {}), **self._data[section])
+            with open(self.path, 'w') as cassette_file:
+                json.dump(data, cassette_file, default=_encode, sort_keys=True, separators=(',', ':'))
+
+
+def _test_id():
+    """ The test entries are filed under, '' outside of pytest """
+    return instrumentation.current_test or ''
+
+
+def call_key(service, operation, params):
+    """ Key of an API call in a cassette """
+    return fingerprint(service, operation, params)
+
+
+_active = Cassette()
+
+
+def active_cassette():
+    """ The cassette in use, an 'off' cassette unless use_cassette was called """
+    return _active
+
+
+def use_cassette(path, mode=REPLAY):
+    """ Record to or replay from path from now on
+
+    :param path: cassette file
+    :param mode: 'record', 'replay' or 'off' (default 'replay')
+    :returns: the cassette """
+    global _active
+    _active = Cassette(path, mode)
+    return _active
+
+
+def install(client):
+    """ Record a boto3 client's responses to, or replay them from, whichever cassette is active at call time.
+    Error responses are recorded too and raise the same ClientError on replay.  Installing twice is harmless
+
+    :param client: boto3 client
+    :returns: client """
+    if getattr(client, '_potemkin_cassette', False):
+        return client
+    from botocore.awsrequest import AWSResponse
+
+    service = client.meta.service_model.service_name
+
+    def before_parameter_build(params, model, context, **kwargs):
+        if active_cassette().mode != OFF:
+            context['potemkin_cassette_key'] = call_key(service, model.name, params)
+
+    def before_call(context, **kwargs):
+        cassette = active_cassette()
+        if not cassette.replaying:
+            return None
+        response = cassette.call(context['potemkin_cassette_key'])
+        return AWSResponse(None, 400 if 'Error' in response else 200, {}, None), response
+
+    def after_call(parsed, context, **kwargs):
+        cassette = active_cassette()
+        if cassette.recording:
+            cassette.record_call(context['potemkin_cassette_key'],
+                                 {key: value for key, value in parsed.items() if key != 'ResponseMetadata'})
+
+    client.meta.events.register('before-parameter-build', before_parameter_build)
+    client.meta.events.register_first('before-call', before_call)
+    client.meta.events.register('after-call', after_call)
+    client._potemkin_cassette = True
+    return client
@@ -0,0 +1,103 @@
+"""
+potemkin command line: housekeeping for resources potemkin leaves behind on purpose
+"""
+import argparse
+import sys
+
+from . import stackcache
+from .clients import client
+from .reaper import StackReaper
+from .utilities import package_version
+
+REAP_MIN_AGE = 1
+
+
+def _cloudformation_client(profile, region):
+    """ The boto client to interface with cloudformation service """
+    return client('cloudformation', profile=profile, region=region)
+
+
+def _purge_cache(arguments):
+    cloudformation = _cloudformation_client(arguments.profile, arguments.region)
+    purged = stackcache.purge(cloudformation,
+                              stem=arguments.stem,
+                              older_than=arguments.older_than,
+                              dry_run=arguments.dry_run)
+    verb = 'Would delete' if arguments.dry_run else 'Deleting'
+    for stack_name in purged:
+        print(f'{verb} cached stack {stack_name}')
+    print(f'{len(purged)} cached stack(s)')
+    return 0
+
+
+def _tag(value):
+    key, separator, tag_value = value.partition('=')
+    if not separator:
+        raise argparse.ArgumentTypeError(f'expected KEY=VALUE, got {value}')
+    return key, tag_value
+
+
+def _reap(arguments):
+    if not (arguments.stem or arguments.tag):
+        print('reap needs at least one --stem or --tag')
+        return 2
+    reaper = StackReaper(_cloudformation_client(arguments.profile, arguments.region),
+                         max_workers=arguments.workers,
+                         timeout=arguments.timeout)
+    stacks = reaper.find(stems=arguments.stem, tags=dict(arguments.tag) if arguments.tag else None,
+                         older_than=None if arguments.all else arguments.older_than)
+    verb = 'Would delete' if arguments.dry_run else 'Deleting'
+    for stack in stacks:
+        print(f'{verb} {stack["StackName"]} ({stack["StackStatus"]})')
+    report = reaper.reap(stacks, dry_run=arguments.dry_run)
+    print(report)
+    return 1 if report.failures else 0
+
+
+def _add_aws_arguments(parser):
+    parser.add_argument('--profile', help='aws profile (default current environment)')
+    parser.add_argument('--region', help='aws region (default current environment)')
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='potemkin', description='potemkin-decorator housekeeping')
+    parser.add_argument('--version', action='version', version=f'%(prog)s {package_version()}')
+    subcommands = parser.add_subparsers(dest='command')
+    subcommands.required = True
+
+    purge_cache = subcommands.add_parser('purge-cache', help='delete stacks kept by CloudFormationStack(cache=True)')
+    _add_aws_arguments(purge_cache)
+    purge_cache.add_argument('--stem', help='only stacks created with this stack_name_stem')
+    purge_cache.add_argument('--older-than', type=float, metavar='HOURS',
+                             help='only stacks created or updated more than HOURS ago')
+    purge_cache.add_argument('--dry-run', action='store_true', help='list the stacks without deleting them')
+    purge_cache.set_defaults(handler=_purge_cache)
+
+    reap = subcommands.add_parser('reap', help='delete orphaned stacks by name stem, tags and age')
+    _add_aws_arguments(reap)
+    reap.add_argument('--stem', action='append', help='stack_name_stem the stacks were created with (repeatable)')
+    reap.add_argument('--tag', action='append', type=_tag, metavar='KEY=VALUE',
+                      help='tag the stacks must carry (repeatable)')
+    age = reap.add_mutually_exclusive_group()
+    age.add_argument('--older-than', type=float, metavar='HOURS', default=REAP_MIN_AGE,
+                     help=f'only stacks created or updated more than HOURS ago, so stacks of sessions still '
+                          f'running are left alone (default {REAP_MIN_AGE})')
+    age.add_argument('--all', action='store_true', help='any age, including stacks of sessions still running')
+    reap.add_argument('--workers', type=int, default=10, help='concurrent deletions (default 10)')
+    reap.add_argument('--timeout', type=int, default=30, help='minutes to wait for each stack (default 30)')
+    reap.add_argument('--dry-run', action='store_true', help='list the stacks without deleting them')
+    reap.set_defaults(handler=_reap)
+    return parser
+
+
+def main(argv=None):
+    """ Entry point of the potemkin console script
+
+    :param argv: command line arguments (default sys.argv[1:])
+    :returns: exit status """
+    arguments = _parser().parse_args(argv)
+    return arguments.handler(arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Process wide pool of boto3 clients shared by decorators, helpers and tests
+"""
+import threading
+
+from . import cassette
+from .ratelimit import rate_limiter
+
+
+MAX_POOL_CONNECTIONS = 50
+MAX_ATTEMPTS = 10
+REPLAY_REGION = 'us-east-1'
+
+
+class ClientPool:
+    """ One boto3 client per (profile, region, service), shared by every thread.
+
+    boto3 clients are thread safe but sessions are not, so each thread gets its own sessions and
+    clients are created from the creating thread's session.  Clients are built once with a
+    connection pool big enough for tests polling concurrently, instead of the default of 10
+    connections per client, standard retries, the process wide rate limiter and cassette recording
+    and replay installed.  boto3 is only imported when the first client or session is needed. """
+
+    def __init__(self, max_pool_connections=MAX_POOL_CONNECTIONS):
+        """ Constructor
+
+        :param max_pool_connections: connections each client keeps open (default 50) """
+        self._max_pool_connections = max_pool_connections
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._local = threading.local()
+
+    def session(self, profile=None, region=None):
+        """ The calling thread's boto3 session for profile and region
+
+        :param profile: aws profile (default current environment)
+        :param region: aws region (default current environment) """
+        import boto3
+
+        sessions = self._local.__dict__.setdefault('sessions', {})
+        if (profile, region) not in sessions:
+            sessions[(profile, region)] = boto3.session.Session(profile_name=profile, region_name=region)
+        return sessions[(profile, region)]
+
+    def client(self, service, profile=None, region=None):
+        """ The shared client for service, created on first use
+
+        :param service: boto3 service name, e.g. 'cloudformation'
+        :param profile: aws profile (default current environment)
+        :param region: aws region (default current environment) """
+        from botocore.config import Config
+
+        key = (profile, region, service)
+        with self._lock:
+            if key not in self._clients:
+                session = self.session(profile, region)
+                # replayed calls never reach AWS, but botocore still wants a region to build the client
+                replay_region = REPLAY_REGION if cassette.active_cassette().replaying else None
+                self._clients[key] = cassette.install(rate_limiter.install(session.client(
+                    service,
+                    region_name=session.region_name or replay_region,
+                    config=Config(max_pool_connections=self._max_pool_connections,
+                                  retries={'mode': 'standard', 'max_attempts': MAX_ATTEMPTS})
+                )))
+            return self._clients[key]
+
+    def clear(self):
+        """ Forget every client and the calling thread's sessions """
+        with self._lock:
+            self._clients = {}
+        self._local.__dict__.pop('sessions', None)
+
+
+client_pool = ClientPool()
+
+
+def client(service, profile=None, region=None):
+    """ The pooled boto3 client for service, see ClientPool.client """
+    return client_pool.client(service, profile=profile, region=region)
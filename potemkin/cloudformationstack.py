@@ -1,10 +1,37 @@
 """
 CloudFromationStack decorator
 """
+import itertools
 import time
 import os
-import boto3
-from botocore.exceptions import WaiterError
+
+from .cassette import active_cassette
+from .clients import client
+from .instrumentation import instrumentation
+from .stackcache import DEFAULT_MAX_AGE, cache_fingerprint, cache_tags, find_cached_stack
+from .stackevents import StackEventStream, is_stack_event
+from .stackpool import stack_pools
+from .stackregistry import reused_stacks, shared_stacks
+from .teardown import background_teardowns
+from .utilities import fingerprint, random_name
+from .waiters import StackWaiter, template_resource_types
+
+
+_stack_sequence = itertools.count()
+
+
+class StackCreationError(Exception):
+    """ A resource failed to create """
+
+    def __init__(self, stack_name, logical_resource_id, resource_type, reason):
+        self.stack_name = stack_name
+        self.logical_resource_id = logical_resource_id
+        self.resource_type = resource_type
+        self.reason = reason
+        self.name = 'StackCreationError'
+
+    def __str__(self):
+        return f'{self.name}: {self.stack_name} {self.logical_resource_id} ({self.resource_type}): {self.reason}'
 
 
 class CloudFormationStack:
@@ -17,7 +44,18 @@ class CloudFormationStack:
                  aws_profile=None,
                  teardown=True,
                  teardown_fail=True,
-                 timeout=5):
+                 timeout=5,
+                 share=False,
+                 pool_size=None,
+                 pool_max_in_flight=None,
+                 background_teardown=False,
+                 wait_strategy=None,
+                 fail_fast=True,
+                 delete_failed_stack=False,
+                 reuse_stack=False,
+                 unsafe_replacements=None,
+                 cache=False,
+                 cache_max_age=DEFAULT_MAX_AGE):
         """ Constructor
 
         :param relative_path_to_initial_condition_cfn_template: The relative path/name to the CloudFormation template to create.
@@ -26,7 +64,36 @@ class CloudFormationStack:
         :param aws_profile: The aws profile to use. If None, uses current environment.
         :param teardown: Teardown resources after test completion. (default True)
         :param teardown_fail: Teardown resources after tests complete with one or more failure. If False, overrides teardown. (default True)
-        :param timeout: Cloudformation and Config Waiter timeout in minutes (default 5)"""
+        :param timeout: Cloudformation and Config Waiter timeout in minutes (default 5)
+        :param share: Share one stack between all tests using the same template, parameters and profile.  The stack is
+                      created by the first test that needs it and torn down after the last one finishes. (default False)
+        :param pool_size: Keep this many stacks pre-created in the background and lease one to each test, for tests
+                          that mutate their stack and so cannot share it.  Leased stacks are torn down after the test.
+        :param pool_max_in_flight: Maximum concurrent background stack creations for the pool. (default pool_size)
+        :param background_teardown: Delete stacks in the background instead of waiting for the delete to complete.
+                                    Failures are reported at the end of the session. (default False)
+        :param wait_strategy: How to poll while stacks are created and deleted: potemkin.waiters.AdaptiveBackoff(...)
+                              or potemkin.waiters.FixedDelay(...).  The polling deadline is timeout.
+                              (default AdaptiveBackoff())
+        :param fail_fast: Watch stack events while creating and raise StackCreationError as soon as the first resource
+                          fails instead of waiting for the whole stack to settle. (default True)
+        :param delete_failed_stack: When fail_fast aborts a creation, start deleting the stack in the
+                                    background. (default False)
+        :param reuse_stack: Keep one long lived stack per template and profile and move it to each test's parameters
+                            with a change set instead of creating and deleting a stack per test.  Tests using the stack
+                            run one at a time and the stack is torn down at the end of the session. (default False)
+        :param unsafe_replacements: Logical resource ids or resource types that must not be replaced by a reuse_stack
+                                    change set, or True for any replacement.  A change set that would replace one is
+                                    discarded and a fresh stack is created instead. (default None)
+        :param cache: Keep the stack after the test and reuse it in later sessions.  Cached stacks are tagged with a
+                      fingerprint of template content, parameters and potemkin version and are never torn down by
+                      the decorator; purge them with `potemkin purge-cache`. (default False)
+        :param cache_max_age: Hours a cached stack may be reused for.  Older matching stacks are deleted in the
+                              background and replaced.  None for no limit. (default 24)"""
+        if sum(1 for mode in (share, pool_size, reuse_stack) if mode) > 1:
+            raise ValueError('share, pool_size and reuse_stack are mutually exclusive')
+        if cache and (pool_size or reuse_stack):
+            raise ValueError('cache cannot be combined with pool_size or reuse_stack')
         self._relative_path_to_initial_condition_cfn_template = relative_path_to_initial_condition_cfn_template
         self._stack_name = stack_name_stem
         self._aws_profile = aws_profile
@@ -37,45 +104,359 @@ class CloudFormationStack:
         self._teardown = teardown
         self._teardown_fail = teardown_fail
         self._timeout = timeout
+        self._share = share
+        self._pool_size = pool_size
+        self._pool_max_in_flight = pool_max_in_flight
+        self._background_teardown = background_teardown
+        self._waiter = StackWaiter(wait_strategy)
+        self._fail_fast = fail_fast
+        self._delete_failed_stack = delete_failed_stack
+        self._reuse_stack = reuse_stack
+        self._unsafe_replacements = unsafe_replacements
+        self._cache = cache
+        self._cache_max_age = cache_max_age
+        self._template_content = None
 
     def __call__(self, user_defined_test_function):
         """ The heart of the matter to spin up the stack, invoke the pytest function and then teardown """
+        cassette = active_cassette()
+        if cassette.replaying:
+            return self._replayed(user_defined_test_function, cassette)
+        if cassette.recording:
+            user_defined_test_function = self._recorded(user_defined_test_function, cassette)
+
+        self._register_share_user()
+        self._register_lease()
+
         def decorated_test_function():
-            with open(self._resolve_template_path(), 'r') as initial_condition_cfn_template_file:
-                initial_condition_cfn_template_content = initial_condition_cfn_template_file.read()
+            if self._share:
+                self._run_with_shared_stack(user_defined_test_function)
+                return
+            if self._pool_size:
+                self._run_with_pooled_stack(user_defined_test_function)
+                return
+            if self._reuse_stack:
+                self._run_with_reused_stack(user_defined_test_function)
+                return
 
-            qualified_stack_name = self._unique_stack_name(self._stack_name)
+            if self._cache:
+                qualified_stack_name, stack_outputs = self._cached_stack()
+            else:
+                initial_condition_cfn_template_content = self._template_body()
 
-            stack_outputs = self._create_stack(
-                stack_name=qualified_stack_name,
-                parameters=self._parameters,
-                template_body=initial_condition_cfn_template_content
-            )
+                qualified_stack_name = self._unique_stack_name(self._stack_name)
+
+                stack_outputs = self._create_stack(
+                    stack_name=qualified_stack_name,
+                    parameters=self._parameters,
+                    template_body=initial_condition_cfn_template_content
+                )
 
 
             try:
-                user_defined_test_function(stack_outputs, qualified_stack_name)
+                with self._timer('test', qualified_stack_name):
+                    user_defined_test_function(stack_outputs, qualified_stack_name)
             except Exception as error:
                 print(error)
-                if self._teardown and self._teardown_fail:
-                    self._delete_stack(stack_name=qualified_stack_name)
+                self._teardown_stack(qualified_stack_name, failed=True)
                 raise
 
-            if self._teardown:
-                self._delete_stack(
-                    stack_name=qualified_stack_name
-                )
+            self._teardown_stack(qualified_stack_name)
 
+        decorated_test_function.potemkin_group = self._group()
+        # the pytest plugin recounts users and leases from the tests actually selected, see pytest_plugin
+        decorated_test_function.potemkin_register_share = self._register_share_user if self._share else None
+        decorated_test_function.potemkin_register_lease = self._register_lease if self._pool_size else None
         return decorated_test_function
 
+    def _register_share_user(self):
+        """ Count one more test that will use the shared stack """
+        if self._share:
+            shared_stacks.register(self.fingerprint())
+
+    def _register_lease(self):
+        """ Count one more test that will lease a stack from the pool """
+        if self._pool_size:
+            self._stack_pool().register()
+
+    def fingerprint(self):
+        """ Hash of template content, parameters and profile identifying interchangeable stacks """
+        return fingerprint(self._template_body(), self._parameters, self._aws_profile)
+
+    def _cassette_key(self):
+        """ Stacks are recorded per template content and parameters, whatever profile recorded them """
+        return fingerprint(self._template_body(), self._parameters)
+
+    def _recorded(self, user_defined_test_function, cassette):
+        """ Wrap the test to record the outputs of whichever stack it gets """
+        key = self._cassette_key()
+
+        def recorded_test_function(stack_outputs, stack_name):
+            cassette.record_stack(key, stack_name, stack_outputs)
+            user_defined_test_function(stack_outputs, stack_name)
+
+        return recorded_test_function
+
+    def _replayed(self, user_defined_test_function, cassette):
+        """ Invoke the test with recorded outputs, without creating or deleting anything """
+        key = self._cassette_key()
+
+        def replayed_test_function():
+            stack_name, stack_outputs = cassette.stack(key)
+            with self._timer('test', stack_name):
+                user_defined_test_function(stack_outputs, stack_name)
+
+        replayed_test_function.potemkin_group = None
+        return replayed_test_function
+
+    def _reused_stack_key(self):
+        """ Reused stacks move between parameter sets, so only template content and profile identify them """
+        return fingerprint(self._template_body(), self._aws_profile)
+
+    def _group(self):
+        """ Key of the stack this test can get from an earlier test, used to schedule both on the same pytest-xdist
+        worker.  None when every run creates its own stack """
+        if self._reuse_stack:
+            return self._reused_stack_key()
+        if self._cache:
+            return cache_fingerprint(self._template_body(), self._parameters)
+        if self._share or self._pool_size:
+            return self.fingerprint()
+        return None
+
+    def _run_with_shared_stack(self, user_defined_test_function):
+        """ Invoke the test against the session wide stack for this fingerprint, creating it if need be """
+        key = self.fingerprint()
+        stack_name, stack_outputs = shared_stacks.acquire(
+            key,
+            create=self._create_shared_stack,
+            teardown=self._teardown_stack
+        )
+        try:
+            with self._timer('test', stack_name):
+                user_defined_test_function(stack_outputs, stack_name)
+        except Exception as error:
+            print(error)
+            shared_stacks.release(key, failed=True)
+            raise
+        shared_stacks.release(key)
+
+    def _create_shared_stack(self):
+        """ Create the stack handed out to every test sharing this fingerprint """
+        if self._cache:
+            return self._cached_stack()
+        stack_name = self._unique_stack_name(self._stack_name)
+        stack_outputs = self._create_stack(
+            stack_name=stack_name,
+            parameters=self._parameters,
+            template_body=self._template_body()
+        )
+        return stack_name, stack_outputs
+
+    def _cached_stack(self):
+        """ Reuse a cached stack from an earlier session, or create and tag a new one
+
+        :returns: (stack_name, outputs) """
+        stack_fingerprint = cache_fingerprint(self._template_body(), self._parameters)
+        with self._timer('cache_lookup'):
+            stack_dict, evict = find_cached_stack(self._cloudformation(), stack_fingerprint, self._stack_name,
+                                                  max_age=self._cache_max_age)
+        for stack_name in evict:
+            background_teardowns.submit(f'expired cached CloudFormation stack {stack_name}', self._delete_stack,
+                                        stack_name=stack_name)
+        if stack_dict:
+            print(f'Reusing cached stack {stack_dict["StackName"]}')
+            return stack_dict['StackName'], self._stack_outputs(stack_dict['StackName'], stack_dict)
+
+        stack_name = self._unique_stack_name(self._stack_name)
+        stack_outputs = self._create_stack(
+            stack_name=stack_name,
+            parameters=self._parameters,
+            template_body=self._template_body(),
+            tags=cache_tags(stack_fingerprint, self._stack_name)
+        )
+        return stack_name, stack_outputs
+
+    def _stack_pool(self):
+        """ The warm pool of stacks for this fingerprint """
+        return stack_pools.pool(
+            self.fingerprint(),
+            create=self._create_pooled_stack,
+            teardown=self._teardown_stack,
+            size=self._pool_size,
+            max_in_flight=self._pool_max_in_flight
+        )
+
+    def _run_with_pooled_stack(self, user_defined_test_function):
+        """ Invoke the test against a stack leased from the warm pool, then tear that stack down """
+        with self._timer('lease'):
+            stack_name, stack_outputs = self._stack_pool().lease()
+        try:
+            with self._timer('test', stack_name):
+                user_defined_test_function(stack_outputs, stack_name)
+        except Exception as error:
+            print(error)
+            self._teardown_stack(stack_name, failed=True)
+            raise
+        self._teardown_stack(stack_name)
+
+    def _create_pooled_stack(self):
+        """ Create one pool stack """
+        stack_name = self._unique_stack_name(self._stack_name)
+        stack_outputs = self._create_stack(
+            stack_name=stack_name,
+            parameters=self._parameters,
+            template_body=self._template_body()
+        )
+        return stack_name, stack_outputs
+
+    def _run_with_reused_stack(self, user_defined_test_function):
+        """ Move the long lived stack for this template to this test's parameters, then invoke the test """
+        entry = reused_stacks.stack(self._reused_stack_key())
+        with entry.lock:
+            if entry.stack_name and entry.parameters != self._parameters:
+                try:
+                    with self._timer('update', entry.stack_name):
+                        stack_outputs = self._update_stack(entry.stack_name, self._parameters)
+                except Exception:
+                    self._teardown_stack(entry.stack_name, failed=True)
+                    entry.stack_name = None
+                    raise
+                if stack_outputs is None:
+                    self._teardown_stack(entry.stack_name, entry.failed)
+                    entry.stack_name = None
+                else:
+                    entry.parameters, entry.outputs = dict(self._parameters), stack_outputs
+            if entry.stack_name is None:
+                entry.stack_name, entry.outputs = self._create_shared_stack()
+                entry.parameters = dict(self._parameters)
+                entry.teardown = self._teardown_stack
+
+            try:
+                with self._timer('test', entry.stack_name):
+                    user_defined_test_function(entry.outputs, entry.stack_name)
+            except Exception as error:
+                print(error)
+                entry.failed = True
+                raise
+
+    def _update_stack(self, stack_name, parameters):
+        """ Update the stack to parameters through a change set, unless that replaces an unsafe resource
+
+        :param stack_name: stack to update
+        :param parameters: dict of parameters for stack
+        :returns: dictionary of outputs, or None if the change set was discarded because of unsafe replacements """
+        cloudformation = self._cloudformation()
+        change_set_name = random_name('potemkin-')
+        cloudformation.create_change_set(
+            StackName=stack_name,
+            ChangeSetName=change_set_name,
+            ChangeSetType='UPDATE',
+            UsePreviousTemplate=True,
+            Parameters=self._convert_parameters(parameters),
+            Capabilities=[
+                'CAPABILITY_NAMED_IAM',
+                'CAPABILITY_AUTO_EXPAND'
+            ]
+        )
+
+        def change_set_created():
+            change_set = cloudformation.describe_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+            return change_set['Status'] not in ('CREATE_PENDING', 'CREATE_IN_PROGRESS'), change_set
+
+        _, change_set = self._waiter.wait(change_set_created, deadline=self._timeout * 60)
+        if change_set['Status'] == 'FAILED':
+            reason = change_set.get('StatusReason', '')
+            cloudformation.delete_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+            if "didn't contain changes" in reason or 'No updates' in reason:
+                return self._stack_outputs(stack_name)
+            print(f'Change set error: {reason}')
+            raise Exception("StackUpdateError")
+        if change_set['Status'] != 'CREATE_COMPLETE':
+            raise Exception("StackTimeoutError")
+
+        unsafe = self._unsafe_changes(cloudformation, stack_name, change_set_name, change_set)
+        if unsafe:
+            print(f'Change set would replace {", ".join(unsafe)}, creating a new stack instead')
+            cloudformation.delete_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+            return None
+
+        cloudformation.execute_change_set(StackName=stack_name, ChangeSetName=change_set_name)
+
+        def stack_updated():
+            stack_dict = self._describe_stack(stack_name)
+            return not stack_dict['StackStatus'].endswith('_IN_PROGRESS'), stack_dict
+
+        _, stack_dict = self._waiter.wait(stack_updated, deadline=self._timeout * 60)
+        return self._stack_outputs(stack_name, stack_dict)
+
+    def _unsafe_changes(self, cloudformation, stack_name, change_set_name, change_set):
+        """ Logical ids of resources the change set would replace that are marked unsafe to replace """
+        if not self._unsafe_replacements:
+            return []
+        unsafe = []
+        while True:
+            for change in change_set.get('Changes', []):
+                resource_change = change.get('ResourceChange', {})
+                if resource_change.get('Replacement') not in ('True', 'Conditional'):
+                    continue
+                if self._unsafe_replacements is True or \
+                        resource_change.get('LogicalResourceId') in self._unsafe_replacements or \
+                        resource_change.get('ResourceType') in self._unsafe_replacements:
+                    unsafe.append(resource_change['LogicalResourceId'])
+            if not change_set.get('NextToken'):
+                return unsafe
+            change_set = cloudformation.describe_change_set(StackName=stack_name, ChangeSetName=change_set_name,
+                                                            NextToken=change_set['NextToken'])
+
+    def _teardown_stack(self, stack_name, failed=False):
+        """ Delete the stack unless teardown is disabled, or the test failed and teardown_fail is disabled
+
+        :param stack_name: name of stack to teardown
+        :param failed: True if the test using the stack failed """
+        if self._deletes_now(stack_name, failed):
+            self._delete_stack(stack_name=stack_name)
+
+    def _deletes_now(self, stack_name, failed):
+        """ True if the caller is to delete the stack now, False if it is kept or its delete was handed to the
+        background teardowns
+
+        :param stack_name: name of stack to teardown
+        :param failed: True if the test using the stack failed """
+        if self._keeps_stack(failed):
+            return False
+        if self._background_teardown:
+            background_teardowns.submit(f'CloudFormation stack {stack_name}', self._delete_stack,
+                                        stack_name=stack_name)
+            return False
+        return True
+
+    def _keeps_stack(self, failed):
+        """ True if the stack outlives the test: it is cached, teardown is disabled, or the test
+        failed and teardown_fail is disabled """
+        return self._cache or not self._teardown or (failed and not self._teardown_fail)
+
+    def _timer(self, phase, stack_name=None):
+        """ Time a phase of this template's lifecycle, see potemkin.instrumentation """
+        return instrumentation.timer('stack', self._relative_path_to_initial_condition_cfn_template, phase,
+                                     stack=stack_name)
+
+    def _count_poll(self, stack_name):
+        instrumentation.increment('stack', self._relative_path_to_initial_condition_cfn_template, 'polls',
+                                  stack=stack_name)
+
+    def _template_body(self):
+        """ Content of the initial condition template, read once """
+        if self._template_content is None:
+            with self._timer('template_read'):
+                with open(self._resolve_template_path(), 'r') as initial_condition_cfn_template_file:
+                    self._template_content = initial_condition_cfn_template_file.read()
+        return self._template_content
+
     def _cloudformation(self):
         """ The boto client to interface with cloudformation service """
         if not self._cloudformation_client:
-            if self._aws_profile:
-                session = boto3.session.Session(profile_name=self._aws_profile)
-                self._cloudformation_client = session.client('cloudformation')
-            else:
-                self._cloudformation_client = boto3.client('cloudformation')
+            self._cloudformation_client = client('cloudformation', profile=self._aws_profile)
 
         return self._cloudformation_client
 
@@ -94,28 +475,48 @@ class CloudFormationStack:
         return response
             
 
-    def _stack_outputs(self, stack_name):
+    def _describe_stack(self, stack_name):
+        """ DescribeStacks for a single stack
+
+        :param stack_name: stack name
+        :returns: the stack's description, None if the stack does not exist """
+        from botocore.exceptions import ClientError
+
+        cloudformation = self._cloudformation()
+        try:
+            return cloudformation.describe_stacks(StackName=stack_name)['Stacks'][0]
+        except ClientError as error:
+            if 'does not exist' in error.response['Error'].get('Message', ''):
+                return None
+            raise
+
+    def _stack_outputs(self, stack_name, stack_dict=None):
         """ Transform results of DescribeStacks outputs into a dictionary
 
         :param stack_name: stack name
+        :param stack_dict: the stack's description if already at hand (optional)
         """
-        cloudformation = self._cloudformation()
-        describe_stacks_response = cloudformation.describe_stacks(StackName=stack_name)
-        stack_dict = describe_stacks_response['Stacks'][0]
-        
+        if stack_dict is None:
+            stack_dict = self._describe_stack(stack_name)
+
         if stack_dict["StackStatus"] == "CREATE_IN_PROGRESS":
             events = self._filter_stack_resources(stack_name, 'CREATE_IN_PROGRESS')
             print('Stack timed out before creation was completed. Increase the timeout value on @potemkin.CloudFormationStack')
             print(f'Resources that are still in progress:\n{events}')
             raise Exception("StackTimeoutError")
-        elif stack_dict["StackStatus"] != "CREATE_COMPLETE":
+        elif stack_dict["StackStatus"].startswith("UPDATE_") and stack_dict["StackStatus"] != "UPDATE_COMPLETE":
+            events = self._filter_stack_resources(stack_name, 'UPDATE_FAILED')
+            print(f'Stack update error: {stack_dict.get("StackStatusReason", "no reason given")}')
+            print(f'Resource update error details:\n{events}')
+            raise Exception("StackUpdateError")
+        elif stack_dict["StackStatus"] not in ("CREATE_COMPLETE", "UPDATE_COMPLETE"):
             events = self._filter_stack_resources(stack_name, 'CREATE_FAILED')
             print(f'Stack creation error: {stack_dict.get("StackStatusReason", "no reason given")}')
             print(f'Resource creation error details:\n{events}')
             raise Exception("StackCreationError")
         return {
             output['OutputKey']: output['OutputValue']
-            for output in stack_dict['Outputs']
+            for output in stack_dict.get('Outputs', [])
         }
 
 
@@ -130,36 +531,85 @@ class CloudFormationStack:
             for k, v in parameters.items()
         ]
 
-    def _waiter_config(self):
-        """ stock waiter config to use for all calls to CloudFormation service """
-        return {
-            'Delay': 20,
-            'MaxAttempts': self._timeout * 3
-        }
+    def _wait_for_stack(self, stack_name, in_progress_status, resource_types=()):
+        """ Poll DescribeStacks until the stack leaves in_progress_status or the timeout is spent
+
+        :param stack_name: stack name
+        :param in_progress_status: status to wait out, e.g. CREATE_IN_PROGRESS
+        :param resource_types: resource types in the stack, for wait strategy hints
+        :returns: the last description of the stack, None if it no longer exists """
+        _, stack_dict = self._waiter.wait(self._status_poll(stack_name, in_progress_status),
+                                          deadline=self._timeout * 60,
+                                          resource_types=resource_types)
+        return stack_dict
+
+    def _status_poll(self, stack_name, in_progress_status):
+        """ Waiter poll: done once the stack leaves in_progress_status, with its description """
+        def poll():
+            self._count_poll(stack_name)
+            stack_dict = self._describe_stack(stack_name)
+            return stack_dict is None or stack_dict['StackStatus'] != in_progress_status, stack_dict
+
+        return poll
 
     def _delete_stack(self, stack_name):
         """ Call DeleteStack and wait for completion
 
         :param stack_name: name of stack to delete """
         cloudformation = self._cloudformation()
-        _ = cloudformation.delete_stack(
-            StackName=stack_name
-        )
+        with self._timer('delete', stack_name):
+            _ = cloudformation.delete_stack(
+                StackName=stack_name
+            )
 
-        waiter = cloudformation.get_waiter('stack_delete_complete')
-        waiter.wait(
-            StackName=stack_name,
-            WaiterConfig=self._waiter_config()
-        )
+            stack_dict = self._wait_for_stack(stack_name, 'DELETE_IN_PROGRESS')
+        self._check_deleted(stack_name, stack_dict)
 
-    def _create_stack(self, stack_name, parameters, template_body):
+    def _check_deleted(self, stack_name, stack_dict):
+        """ Raise unless the last description of a deleting stack shows it deleted
+
+        :param stack_name: stack name
+        :param stack_dict: the stack's description, None if it no longer exists """
+        if stack_dict is None or stack_dict['StackStatus'] == 'DELETE_COMPLETE':
+            return
+        if stack_dict['StackStatus'] == 'DELETE_IN_PROGRESS':
+            print(f'Stack {stack_name} timed out before deletion was completed.')
+            raise Exception("StackTimeoutError")
+        events = self._filter_stack_resources(stack_name, 'DELETE_FAILED')
+        print(f'Stack deletion error: {stack_dict.get("StackStatusReason", "no reason given")}')
+        print(f'Resource deletion error details:\n{events}')
+        raise Exception("StackDeletionError")
+
+    def _create_stack(self, stack_name, parameters, template_body, tags=None):
         """ Call CreateStack and wait for completion
 
         :param stack_name: name of stack to create from template
         :param parameters: dict of parameters for stack
         :param template_body: yml or json of cfn template
+        :param tags: list of stack tags (optional)
         :returns: dictionary of outputs """
         cloudformation = self._cloudformation()
+        with self._timer('create_stack', stack_name):
+            self._start_create(cloudformation, stack_name, parameters, template_body, tags)
+        resource_types = template_resource_types(template_body)
+        if not self._fail_fast:
+            with self._timer('wait', stack_name):
+                stack_dict = self._wait_for_stack(stack_name, 'CREATE_IN_PROGRESS', resource_types)
+            with self._timer('outputs', stack_name):
+                return self._stack_outputs(stack_name, stack_dict)
+
+        with self._timer('wait', stack_name):
+            _, failed_event = self._waiter.wait(self._creation_poll(cloudformation, stack_name),
+                                                deadline=self._timeout * 60,
+                                                resource_types=resource_types)
+        if failed_event:
+            self._abort_create(stack_name, failed_event)
+
+        with self._timer('outputs', stack_name):
+            return self._stack_outputs(stack_name)
+
+    def _start_create(self, cloudformation, stack_name, parameters, template_body, tags=None):
+        """ Call CreateStack """
         _ = cloudformation.create_stack(
             StackName=stack_name,
             TemplateBody=template_body,
@@ -169,19 +619,44 @@ class CloudFormationStack:
                 'CAPABILITY_NAMED_IAM',
                 'CAPABILITY_AUTO_EXPAND'
             ],
-            OnFailure='DO_NOTHING'
+            OnFailure='DO_NOTHING',
+            Tags=tags if tags else []
         )
-        waiter = cloudformation.get_waiter('stack_create_complete')
-        try:
-            waiter.wait(
-                StackName=stack_name,
-                WaiterConfig=self._waiter_config()
-            )
-        except WaiterError:
-            pass
 
-        return self._stack_outputs(stack_name)
-        
+    def _creation_poll(self, cloudformation, stack_name):
+        """ Poll for a waiter watching stack events: done once the stack settles, with the first
+        CREATE_FAILED resource event if there is one """
+        events = StackEventStream(cloudformation, stack_name)
+
+        def poll():
+            self._count_poll(stack_name)
+            for event in events.new_events():
+                if is_stack_event(event):
+                    if event['ResourceStatus'] != 'CREATE_IN_PROGRESS':
+                        return True, None
+                elif event['ResourceStatus'] == 'CREATE_FAILED':
+                    return True, event
+            return False, None
+
+        return poll
+
+    def _abort_create(self, stack_name, failed_event):
+        """ Report the first resource that failed to create and give up on the stack
+
+        :param stack_name: stack name
+        :param failed_event: the CREATE_FAILED stack event """
+        error = StackCreationError(
+            stack_name,
+            failed_event['LogicalResourceId'],
+            failed_event['ResourceType'],
+            failed_event.get('ResourceStatusReason', 'no reason given')
+        )
+        print(f'Resource creation error details:\n  {error.logical_resource_id}: {error.reason}')
+        if self._delete_failed_stack:
+            background_teardowns.submit(f'failed CloudFormation stack {stack_name}', self._delete_stack,
+                                        stack_name=stack_name)
+        raise error
+
     def _resolve_template_path(self):
         """ Current wd + relative path """
         return os.path.join(
@@ -190,10 +665,12 @@ class CloudFormationStack:
         )
 
     def _unique_stack_name(self, stack_name_stem):
-        """ Generate unique stack name based upon stem and epoch time
+        """ Generate unique stack name based upon stem and epoch time, made unique across threads, pytest-xdist
+        workers and machines by the worker id, a process wide sequence number and random digits
 
         :param stack_name_stem: first part of stack name to generate """
-        return f"{stack_name_stem}{self._now()}"
+        worker = os.environ.get('PYTEST_XDIST_WORKER', 'main')
+        return random_name(f'{stack_name_stem}{self._now()}-{worker}-{next(_stack_sequence)}-', digits=4)
 
     def _now(self):
         """ Integer format of current time """
@@ -1,102 +1,313 @@
 """ Utilities for writing integration tests around AWS Config service """
-import time
+import functools
+import math
+import threading
 import json
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from . import cassette
+from .clients import client
+from .ratelimit import rate_limiter
+from .retry import RetryPolicy
+from .rulepoller import MAX_ATTEMPTS, WAIT_PERIOD, rule_pollers
+from .waiters import AdaptiveBackoff, SystemClock
+
+
+COMPLIANCE_TYPES = [
+    'NON_COMPLIANT',
+    'COMPLIANT',
+    'NOT_APPLICABLE'
+]
+RULE_RESULTS_PAGE_SIZE = 100
+MAX_RULES_PER_EVALUATION = 25
+MAX_CONCURRENT_RULES = 10
+EVALUATION_RETRIES = 4
+
+_clock = SystemClock()
+
+# how every rule wait polls, unless a call passes its own retry_policy; reassign to tune them all
+rule_wait_policy = RetryPolicy(wait_period=WAIT_PERIOD, attempts=MAX_ATTEMPTS)
+# how starting evaluations is retried while AWS Config refuses with LimitExceededException
+evaluation_retry_policy = RetryPolicy(attempts=EVALUATION_RETRIES + 1,
+                                      backoff=AdaptiveBackoff(initial_delay=2, multiplier=2,
+                                                              max_delay=30),
+                                      predicate=lambda response: True)
+
+
+def config_client(configservice):
+    """ The given client, rate limited and recorded to or replayed from the active cassette, or the pooled
+    AWS Config client for the current environment """
+    if configservice is None:
+        return client('config')
+    if hasattr(configservice, 'meta'):
+        cassette.install(rate_limiter.install(configservice))
+    return configservice
+
+
+def _iter_rule_results(configservice, rule_name):
+    """ Stream evaluation results for the given config rule, one page at a time
 
+    :param configservice: boto client for AWS Config
+    :param rule_name: name of rule to get compliance details for
+    :returns: generator of EvaluationResults """
+    paginator = configservice.get_paginator('get_compliance_details_by_config_rule')
+    page_iterator = paginator.paginate(
+        ConfigRuleName=rule_name,
+        ComplianceTypes=COMPLIANCE_TYPES
+    )
+    for page in page_iterator:
+        yield from page['EvaluationResults']
 
-MAX_ATTEMPTS = 45
-WAIT_PERIOD = 20
 
 def all_rule_results(configservice, rule_name):
     """ Return details for the given config rule, and deal with slurping all the results
 
-    :param configservice: boto client for AWS Config
+    :param configservice: boto client for AWS Config, None for the pooled client
     :param rule_name: name of rule to get compliance details for
     :returns: slurped version of get_compliance_details_by_config_rule response """
-    paginator = configservice.get_paginator('get_compliance_details_by_config_rule')
-    page_iterator = paginator.paginate(
-        ConfigRuleName=rule_name,
-        ComplianceTypes=[
-            'NON_COMPLIANT',
-            'COMPLIANT',
-            'NOT_APPLICABLE'
-        ]
-    )
-    return [
-        evaluation_result
-        for page in page_iterator
-        for evaluation_result in page['EvaluationResults']
-    ]
+    return list(_iter_rule_results(config_client(configservice), rule_name))
+
+
+def _resource_id(config_record):
+    """ Resource ID of a config compliance record """
+    return config_record['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId']
+
+
+class _RuleProfile:
+    """ What earlier polls taught us about a rule: how many results it has and which resource types it scopes """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.result_volume = None
+        self.resource_types = None
+        self.described = False
+
+    def prefers_per_resource(self, id_count):
+        """ True if querying each resource is cheaper than paginating the whole rule """
+        if not self.resource_types or self.result_volume is None:
+            return False
+        rule_pages = math.ceil(self.result_volume / RULE_RESULTS_PAGE_SIZE)
+        return id_count * len(self.resource_types) < rule_pages
+
+
+_rule_profiles = {}
+_rule_profiles_lock = threading.Lock()
+
 
+def _rule_profile(configservice, rule_name):
+    """ Profile for rule_name in the client's account and region, looking up the rule's scope the first time.
+    Only callers asking for the same rule wait for that lookup """
+    with _rule_profiles_lock:
+        profile = _rule_profiles.setdefault(_rule_profile_key(configservice, rule_name), _RuleProfile())
+    with profile.lock:
+        if not profile.described:
+            profile.resource_types = _scoped_resource_types(configservice, rule_name)
+            profile.described = True
+    return profile
 
-def _remove_missing_resource_ids(config_records, resource_ids):
+
+def _rule_profile_key(configservice, rule_name):
+    """ Rules are profiled per region and credentials, as the same rule name in another account is another
+    rule """
+    region = getattr(getattr(configservice, 'meta', None), 'region_name', None)
+    # botocore has no public accessor for a client's credentials
+    credentials = getattr(getattr(configservice, '_request_signer', None), '_credentials', None)
+    return region, getattr(credentials, 'access_key', None), rule_name
+
+
+def _scoped_resource_types(configservice, rule_name):
+    """ Resource types the rule is scoped to, None if it is not scoped or the rule can't be described """
+    try:
+        rules = configservice.describe_config_rules(ConfigRuleNames=[rule_name])['ConfigRules']
+    except Exception as error:
+        print(f'Unable to describe config rule {rule_name}, querying by rule: {error}')
+        return None
+    if not rules:
+        return None
+    return rules[0].get('Scope', {}).get('ComplianceResourceTypes') or None
+
+
+def _iter_resource_results(configservice, rule_name, resource_type, resource_id):
+    """ Stream evaluation results of rule_name for a single resource
+
+    :param configservice: boto client for AWS Config
+    :param rule_name: name of rule to keep results for
+    :param resource_type: AWS resource type of resource_id
+    :param resource_id: resource id
+    :returns: generator of EvaluationResults """
+    kwargs = {
+        'ResourceType': resource_type,
+        'ResourceId': resource_id,
+        'ComplianceTypes': COMPLIANCE_TYPES
+    }
+    while True:
+        response = configservice.get_compliance_details_by_resource(**kwargs)
+        for evaluation_result in response['EvaluationResults']:
+            qualifier = evaluation_result['EvaluationResultIdentifier']['EvaluationResultQualifier']
+            if qualifier['ConfigRuleName'] == rule_name:
+                yield evaluation_result
+        if not response.get('NextToken'):
+            return
+        kwargs['NextToken'] = response['NextToken']
+
+
+def _scan_resources(configservice, rule_name, wanted, resource_types):
+    """ Look up each wanted resource directly instead of paginating the whole rule """
+    found_records = {}
+    for resource_id in wanted:
+        for resource_type in resource_types:
+            config_record = next(_iter_resource_results(configservice, rule_name, resource_type, resource_id), None)
+            if config_record:
+                found_records[resource_id] = config_record
+                break
+    return found_records
+
+
+def scan_rule_results(configservice, rule_name, resource_ids):
     """
-    Remove resource_ids found in config_results and return any remaining resource_ids
-    
-    :param config_records: config compliance records
-    :param resource_ids: list of resource ids
-    :returns: list of resource IDs found in compliance records
+    Find the compliance records for resource_ids.
+
+    Depending on how many ids are wanted and how many results the rule had in earlier polls, either query
+    each resource directly or paginate the rule's results, stopping once all of the ids have been seen.
+    While a cassette is recording or replaying, the rule's results are always paginated: the calls a test
+    makes must not depend on what earlier tests in the process taught the profile, or a test replayed on its
+    own would make calls it never recorded.
+
+    :param configservice: boto client for AWS Config
+    :param rule_name: name of rule to get compliance details for
+    :param resource_ids: iterable of resource ids
+    :returns: dictionary of resource_id: compliance record for the resource_ids found
     """
-    resources_in_config = []
+    wanted = set(resource_ids)
+    found_records = {}
+    if not wanted:
+        return found_records
+
+    profile = None
+    if cassette.active_cassette().mode == cassette.OFF:
+        profile = _rule_profile(configservice, rule_name)
+        if profile.prefers_per_resource(len(wanted)):
+            return _scan_resources(configservice, rule_name, wanted, profile.resource_types)
+
+    result_count = 0
+    complete = True
+    for config_record in _iter_rule_results(configservice, rule_name):
+        result_count += 1
+        config_record_id = _resource_id(config_record)
+        if config_record_id in wanted and config_record_id not in found_records:
+            found_records[config_record_id] = config_record
+            if len(found_records) == len(wanted):
+                complete = False
+                break
+
+    if profile:
+        with profile.lock:
+            if complete or result_count > (profile.result_volume or 0):
+                profile.result_volume = result_count
+    return found_records
 
-    for config_record in config_records:
-        config_record_id = config_record['EvaluationResultIdentifier'][
-            'EvaluationResultQualifier']['ResourceId']
 
-        if config_record_id in resource_ids:
-            resources_in_config.append(config_record_id)
-    return resources_in_config
+def rule_policy(wait_period=None, max_attempts=None, retry_policy=None):
+    """ retry_policy, or rule_wait_policy, with wait_period and max_attempts overriding it when
+    given.  Replayed responses don't change between polls, so a replay polls without sleeping """
+    policy = retry_policy if retry_policy else rule_wait_policy
+    changes = {}
+    if wait_period is not None:
+        changes.update(wait_period=wait_period, backoff=None)
+    if max_attempts is not None:
+        changes.update(attempts=max_attempts)
+    if cassette.active_cassette().replaying:
+        changes.update(wait_period=0, backoff=None, deadline=None,
+                       attempts=changes.get('attempts', policy.attempts) or MAX_ATTEMPTS)
+    return policy.replace(**changes) if changes else policy
+
+
+def _wait_for_rule(configservice, rule_name, resource_ids, done, result, policy):
+    """
+    Wait with the process wide poller for the rule, which fetches results once per interval for
+    every thread waiting on the same rule
+
+    :param configservice: boto client for AWS Config
+    :param rule_name: config rule to poll
+    :param resource_ids: resource ids of interest
+    :param done: callable(found_records) returning True once the wait is satisfied
+    :param result: callable(found_records) producing the return value, from the last poll on timeout
+    :param policy: RetryPolicy scheduling the polls, see rule_policy
+    :returns: result(found_records)
+    """
+    future = _register_rule_wait(configservice, rule_name, resource_ids, done, result, policy)
+    return future.result()
+
+
+def _register_rule_wait(configservice, rule_name, resource_ids, done, result, policy):
+    """ Same as _wait_for_rule, but returns a future instead of blocking """
+    poller = rule_pollers.poller(
+        configservice,
+        rule_name,
+        fetch=functools.partial(scan_rule_results, configservice, rule_name)
+    )
+    return poller.register(resource_ids, done, result, policy=policy)
 
 
 def config_rule_wait_for_absent_resources(configservice, rule_name, resource_ids,
-                                          wait_period=WAIT_PERIOD, max_attempts=MAX_ATTEMPTS, evaluate=False):
+                                          wait_period=None, max_attempts=None, evaluate=False,
+                                          retry_policy=None):
     """
     Wait for resource_ids to be removed from AWS Config results.
     Default timeout is 15 minutes
 
-    :param configservice: boto client for interfacing with AWS Config service
+    :param configservice: boto client for interfacing with AWS Config service, None for the pooled client
     :param rule_name: config rule to evaluate
     :param wait_period: period to wait between checks
     :return: empty list if all resource_ids are absent. If timeout, return list of remaining ids.
 
-    :param wait_period: length of wait period (optional)
-    :param max_attempts: number of attempts before timeout (optional)
+    :param wait_period: length of wait period, instead of retry_policy's backoff (optional)
+    :param max_attempts: number of attempts before timeout, instead of retry_policy's (optional)
     :param evaluate: If True, initiate a config rule evaluation. Use for periodic rules. (optional)
+    :param retry_policy: potemkin.retry.RetryPolicy scheduling the polls (default rule_wait_policy)
     """
-
+    configservice = config_client(configservice)
     if evaluate:
-        _start_evaluations(configservice, rule_name)
+        start_evaluations(configservice, rule_name)
 
-    for _ in range(max_attempts):
-        config_records = all_rule_results(configservice, rule_name)
-        remaining_ids = _remove_missing_resource_ids(config_records, resource_ids)
-        if not remaining_ids:
-            return []
-        time.sleep(wait_period)
-    print(f'TIMEOUT waiting for these resources to disappear: {remaining_ids}')
-    return remaining_ids
+    return _wait_for_rule(configservice, rule_name, *absent_wait(resource_ids),
+                          policy=rule_policy(wait_period, max_attempts, retry_policy))
 
 
-def _present_config_results(config_records, resource_ids):
-    """ 
-    If resource_id is in config_records add to dictionary and return dictionary
-    
-    :param config_records: config compliance records
+def absent_wait(resource_ids):
+    """ (resource_ids, done, result) of a wait for resource_ids to leave a rule's results """
+    resource_ids = list(resource_ids)
+
+    def remaining_ids(found_records):
+        return [resource_id for resource_id in resource_ids if resource_id in found_records]
+
+    def result(found_records):
+        remaining = remaining_ids(found_records)
+        if remaining:
+            print(f'TIMEOUT waiting for these resources to disappear: {remaining}')
+        return remaining
+
+    return resource_ids, lambda found_records: not remaining_ids(found_records), result
+
+
+def _compliance_types(found_records, resource_ids):
+    """
+    If resource_id is in found_records add its compliance type to dictionary and return dictionary
+
+    :param found_records: dictionary of resource_id: compliance record
     :param resource_ids: list of resource ids
     :returns: dictionary of resource_id: compliance_type
     """
-    found_records = {}
-    for config_records in config_records:
-        config_record_id = config_records['EvaluationResultIdentifier'][
-            'EvaluationResultQualifier']['ResourceId']
-
-        if config_record_id in resource_ids:
-            found_records[config_record_id] = config_records["ComplianceType"]
-    return found_records
+    return {
+        resource_id: found_records[resource_id]['ComplianceType']
+        for resource_id in resource_ids
+        if resource_id in found_records
+    }
 
 
 def config_rule_wait_for_compliance_results(configservice, rule_name, expected_results,
-                                            wait_period=WAIT_PERIOD, max_attempts=MAX_ATTEMPTS,
-                                            evaluate=False):
+                                            wait_period=None, max_attempts=None,
+                                            evaluate=False, retry_policy=None):
     """ 
     Wait for resources to show up in config results and validate that the results are what are expected.
 
@@ -106,19 +317,32 @@ def config_rule_wait_for_compliance_results(configservice, rule_name, expected_r
     must not be present.
     Default timeout is 15 minutes
 
-    :param configservice: boto client for interfacing with AWS Config service
+    :param configservice: boto client for interfacing with AWS Config service, None for the pooled client
     :param rule_name: config rule to evaluate
     :param expected_results: dictionary of expected results in format resource_id: COMPLIANT|NON_COMPLIANT|NOT_APPLICABLE
     :return: test results compared to actual results. If timeout results are partial.
 
-    :param wait_period: length of wait period (optional)
-    :param max_attempts: number of attempts before timeout (optional)
+    :param wait_period: length of wait period, instead of retry_policy's backoff (optional)
+    :param max_attempts: number of attempts before timeout, instead of retry_policy's (optional)
     :param evaluate: If True, initiate a config rule evaluation. Use for periodic rules. (optional)
+    :param retry_policy: potemkin.retry.RetryPolicy scheduling the polls (default rule_wait_policy)
     """
-
+    configservice = config_client(configservice)
     if evaluate:
-        _start_evaluations(configservice, rule_name)
+        start_evaluations(configservice, rule_name)
+
+    policy = rule_policy(wait_period, max_attempts, retry_policy)
+    return _register_compliance_wait(configservice, rule_name, expected_results, policy).result()
+
+
+def _register_compliance_wait(configservice, rule_name, expected_results, policy):
+    """ Register the wait behind config_rule_wait_for_compliance_results and return its future """
+    return _register_rule_wait(configservice, rule_name, *compliance_wait(rule_name, expected_results),
+                               policy=policy)
 
+
+def compliance_wait(rule_name, expected_results):
+    """ (resource_ids, done, result) of a wait for a rule's results to match expected_results """
     expected_absent_ids = []
     expected_present_ids = []
     expected_present_results = {}
@@ -130,20 +354,85 @@ def config_rule_wait_for_compliance_results(configservice, rule_name, expected_r
             expected_present_ids.append(resource_id)
     expected_present_count = len(expected_present_ids)
 
-    for _ in range(max_attempts):
-        config_records = all_rule_results(configservice, rule_name)
+    def result(found_records):
+        actual_present_results = _compliance_types(found_records, expected_present_ids)
+        actual_absent_results = _compliance_types(found_records, expected_absent_ids)
+        print(f'rule = {rule_name}')
+        print(f'absent resources = {expected_absent_ids}')
+        print(f'absent actual_results = {actual_absent_results}')
+        print(f'present actual_results = {json.dumps(actual_present_results, indent=4)}')
+        print(f'present expected_results = {json.dumps(expected_present_results, indent=4)}')
+        return actual_present_results == expected_present_results and actual_absent_results == {}
+
+    def done(found_records):
+        return len(_compliance_types(found_records, expected_present_ids)) == expected_present_count
+
+    return expected_present_ids + expected_absent_ids, done, result
 
-        actual_present_results = _present_config_results(config_records, expected_present_ids)
-        actual_absent_results = _present_config_results(config_records, expected_absent_ids)
-        if len(actual_present_results) == expected_present_count:
-            break
-        time.sleep(wait_period)
 
-    print(f'absent resources = {expected_absent_ids}')
-    print(f'absent actual_results = {actual_absent_results}')
-    print(f'present actual_results = {json.dumps(actual_present_results, indent=4)}')
-    print(f'present expected_results = {json.dumps(expected_present_results, indent=4)}')
-    return actual_present_results == expected_present_results and actual_absent_results == {}
+def iter_config_rules_compliance_results(configservice, expected_results_by_rule,
+                                         wait_period=None, max_attempts=None,
+                                         evaluate=False, max_concurrency=MAX_CONCURRENT_RULES,
+                                         retry_policy=None):
+    """
+    Wait on several config rules at once and yield each rule's verdict as soon as that rule settles.
+
+    Each rule is checked the same way as config_rule_wait_for_compliance_results, but the rules are polled
+    concurrently, so the total wait is that of the slowest rule rather than the sum of all of them.
+
+    :param configservice: boto client for interfacing with AWS Config service, None for the pooled client
+    :param expected_results_by_rule: dictionary of rule_name: expected results (see config_rule_wait_for_compliance_results)
+    :return: generator of (rule_name, verdict) in the order the rules settle
+
+    :param wait_period: length of wait period, instead of retry_policy's backoff (optional)
+    :param max_attempts: number of attempts before timeout, instead of retry_policy's (optional)
+    :param evaluate: If True, initiate evaluations of all the rules with one call. Use for periodic rules. (optional)
+    :param max_concurrency: maximum number of rules polled at the same time (optional)
+    :param retry_policy: potemkin.retry.RetryPolicy scheduling the polls of each rule
+                         (default rule_wait_policy)
+    """
+    configservice = config_client(configservice)
+    if evaluate:
+        start_evaluations(configservice, *expected_results_by_rule)
+
+    policy = rule_policy(wait_period, max_attempts, retry_policy)
+    queued = list(expected_results_by_rule.items())
+    in_flight = {}
+    while queued or in_flight:
+        while queued and len(in_flight) < max_concurrency:
+            rule_name, expected_results = queued.pop(0)
+            future = _register_compliance_wait(configservice, rule_name, expected_results, policy)
+            in_flight[future] = rule_name
+        settled, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in settled:
+            yield in_flight.pop(future), future.result()
+
+
+def config_rules_wait_for_compliance_results(configservice, expected_results_by_rule,
+                                             wait_period=None, max_attempts=None,
+                                             evaluate=False, max_concurrency=MAX_CONCURRENT_RULES,
+                                             retry_policy=None):
+    """
+    Wait on several config rules at once, e.g. a conformance pack, and return every rule's verdict.
+    See iter_config_rules_compliance_results.
+
+    :param configservice: boto client for interfacing with AWS Config service, None for the pooled client
+    :param expected_results_by_rule: dictionary of rule_name: expected results (see config_rule_wait_for_compliance_results)
+    :return: dictionary of rule_name: True if the rule's results are as expected
+
+    :param wait_period: length of wait period, instead of retry_policy's backoff (optional)
+    :param max_attempts: number of attempts before timeout, instead of retry_policy's (optional)
+    :param evaluate: If True, initiate evaluations of all the rules with one call. Use for periodic rules. (optional)
+    :param max_concurrency: maximum number of rules polled at the same time (optional)
+    :param retry_policy: potemkin.retry.RetryPolicy scheduling the polls of each rule
+                         (default rule_wait_policy)
+    """
+    return dict(iter_config_rules_compliance_results(configservice, expected_results_by_rule,
+                                                     wait_period=wait_period,
+                                                     max_attempts=max_attempts,
+                                                     evaluate=evaluate,
+                                                     max_concurrency=max_concurrency,
+                                                     retry_policy=retry_policy))
 
 
 def config_rule_wait_for_resource(configservice, resource_id, rule_name):
@@ -158,39 +447,37 @@ def config_rule_wait_for_resource(configservice, resource_id, rule_name):
     is to poll until the given resource shows up somewhere in the details - be it compliant or not.
     An irrelevant resource will never show so.... you'll be waiting... and finally get a None result
 
-    :param configservice: boto client for interfacing with AWS Config service
+    :param configservice: boto client for interfacing with AWS Config service, None for the pooled client
     :param resource_id: resource id to wait for in the details of the call to get_compliance_details_by_config_rule
     :param rule_name: config rule to evaluate
     :return: None if resource never shows up, otherwise the EvaluationResult from call to
              get_compliance_details_by_config_rule
     """
-    attempts = 0
-    while True:
-        compliance_result = [
-            result
-            for result in all_rule_results(configservice, rule_name)
-            if result['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId'] == resource_id
-        ]
-        if compliance_result:
-            return compliance_result[0]
-        else:
-            attempts += 1
-            if attempts == MAX_ATTEMPTS:
-                return None
-            else:
-                time.sleep(WAIT_PERIOD)
-
-def _start_evaluations(configservice, rule_name):
-    """ Start configuration rule evaluations """
-    try:
-        _ = configservice.start_config_rules_evaluation(
-            ConfigRuleNames=[
-                rule_name
-            ]
-        )
-    except configservice.exceptions.LimitExceededException:
-        # if throttled, just wait anyways
-        pass
+    return _wait_for_rule(config_client(configservice), rule_name, *resource_wait(resource_id),
+                          policy=rule_policy())
+
+
+def resource_wait(resource_id):
+    """ (resource_ids, done, result) of a wait for resource_id to show up in a rule's results """
+    return ([resource_id],
+            lambda found_records: resource_id in found_records,
+            lambda found_records: found_records.get(resource_id))
+
+def start_evaluations(configservice, *rule_names):
+    """ Start configuration rule evaluations, as few calls as the API allows, retrying with
+    evaluation_retry_policy while the API refuses with LimitExceededException """
+    def limit_exceeded(error):
+        return isinstance(error, configservice.exceptions.LimitExceededException)
+
+    policy = evaluation_retry_policy.replace(retry_on=limit_exceeded, clock=_clock)
+    if cassette.active_cassette().replaying:
+        policy = policy.replace(attempts=1)
+    for start in range(0, len(rule_names), MAX_RULES_PER_EVALUATION):
+        chunk = list(rule_names[start:start + MAX_RULES_PER_EVALUATION])
+        outcome = policy.run(configservice.start_config_rules_evaluation, ConfigRuleNames=chunk)
+        if not outcome.satisfied:
+            # still throttled (or an evaluation is already running), just wait anyways
+            print(f'Could not start evaluations of {chunk}, waiting for results anyway')
 
 def evaluate_config_rule_and_wait_for_resource(configservice, resource_id,
                                                rule_name):
@@ -205,12 +492,13 @@ def evaluate_config_rule_and_wait_for_resource(configservice, resource_id,
     is to poll until the given resource shows up somewhere in the details - be it compliant or not.
     An irrelevant resource will never show so.... you'll be waiting... and finally get a None result
 
-    :param configservice: boto client for interfacing with AWS Config service
+    :param configservice: boto client for interfacing with AWS Config service, None for the pooled client
     :param resource_id: resource id to wait for in the details of the call to get_compliance_details_by_config_rule
     :param rule_name: config rule to evaluate
     :return: None if resource never shows up, otherwise the EvaluationResult from call to
              get_compliance_details_by_config_rule
     """
 
-    _start_evaluations(configservice, rule_name)
+    configservice = config_client(configservice)
+    start_evaluations(configservice, rule_name)
     return config_rule_wait_for_resource(configservice, resource_id, rule_name)
@@ -0,0 +1,91 @@
+"""
+Where the time goes: phase timings, API call counts and poll iterations recorded as events
+"""
+import contextlib
+import threading
+import time
+
+
+class Instrumentation:
+    """ Collects events from the decorators, the config waiters and the rate limiter and hands each one to hooks.
+
+    An event is a dictionary with kind ('stack', 'terraform', 'rule' or 'api'), name (template, terraform
+    root, rule name or service.operation), metric (a phase such as 'create_stack', 'wait' or 'test', or a
+    counter such as 'polls' or 'calls'), value, unit ('seconds' for phases, 'count' for counters), the test
+    that was running, if known, and any details. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._hooks = []
+        self.current_test = None
+
+    def add_hook(self, hook):
+        """ Call hook(event) for every event from now on """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def emit(self, kind, name, metric, value, unit, **details):
+        """ Record an event and pass it to the hooks """
+        event = dict(details, kind=kind, name=name, metric=metric, value=value, unit=unit, test=self.current_test,
+                     time=time.time())
+        with self._lock:
+            self._events.append(event)
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook(event)
+
+    def increment(self, kind, name, metric, amount=1, **details):
+        """ Count occurrences, e.g. increment('rule', 'eip-attached', 'polls') """
+        self.emit(kind, name, metric, amount, 'count', **details)
+
+    @contextlib.contextmanager
+    def timer(self, kind, name, phase, **details):
+        """ Time a phase, e.g. with timer('stack', template, 'wait', stack=stack_name): ... """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.emit(kind, name, phase, time.monotonic() - start, 'seconds', **details)
+
+    def events(self):
+        """ Every event recorded so far """
+        with self._lock:
+            return list(self._events)
+
+    def totals(self):
+        """ Values summed per kind, name and metric: {kind: {name: {metric: total}}} """
+        totals = {}
+        for event in self.events():
+            metrics = totals.setdefault(event['kind'], {}).setdefault(event['name'], {})
+            metrics[event['metric']] = metrics.get(event['metric'], 0) + event['value']
+        return totals
+
+    def slowest(self, kind, count=5, exclude=('test',)):
+        """ The names of kind that spent the most seconds in phases other than the excluded ones
+
+        :returns: list of (name, seconds, {phase: seconds}), slowest first """
+        phases_by_name = {}
+        for event in self.events():
+            if event['kind'] != kind or event['unit'] != 'seconds' or event['metric'] in exclude:
+                continue
+            phases = phases_by_name.setdefault(event['name'], {})
+            phases[event['metric']] = phases.get(event['metric'], 0) + event['value']
+        ranked = [(name, sum(phases.values()), phases) for name, phases in phases_by_name.items()]
+        return sorted(ranked, key=lambda entry: entry[1], reverse=True)[:count]
+
+    def report(self):
+        """ Everything recorded, ready for json.dump """
+        return {'totals': self.totals(), 'events': self.events()}
+
+    def clear(self):
+        """ Forget every event; hooks stay """
+        with self._lock:
+            self._events = []
+
+
+instrumentation = Instrumentation()
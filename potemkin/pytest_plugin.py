@@ -0,0 +1,149 @@
+"""
+pytest plugin that cleans up session wide potemkin resources when the test session ends, reports where
+the time went and records or replays cassettes
+"""
+import json
+import os
+
+import pytest
+
+from .cassette import RECORD, REPLAY, active_cassette, use_cassette
+from .instrumentation import instrumentation
+from .stackpool import stack_pools
+from .stackregistry import reused_stacks, shared_stacks
+from .teardown import TeardownError, wait_for_teardowns
+from .terraformresources import reused_roots
+
+
+SUMMARY_ENTRIES = 5
+
+# node ids of the tests this pytest-xdist worker has counted a pool lease for
+_registered_leases = set()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('potemkin')
+    group.addoption('--potemkin-report', metavar='PATH', default=None,
+                    help='write potemkin phase timings, API call counts and poll counts to PATH as json')
+    group.addoption('--potemkin-cassette', metavar='PATH', default=os.environ.get('POTEMKIN_CASSETTE'),
+                    help='record stack and terraform outputs and AWS Config responses to PATH, or replay them '
+                         'from it (default POTEMKIN_CASSETTE)')
+    group.addoption('--potemkin-cassette-mode', choices=(RECORD, REPLAY),
+                    default=os.environ.get('POTEMKIN_CASSETTE_MODE', REPLAY),
+                    help='record or replay the cassette (default POTEMKIN_CASSETTE_MODE or replay)')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'xdist_group(name): run every test of the group on the same pytest-xdist worker (--dist loadgroup)'
+    )
+    cassette_path = config.getoption('potemkin_cassette', None)
+    if cassette_path:
+        mode = config.getoption('potemkin_cassette_mode', REPLAY)
+        if mode == REPLAY and not os.path.exists(cassette_path):
+            raise pytest.UsageError(f'no cassette to replay at {cassette_path}, record one with '
+                                    f'--potemkin-cassette-mode={RECORD}')
+        use_cassette(cassette_path, mode)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config, items):
+    """ Group tests that can hand a stack or terraform root to each other, so that with pytest-xdist's
+    --dist loadgroup they run on the same worker and actually share, reuse or cache it """
+    for item in items:
+        group = getattr(getattr(item, 'obj', None), 'potemkin_group', None)
+        if group and item.get_closest_marker('xdist_group') is None:
+            item.add_marker(pytest.mark.xdist_group(name=f'potemkin-{group[:16]}'))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    """ Attribute instrumentation events to the running test.  On a pytest-xdist worker, count pool leases
+    for this test and the next one as they arrive, so the next test's stack is created during this one """
+    if _xdist_worker():
+        for upcoming in (item, nextitem):
+            if upcoming is not None and upcoming.nodeid not in _registered_leases:
+                _registered_leases.add(upcoming.nodeid)
+                _potemkin_attribute(upcoming, 'potemkin_register_lease')()
+    instrumentation.current_test = item.nodeid
+    yield
+    instrumentation.current_test = None
+
+
+def pytest_collection_finish(session):
+    """ Count shared stack users and pool leases from the tests left after deselection, instead of every
+    decorated test, then start pre-provisioning pooled stacks.
+
+    A pytest-xdist worker collects every test but runs only the ones it is sent, so it counts leases as tests
+    arrive (see pytest_runtest_protocol) and does not warm the pools ahead of them """
+    shared_stacks.reset_users()
+    stack_pools.reset_demand()
+    _registered_leases.clear()
+    for item in session.items:
+        _potemkin_attribute(item, 'potemkin_register_share')()
+        if not _xdist_worker():
+            _potemkin_attribute(item, 'potemkin_register_lease')()
+    if session.items and not _xdist_worker():
+        stack_pools.warm_all()
+
+
+def _potemkin_attribute(item, name):
+    """ The registration callable the decorator left on the test function, or one doing nothing """
+    register = getattr(getattr(item, 'obj', None), name, None)
+    return register if register else (lambda: None)
+
+
+def _xdist_worker():
+    return 'PYTEST_XDIST_WORKER' in os.environ
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """ Tear down shared stacks that were never released, e.g. because their tests were skipped or ran on
+    another pytest-xdist worker, tear down reused stacks, drain the stack pools, destroy reused terraform
+    roots and wait for background teardowns, failing the session if any of them failed.  Then save the
+    cassette being recorded and write the --potemkin-report """
+    shared_stacks.teardown_all()
+    reused_stacks.teardown_all()
+    stack_pools.drain_all()
+    reused_roots.teardown_all()
+    try:
+        wait_for_teardowns()
+    except TeardownError as error:
+        print(error)
+        if session.exitstatus == pytest.ExitCode.OK:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+    if active_cassette().recording:
+        active_cassette().save()
+
+    report_path = session.config.getoption('potemkin_report', None)
+    if report_path:
+        with open(report_path, 'w') as report_file:
+            json.dump(instrumentation.report(), report_file, indent=2, default=str)
+
+
+def pytest_terminal_summary(terminalreporter):
+    """ The slowest templates, terraform roots and config rules, and the busiest API operations """
+    sections = [
+        ('slowest CloudFormation templates', instrumentation.slowest('stack', SUMMARY_ENTRIES)),
+        ('slowest terraform roots', instrumentation.slowest('terraform', SUMMARY_ENTRIES)),
+        ('slowest config rules', instrumentation.slowest('rule', SUMMARY_ENTRIES))
+    ]
+    api_calls = sorted(((name, metrics.get('calls', 0), metrics.get('throttled', 0))
+                        for name, metrics in instrumentation.totals().get('api', {}).items()),
+                       key=lambda entry: entry[1], reverse=True)[:SUMMARY_ENTRIES]
+    if not any(entries for _, entries in sections) and not api_calls:
+        return
+    terminalreporter.section('potemkin')
+    for title, entries in sections:
+        if not entries:
+            continue
+        terminalreporter.write_line(f'{title}:')
+        for name, seconds, phases in entries:
+            breakdown = ', '.join(f'{phase} {value:.1f}s' for phase, value in
+                                  sorted(phases.items(), key=lambda phase: phase[1], reverse=True))
+            terminalreporter.write_line(f'  {seconds:8.1f}s  {name} ({breakdown})')
+    if api_calls:
+        terminalreporter.write_line('busiest AWS API operations:')
+        for name, calls, throttled in api_calls:
+            terminalreporter.write_line(f'  {calls:8d}  {name} ({throttled} throttled)')
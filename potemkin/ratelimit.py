@@ -0,0 +1,210 @@
+"""
+Process wide AWS API rate limiting: token buckets per service and operation that slow down when throttled
+"""
+import threading
+
+from .instrumentation import instrumentation
+from .waiters import SystemClock
+
+
+THROTTLING_ERROR_CODES = (
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException'
+)
+# codes that only mean throttling for some services: elsewhere, e.g. in CloudFormation, LimitExceededException
+# is a hard quota that retrying cannot get past
+SERVICE_THROTTLING_ERROR_CODES = {
+    'config': ('LimitExceededException',)
+}
+DEFAULT_LIMITS = {
+    'cloudformation': 5,
+    'config': 5,
+    ('config', 'StartConfigRulesEvaluation'): 1
+}
+DEFAULT_RATE = 10
+
+
+class TokenBucket:
+    """ Allows rate calls per second on average and bursts of up to burst calls.
+
+    The rate adapts: it is halved every time a call is throttled and recovers additively with every call that
+    is not, up to the configured rate. """
+
+    def __init__(self, rate, burst=None, min_rate=0.2, clock=None):
+        """ Constructor
+
+        :param rate: calls per second
+        :param burst: calls that may be made back to back (default twice the rate, at least 1)
+        :param min_rate: lowest rate throttling may push the bucket to (default 0.2)
+        :param clock: object with monotonic() and sleep(seconds), for testing (default SystemClock()) """
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst if burst else max(1, 2 * rate)
+        self.min_rate = min(min_rate, rate)
+        self._clock = clock if clock else SystemClock()
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = self._clock.monotonic()
+
+    def acquire(self):
+        """ Take a token, sleeping until one is available
+
+        :returns: seconds slept """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            self._clock.sleep(wait)
+        return wait
+
+    def throttled(self):
+        """ The service throttled a call: back off multiplicatively """
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def _refill(self):
+        """ Add the tokens accrued since the last update; caller must hold the lock """
+        now = self._clock.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def succeeded(self):
+        """ A call went through: recover additively """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class OperationStats:
+    """ Counters for one service operation """
+
+    def __init__(self):
+        self.calls = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def as_dict(self):
+        return {'calls': self.calls, 'throttled': self.throttled, 'waited': round(self.waited, 3)}
+
+
+class RateLimiter:
+    """ Token buckets per (service, operation), hooked into boto3 clients through botocore events.
+
+    Every request attempt, retries included, takes a token from its operation's bucket (before-send), and
+    every response feeds back into the bucket (needs-retry): throttling errors slow the operation down and
+    successes let it recover, so calls flow as fast as AWS accepts them instead of bursting and stalling.
+    botocore's own retry handler still decides whether to retry. """
+
+    def __init__(self, limits=None, default_rate=DEFAULT_RATE, clock=None):
+        """ Constructor
+
+        :param limits: dictionary of service name or (service name, operation name) to calls per second,
+                       e.g. {'cloudformation': 5, ('config', 'StartConfigRulesEvaluation'): 1}
+                       (default DEFAULT_LIMITS)
+        :param default_rate: calls per second for operations of services not in limits (default 10)
+        :param clock: object with monotonic() and sleep(seconds), for testing (default SystemClock()) """
+        self._limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self._default_rate = default_rate
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._stats = {}
+
+    def configure(self, limits):
+        """ Change the limits for the operations they name, keeping the rest
+
+        :param limits: see the constructor """
+        with self._lock:
+            self._limits.update(limits)
+            for key in list(self._buckets):
+                if key in limits or key[0] in limits:
+                    del self._buckets[key]
+
+    def bucket(self, service, operation):
+        """ The token bucket for an operation, created on first use """
+        key = (service, operation)
+        with self._lock:
+            if key not in self._buckets:
+                rate = self._limits.get(key, self._limits.get(service, self._default_rate))
+                self._buckets[key] = TokenBucket(rate, clock=self._clock)
+                self._stats.setdefault(key, OperationStats())
+            return self._buckets[key]
+
+    def acquire(self, service, operation):
+        """ Wait for the operation's turn """
+        waited = self.bucket(service, operation).acquire()
+        with self._lock:
+            stats = self._stats[(service, operation)]
+            stats.calls += 1
+            stats.waited += waited
+        instrumentation.increment('api', f'{service}.{operation}', 'calls')
+        if waited:
+            instrumentation.emit('api', f'{service}.{operation}', 'rate_limited', waited, 'seconds')
+
+    def record(self, service, operation, throttled):
+        """ Feed the outcome of a call back into the operation's bucket """
+        bucket = self.bucket(service, operation)
+        if throttled:
+            bucket.throttled()
+            with self._lock:
+                self._stats[(service, operation)].throttled += 1
+            instrumentation.increment('api', f'{service}.{operation}', 'throttled')
+        else:
+            bucket.succeeded()
+
+    def stats(self):
+        """ Counters per operation: {(service, operation): {'calls', 'throttled', 'waited'}} """
+        with self._lock:
+            return {key: stats.as_dict() for key, stats in self._stats.items()}
+
+    def reset_stats(self):
+        """ Zero every counter """
+        with self._lock:
+            self._stats = {key: OperationStats() for key in self._stats}
+
+    def install(self, client):
+        """ Route every call of a boto3 client through the limiter.  Installing twice is harmless
+
+        :param client: boto3 client
+        :returns: client """
+        if getattr(client, '_potemkin_rate_limited', False):
+            return client
+        service = client.meta.service_model.service_name
+
+        def before_send(event_name, **kwargs):
+            self.acquire(service, event_name.rsplit('.', 1)[-1])
+
+        def needs_retry(event_name, response=None, caught_exception=None, **kwargs):
+            if caught_exception is not None:
+                return None
+            parsed = response[1] if response else {}
+            code = parsed.get('Error', {}).get('Code')
+            self.record(service, event_name.rsplit('.', 1)[-1], throttled=is_throttling_code(service, code))
+            return None
+
+        client.meta.events.register('before-send', before_send)
+        client.meta.events.register_first('needs-retry', needs_retry)
+        client._potemkin_rate_limited = True
+        return client
+
+
+def is_throttling_code(service, code):
+    """ True if an error code returned by service means the call was throttled """
+    return code in THROTTLING_ERROR_CODES or code in SERVICE_THROTTLING_ERROR_CODES.get(service, ())
+
+
+def is_throttling_error(error, service=None):
+    """ True if error is a botocore ClientError caused by throttling
+
+    :param error: exception
+    :param service: service name of the call, for codes that only mean throttling in some services (optional) """
+    response = getattr(error, 'response', None)
+    return bool(response) and is_throttling_code(service, response.get('Error', {}).get('Code'))
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,175 @@
+"""
+Bulk deletion of orphaned potemkin stacks: left by teardown=False, teardown_fail=False or interrupted runs
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from .ratelimit import is_throttling_error
+from .retry import RetryPolicy
+from .waiters import AdaptiveBackoff, StackWaiter, SystemClock
+
+
+REAPABLE_STATUSES = [
+    'CREATE_FAILED',
+    'CREATE_COMPLETE',
+    'ROLLBACK_FAILED',
+    'ROLLBACK_COMPLETE',
+    'DELETE_FAILED',
+    'UPDATE_COMPLETE',
+    'UPDATE_ROLLBACK_FAILED',
+    'UPDATE_ROLLBACK_COMPLETE',
+    'IMPORT_COMPLETE',
+    'IMPORT_ROLLBACK_FAILED',
+    'IMPORT_ROLLBACK_COMPLETE'
+]
+MAX_THROTTLE_RETRIES = 8
+
+
+def stem_pattern(stem):
+    """ Regular expression matching the names CloudFormationStack generates from stack_name_stem """
+    return re.compile(rf'^{re.escape(stem)}\d{{9,}}(-[A-Za-z0-9-]+)?$')
+
+
+class ReapReport:
+    """ What a reap deleted, what it had to retain resources for and what it could not delete """
+
+    def __init__(self):
+        self.deleted = []
+        self.retained = {}
+        self.failures = []
+
+    def __str__(self):
+        lines = [f'{len(self.deleted)} stack(s) deleted, {len(self.failures)} failed']
+        lines += [f'  {stack_name} retained {", ".join(resources)}' for stack_name, resources in self.retained.items()]
+        lines += [f'  {stack_name}: {error}' for stack_name, error in self.failures]
+        return '\n'.join(lines)
+
+
+class StackReaper:
+    """ Finds stacks by name stem, tags and age, and deletes them on a bounded worker pool.
+
+    Deletes that are throttled are retried with backoff.  A stack that ends up DELETE_FAILED is deleted again,
+    retaining the resources that could not be deleted, so the stack itself goes away. """
+
+    def __init__(self, cloudformation, max_workers=10, timeout=30, wait_strategy=None, clock=None):
+        """ Constructor
+
+        :param cloudformation: boto client for CloudFormation
+        :param max_workers: maximum concurrent stack deletions (default 10)
+        :param timeout: minutes to wait for each stack to delete (default 30)
+        :param wait_strategy: how to poll while stacks delete (default AdaptiveBackoff())
+        :param clock: object with monotonic() and sleep(seconds), for testing (default SystemClock()) """
+        self._cloudformation = cloudformation
+        self._max_workers = max_workers
+        self._timeout = timeout
+        self._clock = clock if clock else SystemClock()
+        self._waiter = StackWaiter(wait_strategy, clock=self._clock)
+        self._throttle_policy = RetryPolicy(attempts=MAX_THROTTLE_RETRIES + 1,
+                                            backoff=AdaptiveBackoff(initial_delay=1, multiplier=2,
+                                                                    max_delay=30),
+                                            retry_on=is_throttling_error,
+                                            predicate=lambda response: True,
+                                            clock=self._clock)
+
+    def find(self, stems=None, tags=None, older_than=None):
+        """ Stacks matching every given criterion
+
+        :param stems: stack_name_stems the stacks were created with (default any name)
+        :param tags: dictionary of tags the stacks must carry (default any tags)
+        :param older_than: hours since the stack was created or last updated (default any age)
+        :returns: list of ListStacks summaries """
+        patterns = [stem_pattern(stem) for stem in stems] if stems else None
+        now = datetime.now(timezone.utc)
+        matches = []
+        paginator = self._cloudformation.get_paginator('list_stacks')
+        for page in paginator.paginate(StackStatusFilter=REAPABLE_STATUSES):
+            for summary in page['StackSummaries']:
+                if patterns and not any(pattern.match(summary['StackName']) for pattern in patterns):
+                    continue
+                changed = summary.get('LastUpdatedTime', summary['CreationTime'])
+                if older_than is not None and (now - changed).total_seconds() / 3600 <= older_than:
+                    continue
+                if tags and not self._has_tags(summary['StackName'], tags):
+                    continue
+                matches.append(summary)
+        return matches
+
+    def reap(self, stacks, dry_run=False):
+        """ Delete stacks in parallel
+
+        :param stacks: ListStacks summaries or stack names
+        :param dry_run: only report what would be deleted
+        :returns: ReapReport """
+        report = ReapReport()
+        stack_names = [stack if isinstance(stack, str) else stack['StackName'] for stack in stacks]
+        if dry_run:
+            report.deleted = stack_names
+            return report
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='potemkin-reaper') as executor:
+            futures = [(stack_name, executor.submit(self._delete, stack_name)) for stack_name in stack_names]
+        for stack_name, future in futures:
+            try:
+                retained = future.result()
+            except Exception as error:
+                report.failures.append((stack_name, error))
+                continue
+            report.deleted.append(stack_name)
+            if retained:
+                report.retained[stack_name] = retained
+        return report
+
+    def _has_tags(self, stack_name, tags):
+        stack = self._call('describe_stacks', StackName=stack_name)['Stacks'][0]
+        stack_tags = {tag['Key']: tag['Value'] for tag in stack.get('Tags', [])}
+        return all(stack_tags.get(key) == value for key, value in tags.items())
+
+    def _delete(self, stack_name):
+        """ Delete one stack, retaining whatever blocks the delete
+
+        :returns: logical ids of retained resources """
+        stack = self._delete_and_wait(stack_name)
+        if stack is None:
+            return []
+        if stack['StackStatus'] != 'DELETE_FAILED':
+            raise Exception(f"StackTimeoutError: still {stack['StackStatus']}")
+
+        resources = self._call('describe_stack_resources', StackName=stack_name)['StackResources']
+        retained = [resource['LogicalResourceId'] for resource in resources
+                    if resource['ResourceStatus'] == 'DELETE_FAILED']
+        stack = self._delete_and_wait(stack_name, RetainResources=retained)
+        if stack is not None:
+            raise Exception(f"StackDeletionError: {stack['StackStatus']} {stack.get('StackStatusReason', '')}")
+        return retained
+
+    def _delete_and_wait(self, stack_name, **delete_options):
+        """ DeleteStack, then poll until the stack is gone or stops deleting
+
+        :returns: the last description of the stack, None once it is deleted """
+        self._call('delete_stack', StackName=stack_name, **delete_options)
+
+        def poll():
+            stack = self._describe(stack_name)
+            return stack is None or stack['StackStatus'] != 'DELETE_IN_PROGRESS', stack
+
+        _, stack = self._waiter.wait(poll, deadline=self._timeout * 60)
+        if stack is not None and stack['StackStatus'] == 'DELETE_COMPLETE':
+            return None
+        return stack
+
+    def _describe(self, stack_name):
+        from botocore.exceptions import ClientError
+
+        try:
+            return self._call('describe_stacks', StackName=stack_name)['Stacks'][0]
+        except ClientError as error:
+            if 'does not exist' in error.response['Error'].get('Message', ''):
+                return None
+            raise
+
+    def _call(self, operation, **kwargs):
+        """ Invoke a CloudFormation operation, backing off and retrying while it is throttled """
+        outcome = self._throttle_policy.run(getattr(self._cloudformation, operation), **kwargs)
+        if not outcome.satisfied:
+            raise outcome.exception
+        return outcome.value
@@ -0,0 +1,164 @@
+"""
+Retry engine: call something until its result is acceptable, backing off between attempts, within
+an attempt limit and an overall deadline
+"""
+import asyncio
+import inspect
+
+from .waiters import FixedDelay, SystemClock
+
+
+class RetryOutcome:
+    """ What one retried call came to """
+
+    def __init__(self):
+        self.value = None
+        self.exception = None
+        self.satisfied = False
+        self.attempts = 0
+        self.waited = 0.0
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return {'satisfied': self.satisfied, 'attempts': self.attempts,
+                'waited': round(self.waited, 3), 'elapsed': round(self.elapsed, 3)}
+
+    def __repr__(self):
+        return f'RetryOutcome({self.as_dict()})'
+
+
+class RetryPolicy:
+    """ How to retry: up to attempts calls, sleeping between them as backoff says, starting none
+    after the deadline.
+
+    A call is satisfied once it returns a value the predicate accepts.  Exceptions accepted by
+    retry_on count as unsatisfied attempts; any other exception propagates straight away. """
+
+    def __init__(self,
+                 wait_period=20,
+                 attempts=15,
+                 backoff=None,
+                 deadline=None,
+                 retry_on=(),
+                 predicate=bool,
+                 clock=None):
+        """ Constructor
+
+        :param wait_period: seconds between attempts when no backoff is given (default 20)
+        :param attempts: maximum number of calls, None to rely on the deadline alone (default 15)
+        :param backoff: wait strategy: potemkin.waiters.FixedDelay(...), AdaptiveBackoff(...) or
+                        DecorrelatedJitter(...) (default FixedDelay(wait_period))
+        :param deadline: seconds from the first call after which no attempt is started, None for no
+                         deadline (default None)
+        :param retry_on: exception type or tuple of types to retry, or callable(exception) returning
+                         True for exceptions to retry (default none)
+        :param predicate: callable(value) returning True for an acceptable return value
+                          (default truthiness)
+        :param clock: object with monotonic() and sleep(seconds), for testing
+                      (default SystemClock()) """
+        if attempts is None and deadline is None:
+            raise ValueError('attempts and deadline cannot both be unlimited')
+        self._options = {
+            'wait_period': wait_period,
+            'attempts': attempts,
+            'backoff': backoff,
+            'deadline': deadline,
+            'retry_on': retry_on,
+            'predicate': predicate,
+            'clock': clock
+        }
+        self.attempts = attempts
+        self.deadline = deadline
+        self.backoff = backoff if backoff else FixedDelay(wait_period)
+        self.predicate = predicate
+        self._retry_on = retry_on
+        self._clock = clock if clock else SystemClock()
+
+    def replace(self, **changes):
+        """ A copy of this policy with constructor arguments changed, e.g. replace(deadline=60) """
+        return RetryPolicy(**dict(self._options, **changes))
+
+    def delays(self):
+        """ A fresh generator of sleep periods, one per call """
+        return self.backoff.delays()
+
+    def next_delay(self, attempts, elapsed, delays):
+        """ Seconds to sleep before the next attempt
+
+        :param attempts: attempts made so far
+        :param elapsed: seconds since the first attempt
+        :param delays: this call's generator from delays()
+        :returns: seconds, None once the attempts or the deadline are used up """
+        if self.attempts is not None and attempts >= self.attempts:
+            return None
+        if self.deadline is None:
+            return next(delays)
+        remaining = self.deadline - elapsed
+        if remaining <= 0:
+            return None
+        return min(next(delays), remaining)
+
+    def retryable(self, error):
+        """ True if error should be retried rather than raised """
+        if isinstance(self._retry_on, (type, tuple)):
+            return isinstance(error, self._retry_on)
+        return bool(self._retry_on(error))
+
+    def run(self, function, *args, **kwargs):
+        """ Call function(*args, **kwargs) until it is satisfied or the policy is used up
+
+        :returns: RetryOutcome, with the last value or retried exception """
+        outcome = RetryOutcome()
+        start = self._clock.monotonic()
+        delays = self.delays()
+        while True:
+            try:
+                value = function(*args, **kwargs)
+            except Exception as error:
+                self._record(outcome, error=error)
+            else:
+                self._record(outcome, value=value)
+            delay = self._after_attempt(outcome, start, delays)
+            if delay is None:
+                return outcome
+            self._clock.sleep(delay)
+            outcome.waited += delay
+
+    async def run_async(self, function, *args, **kwargs):
+        """ Same as run, sleeping with asyncio.sleep.  function may be a coroutine function """
+        outcome = RetryOutcome()
+        start = self._clock.monotonic()
+        delays = self.delays()
+        while True:
+            try:
+                value = function(*args, **kwargs)
+                if inspect.isawaitable(value):
+                    value = await value
+            except Exception as error:
+                self._record(outcome, error=error)
+            else:
+                self._record(outcome, value=value)
+            delay = self._after_attempt(outcome, start, delays)
+            if delay is None:
+                return outcome
+            await asyncio.sleep(delay)
+            outcome.waited += delay
+
+    def _record(self, outcome, value=None, error=None):
+        """ Account for one attempt, raising errors that are not to be retried """
+        outcome.attempts += 1
+        if error is not None:
+            if not self.retryable(error):
+                raise error
+            outcome.exception = error
+            return
+        outcome.value = value
+        outcome.exception = None
+        outcome.satisfied = bool(self.predicate(value))
+
+    def _after_attempt(self, outcome, start, delays):
+        """ The sleep before the next attempt, None when done """
+        outcome.elapsed = self._clock.monotonic() - start
+        if outcome.satisfied:
+            return None
+        return self.next_delay(outcome.attempts, outcome.elapsed, delays)
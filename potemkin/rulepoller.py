@@ -0,0 +1,216 @@
+"""
+Process wide pollers that fetch AWS Config rule results once per interval for every waiter on the rule
+"""
+import functools
+import threading
+import time
+from concurrent.futures import Future
+
+from .instrumentation import instrumentation
+from .retry import RetryPolicy
+
+
+CACHE_TTL = 5
+MAX_ATTEMPTS = 45
+WAIT_PERIOD = 20
+
+
+class _Waiter:
+    """ One registered wait on a rule """
+
+    def __init__(self, resource_ids, done, result, policy):
+        self.resource_ids = set(resource_ids)
+        self.done = done
+        self.result = result
+        self.policy = policy
+        self.delays = policy.delays()
+        self.attempts = 0
+        self.next_poll = time.monotonic()
+        self.registered = self.next_poll
+        self.future = Future()
+
+
+class RulePoller:
+    """ Polls one config rule on behalf of any number of waiters.
+
+    A background thread wakes whenever a waiter is due, fetches the results for the resource ids of every due
+    waiter in one go (or serves them from a cache younger than ttl) and resolves each waiter's future once it
+    is satisfied or out of attempts.  The thread stops when no waiters remain. """
+
+    def __init__(self, fetch, ttl=CACHE_TTL, name=None, on_idle=None):
+        """ Constructor
+
+        :param fetch: callable(resource_ids) returning a dictionary of resource_id: compliance record
+        :param ttl: seconds fetched results may be reused for (default 5)
+        :param name: rule name, for instrumentation (optional)
+        :param on_idle: callable(poller) called when the last waiter has finished (optional) """
+        self._fetch = fetch
+        self._name = name
+        self._ttl = ttl
+        self._on_idle = on_idle
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._running = False
+        self._cache = None
+
+    def wait(self, resource_ids, done, result, wait_period=None, max_attempts=None, policy=None):
+        """ Block until done(found_records) is true or the waiter's retry policy is used up
+
+        :param resource_ids: resource ids the waiter is interested in
+        :param done: callable(found_records) returning True once the wait is satisfied
+        :param result: callable(found_records) producing the return value, from the last poll on timeout
+        :param wait_period: seconds between polls for this waiter, if no policy is given (default 20)
+        :param max_attempts: number of polls before timeout, if no policy is given (default 45)
+        :param policy: potemkin.retry.RetryPolicy scheduling this waiter's polls (optional)
+        :returns: result(found_records) """
+        return self.register(resource_ids, done, result, wait_period, max_attempts, policy).result()
+
+    def register(self, resource_ids, done, result, wait_period=None, max_attempts=None,
+                 policy=None):
+        """ Register a waiter and return a future for its result, see wait """
+        if policy is None:
+            policy = RetryPolicy(wait_period=WAIT_PERIOD if wait_period is None else wait_period,
+                                 attempts=MAX_ATTEMPTS if max_attempts is None else max_attempts)
+        waiter = _Waiter(resource_ids, done, result, policy)
+        with self._condition:
+            self._waiters.append(waiter)
+            if not self._running:
+                self._running = True
+                threading.Thread(target=self._run, name='potemkin-rule-poller', daemon=True).start()
+            self._condition.notify_all()
+        return waiter.future
+
+    def waiter_count(self):
+        """ Number of waiters still registered """
+        with self._condition:
+            return len(self._waiters)
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    if not self._waiters:
+                        self._running = False
+                        break
+                    now = time.monotonic()
+                    due = [waiter for waiter in self._waiters if waiter.next_poll <= now]
+                    if not due:
+                        self._condition.wait(min(waiter.next_poll for waiter in self._waiters) - now)
+                        continue
+                self._poll(due)
+        except Exception as error:
+            # the thread is going away: fail every waiter rather than leave them blocked on it
+            with self._condition:
+                waiters, self._waiters = self._waiters, []
+                self._running = False
+            for waiter in waiters:
+                waiter.future.set_exception(error)
+        if self._on_idle:
+            self._on_idle(self)
+
+    def _poll(self, due):
+        """ Fetch once for all due waiters and resolve the ones that are finished """
+        resource_ids = set().union(*(waiter.resource_ids for waiter in due))
+        try:
+            found_records = self._cached_fetch(resource_ids)
+        except Exception as error:
+            self._finish(due, lambda waiter: waiter.future.set_exception(error))
+            return
+
+        finished = []
+        failed = []
+        for waiter in due:
+            waiter.attempts += 1
+            instrumentation.increment('rule', self._name, 'polls')
+            relevant = {key: value for key, value in found_records.items() if key in waiter.resource_ids}
+            try:
+                delay = self._next_delay(waiter, relevant)
+            except Exception as error:
+                failed.append((waiter, error))
+                continue
+            if delay is None:
+                finished.append((waiter, relevant))
+            else:
+                waiter.next_poll = time.monotonic() + delay
+        for waiter, relevant in finished:
+            self._finish([waiter], lambda waiter: self._resolve(waiter, relevant))
+        for waiter, error in failed:
+            self._finish([waiter], lambda waiter: waiter.future.set_exception(error))
+
+    @staticmethod
+    def _next_delay(waiter, found_records):
+        """ Seconds until the waiter's next poll, None once it is satisfied or out of attempts """
+        if waiter.done(found_records):
+            return None
+        return waiter.policy.next_delay(waiter.attempts, time.monotonic() - waiter.registered, waiter.delays)
+
+    def _resolve(self, waiter, found_records):
+        instrumentation.emit('rule', self._name, 'wait', time.monotonic() - waiter.registered, 'seconds',
+                             attempts=waiter.attempts)
+        try:
+            waiter.future.set_result(waiter.result(found_records))
+        except Exception as error:
+            waiter.future.set_exception(error)
+
+    def _finish(self, waiters, resolve):
+        """ Unregister waiters, then resolve their futures """
+        with self._condition:
+            for waiter in waiters:
+                self._waiters.remove(waiter)
+        for waiter in waiters:
+            resolve(waiter)
+
+    def _cached_fetch(self, resource_ids):
+        """ Results fetched less than ttl ago for a superset of resource_ids, or a fresh fetch """
+        now = time.monotonic()
+        if self._cache:
+            fetched_at, cached_ids, found_records = self._cache
+            if now - fetched_at < self._ttl and resource_ids <= cached_ids:
+                instrumentation.increment('rule', self._name, 'cache_hits')
+                return found_records
+        instrumentation.increment('rule', self._name, 'fetches')
+        found_records = self._fetch(resource_ids)
+        self._cache = (now, resource_ids, found_records)
+        return found_records
+
+
+class RulePollerRegistry:
+    """ One RulePoller per (client, rule name) while anyone is waiting on it.  A poller is forgotten, together
+    with its client, once its last waiter finishes, so clients created per test are not kept for the session """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pollers = {}
+
+    def poller(self, configservice, rule_name, fetch, ttl=CACHE_TTL):
+        """ The poller for rule_name through configservice, created on first use
+
+        :param configservice: boto client for AWS Config, kept alive as long as its pollers have waiters
+        :param rule_name: config rule name
+        :param fetch: callable(resource_ids) returning a dictionary of resource_id: compliance record
+        :param ttl: cache ttl for a new poller """
+        key = (id(configservice), rule_name)
+        with self._lock:
+            if key not in self._pollers:
+                self._pollers[key] = (configservice, RulePoller(fetch, ttl=ttl, name=rule_name,
+                                                                on_idle=functools.partial(self._discard, key)))
+            return self._pollers[key][1]
+
+    def _discard(self, key, poller):
+        """ Forget an idle poller, unless it was replaced or got new waiters meanwhile """
+        with self._lock:
+            entry = self._pollers.get(key)
+            if entry and entry[1] is poller and not poller.waiter_count():
+                del self._pollers[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pollers)
+
+    def clear(self):
+        """ Forget all pollers; waiters already registered keep their poller """
+        with self._lock:
+            self._pollers = {}
+
+
+rule_pollers = RulePollerRegistry()
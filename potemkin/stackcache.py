@@ -0,0 +1,101 @@
+"""
+Persistent cache of CloudFormation stacks that outlive the test session, found again by their tags
+"""
+from datetime import datetime, timezone
+
+from .utilities import fingerprint, package_version
+
+
+CACHE_TAG = 'potemkin:cache'
+FINGERPRINT_TAG = 'potemkin:fingerprint'
+STEM_TAG = 'potemkin:stem'
+REUSABLE_STATUSES = ('CREATE_COMPLETE', 'UPDATE_COMPLETE')
+DEFAULT_MAX_AGE = 24
+
+
+def cache_fingerprint(template_body, parameters):
+    """ Hash of template content, parameters and potemkin version identifying a cached stack """
+    return fingerprint(template_body, parameters, package_version())
+
+
+def cache_tags(stack_fingerprint, stem):
+    """ Tags marking a stack as cached, for CreateStack """
+    return [
+        {'Key': CACHE_TAG, 'Value': 'true'},
+        {'Key': FINGERPRINT_TAG, 'Value': stack_fingerprint},
+        {'Key': STEM_TAG, 'Value': str(stem)}
+    ]
+
+
+def stack_tags(stack):
+    """ Tags of a DescribeStacks stack as a dictionary """
+    return {tag['Key']: tag['Value'] for tag in stack.get('Tags', [])}
+
+
+def stack_age(stack, now=None):
+    """ Hours since the stack was created or last updated """
+    now = now if now else datetime.now(timezone.utc)
+    changed = stack.get('LastUpdatedTime', stack['CreationTime'])
+    return (now - changed).total_seconds() / 3600
+
+
+def cached_stacks(cloudformation, stem=None):
+    """ Every stack in the account and region tagged as a potemkin cache entry
+
+    :param cloudformation: boto client for CloudFormation
+    :param stem: only stacks created with this stack_name_stem (default any) """
+    for page in cloudformation.get_paginator('describe_stacks').paginate():
+        for stack in page['Stacks']:
+            tags = stack_tags(stack)
+            if CACHE_TAG not in tags:
+                continue
+            if stem is not None and tags.get(STEM_TAG) != stem:
+                continue
+            yield stack
+
+
+def find_cached_stack(cloudformation, stack_fingerprint, stem, max_age=DEFAULT_MAX_AGE):
+    """ The youngest reusable cached stack for stack_fingerprint, and the matching stacks that must be evicted
+
+    Matching stacks older than max_age hours, or that did not end up complete, are never handed out.
+
+    :param cloudformation: boto client for CloudFormation
+    :param stack_fingerprint: cache_fingerprint of the wanted stack
+    :param stem: stack_name_stem the stack was created with
+    :param max_age: hours a cached stack may be reused for, None for no limit
+    :returns: (stack description or None, list of stack names to evict) """
+    reusable = []
+    evict = []
+    for stack in cached_stacks(cloudformation, stem):
+        if stack_tags(stack).get(FINGERPRINT_TAG) != stack_fingerprint:
+            continue
+        status = stack['StackStatus']
+        if status.endswith('_IN_PROGRESS') or status == 'DELETE_COMPLETE':
+            continue
+        if status not in REUSABLE_STATUSES or (max_age is not None and stack_age(stack) > max_age):
+            evict.append(stack['StackName'])
+        else:
+            reusable.append(stack)
+    if not reusable:
+        return None, evict
+    return min(reusable, key=stack_age), evict
+
+
+def purge(cloudformation, stem=None, older_than=None, dry_run=False):
+    """ Delete cached stacks
+
+    :param cloudformation: boto client for CloudFormation
+    :param stem: only stacks created with this stack_name_stem (default any)
+    :param older_than: only stacks created or updated more than this many hours ago (default any age)
+    :param dry_run: only report what would be deleted
+    :returns: names of the stacks deleted """
+    purged = []
+    for stack in cached_stacks(cloudformation, stem):
+        if stack['StackStatus'] in ('DELETE_COMPLETE', 'DELETE_IN_PROGRESS'):
+            continue
+        if older_than is not None and stack_age(stack) <= older_than:
+            continue
+        if not dry_run:
+            cloudformation.delete_stack(StackName=stack['StackName'])
+        purged.append(stack['StackName'])
+    return purged
@@ -0,0 +1,43 @@
+"""
+Incremental reader of CloudFormation stack events
+"""
+
+
+class StackEventStream:
+    """ Tails DescribeStackEvents for a stack.
+
+    DescribeStackEvents returns the newest events first, so each read pages forward only until it reaches the
+    newest event returned by the previous read.  Events are never read twice and are handed out oldest first. """
+
+    def __init__(self, cloudformation, stack_name):
+        """ Constructor
+
+        :param cloudformation: boto client for cloudformation
+        :param stack_name: stack name or id """
+        self._cloudformation = cloudformation
+        self._stack_name = stack_name
+        self._cursor = None
+
+    def new_events(self):
+        """ Events that happened since the last call, oldest first """
+        events = []
+        kwargs = {'StackName': self._stack_name}
+        while True:
+            response = self._cloudformation.describe_stack_events(**kwargs)
+            for event in response['StackEvents']:
+                if event['EventId'] == self._cursor:
+                    return self._advance(events)
+                events.append(event)
+            if not response.get('NextToken'):
+                return self._advance(events)
+            kwargs['NextToken'] = response['NextToken']
+
+    def _advance(self, events):
+        if events:
+            self._cursor = events[0]['EventId']
+        return list(reversed(events))
+
+
+def is_stack_event(event):
+    """ True if the event is about the stack itself rather than one of its resources """
+    return event['ResourceType'] == 'AWS::CloudFormation::Stack' and event['PhysicalResourceId'] == event['StackId']
@@ -0,0 +1,297 @@
+"""
+CloudFormationStackGraph decorator: several dependent stacks created along their dependency graph
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .cassette import active_cassette
+from .cloudformationstack import CloudFormationStack
+from .teardown import background_teardowns
+
+
+class NodeOutput:
+    """ A parameter value taken from an output of another node in the graph, resolved once that node
+    is created """
+
+    def __init__(self, node, output_key):
+        """ Constructor
+
+        :param node: name of the upstream node
+        :param output_key: key of the upstream stack output """
+        self.node = node
+        self.output_key = output_key
+
+    def __repr__(self):
+        return f'NodeOutput({self.node!r}, {self.output_key!r})'
+
+
+class StackNode:
+    """ One template in a CloudFormationStackGraph """
+
+    def __init__(self,
+                 relative_path_to_initial_condition_cfn_template,
+                 parameters=None,
+                 depends_on=(),
+                 stack_name_stem=None):
+        """ Constructor
+
+        :param relative_path_to_initial_condition_cfn_template: The relative path/name to the
+                                                                CloudFormation template to create.
+        :param parameters: Parameters to pass to CloudFormation.  A value may be
+                           NodeOutput(node, output_key), which also makes this node depend on that
+                           node.
+        :param depends_on: names of nodes that must be created before this one, beyond those
+                           referenced by parameters
+        :param stack_name_stem: CloudFormation stack name stem (default the graph's stem followed by
+                                the node name) """
+        self.relative_path_to_initial_condition_cfn_template = \
+            relative_path_to_initial_condition_cfn_template
+        self.parameters = parameters if parameters else {}
+        self.depends_on = tuple(depends_on)
+        self.stack_name_stem = stack_name_stem
+
+    def dependencies(self):
+        """ Names of the nodes this node needs created first """
+        referenced = [value.node for value in self.parameters.values()
+                      if isinstance(value, NodeOutput)]
+        return set(self.depends_on) | set(referenced)
+
+    def resolve_parameters(self, outputs):
+        """ Parameters with every NodeOutput replaced by the upstream value
+
+        :param outputs: dict of node name to that node's stack outputs """
+        resolved = {}
+        for key, value in self.parameters.items():
+            if isinstance(value, NodeOutput):
+                if value.output_key not in outputs[value.node]:
+                    raise ValueError(f'node {value.node} has no output {value.output_key} '
+                                     f'for parameter {key}')
+                value = outputs[value.node][value.output_key]
+            resolved[key] = value
+        return resolved
+
+
+def topological_order(dependencies):
+    """ Node names ordered so that every node comes after its dependencies
+
+    :param dependencies: dict of node name to the set of node names it depends on
+    :raises: ValueError for unknown dependencies or cycles """
+    for node, needs in dependencies.items():
+        unknown = set(needs) - set(dependencies)
+        if unknown:
+            raise ValueError(f'node {node} depends on unknown node(s) {", ".join(sorted(unknown))}')
+    remaining = {node: set(needs) for node, needs in dependencies.items()}
+    order = []
+    while remaining:
+        ready = sorted(node for node, needs in remaining.items() if not needs)
+        if not ready:
+            raise ValueError(f'dependency cycle between nodes {", ".join(sorted(remaining))}')
+        for node in ready:
+            del remaining[node]
+            order.append(node)
+        for needs in remaining.values():
+            needs.difference_update(ready)
+    return order
+
+
+def run_graph(dependencies, work, max_workers=None, halt_on_error=True):
+    """ Call work(node) for every node as soon as all of its dependencies are done, as many at once
+    as allowed
+
+    :param dependencies: dict of node name to the set of node names it depends on
+    :param work: callable(node) returning that node's result
+    :param max_workers: maximum concurrent calls (default one per node)
+    :param halt_on_error: start nothing new after the first failure; otherwise a failed node counts
+                          as done
+    :returns: (results, errors), dicts of node name to result and to exception.  Nodes never
+              started are in neither """
+    remaining = {node: set(needs) for node, needs in dependencies.items()}
+    results = {}
+    errors = {}
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(dependencies), 1),
+                            thread_name_prefix='potemkin-graph') as executor:
+        while True:
+            if not (errors and halt_on_error):
+                for node in sorted(node for node, needs in remaining.items() if not needs):
+                    del remaining[node]
+                    in_flight[executor.submit(work, node)] = node
+            if not in_flight:
+                return results, errors
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = in_flight.pop(future)
+                try:
+                    results[node] = future.result()
+                except Exception as error:
+                    errors[node] = error
+                    if halt_on_error:
+                        continue
+                for needs in remaining.values():
+                    needs.discard(node)
+
+
+class CloudFormationStackGraph:
+    """Decorator that spins up a graph of dependent CloudFormation stacks for initial conditions,
+    then tears them down after test.
+
+    Each stack is created as soon as the stacks it depends on are, so independent stacks are created
+    concurrently and the wait is the longest chain of dependent stacks rather than the sum of all of
+    them.  Teardown runs in reverse: each stack is deleted once every stack depending on it is
+    gone. """
+
+    def __init__(self,
+                 nodes,
+                 stack_name_stem=None,
+                 aws_profile=None,
+                 teardown=True,
+                 teardown_fail=True,
+                 timeout=5,
+                 max_workers=None,
+                 background_teardown=False,
+                 wait_strategy=None,
+                 fail_fast=True,
+                 delete_failed_stack=False):
+        """ Constructor
+
+        :param nodes: dict of node name to StackNode
+        :param stack_name_stem: CloudFormation stack name stem, followed by the node name unless the
+                                node sets its own.
+        :param aws_profile: The aws profile to use. If None, uses current environment.
+        :param teardown: Teardown resources after test completion. (default True)
+        :param teardown_fail: Teardown resources after tests complete with one or more failure. If
+                              False, overrides teardown. (default True)
+        :param timeout: Cloudformation waiter timeout in minutes, per stack (default 5)
+        :param max_workers: Maximum concurrent stack creations and deletions. (default one per node)
+        :param background_teardown: Delete the stacks in the background instead of waiting for the
+                                    deletes to complete.  Dependents are still deleted before the
+                                    stacks they depend on.  Failures are reported at the end of the
+                                    session. (default False)
+        :param wait_strategy: How to poll while stacks are created and deleted, see
+                              CloudFormationStack
+        :param fail_fast: Raise StackCreationError as soon as the first resource of any stack fails
+                          (default True)
+        :param delete_failed_stack: When fail_fast aborts a creation, start deleting that stack in
+                                    the background. (default False)
+        :raises: ValueError if nodes reference unknown nodes or form a cycle """
+        self._nodes = dict(nodes)
+        self._dependencies = {name: node.dependencies() for name, node in self._nodes.items()}
+        self._order = topological_order(self._dependencies)
+        self._stack_name = stack_name_stem if stack_name_stem else ''
+        self._aws_profile = aws_profile
+        self._teardown = teardown
+        self._teardown_fail = teardown_fail
+        self._timeout = timeout
+        self._max_workers = max_workers
+        self._background_teardown = background_teardown
+        self._wait_strategy = wait_strategy
+        self._fail_fast = fail_fast
+        self._delete_failed_stack = delete_failed_stack
+
+    def __call__(self, user_defined_test_function):
+        """ Create the graph, invoke the test with every node's outputs and stack name, then tear
+        the graph down
+
+        The test is called as test(stack_outputs, stack_names), both dicts keyed by node name """
+
+        def decorated_test_function():
+            stacks, stack_names, stack_outputs = self._create_graph()
+            if active_cassette().replaying:
+                user_defined_test_function(stack_outputs, stack_names)
+                return
+            try:
+                user_defined_test_function(stack_outputs, stack_names)
+            except Exception as error:
+                print(error)
+                self._teardown_graph(stacks, stack_names, failed=True)
+                raise
+            self._teardown_graph(stacks, stack_names)
+
+        decorated_test_function.potemkin_group = None
+        return decorated_test_function
+
+    def _node_stack(self, name, parameters):
+        """ The CloudFormationStack creating and deleting one node, with resolved parameters """
+        node = self._nodes[name]
+        stem = node.stack_name_stem if node.stack_name_stem else f'{self._stack_name}{name}'
+        return CloudFormationStack(
+            node.relative_path_to_initial_condition_cfn_template,
+            stack_name_stem=stem,
+            parameters=parameters,
+            aws_profile=self._aws_profile,
+            teardown=self._teardown,
+            teardown_fail=self._teardown_fail,
+            timeout=self._timeout,
+            wait_strategy=self._wait_strategy,
+            fail_fast=self._fail_fast,
+            delete_failed_stack=self._delete_failed_stack
+        )
+
+    def _create_graph(self):
+        """ Create every node once its dependencies exist, or replay them from the active cassette
+
+        :returns: (stacks, stack_names, stack_outputs), dicts keyed by node name
+        :raises: the first creation error, after tearing down the stacks already created """
+        cassette = active_cassette()
+        stacks = {}
+        stack_names = {}
+        stack_outputs = {}
+
+        def create(name):
+            parameters = self._nodes[name].resolve_parameters(stack_outputs)
+            stack = self._node_stack(name, parameters)
+            if cassette.replaying:
+                stack_name, outputs = cassette.stack(stack._cassette_key())
+            else:
+                stack_name = stack._unique_stack_name(stack._stack_name)
+                outputs = stack._create_stack(
+                    stack_name=stack_name,
+                    parameters=parameters,
+                    template_body=stack._template_body()
+                )
+                if cassette.recording:
+                    cassette.record_stack(stack._cassette_key(), stack_name, outputs)
+            stacks[name] = stack
+            stack_names[name] = stack_name
+            stack_outputs[name] = outputs
+
+        _, errors = run_graph(self._dependencies, create, max_workers=self._max_workers)
+        if errors:
+            for name, error in errors.items():
+                print(f'Node {name} failed to create: {error}')
+            self._teardown_graph(stacks, stack_names, failed=True)
+            raise errors[min(errors, key=self._order.index)]
+        return stacks, stack_names, stack_outputs
+
+    def _teardown_graph(self, stacks, stack_names, failed=False):
+        """ Tear down the created nodes, each once every created node depending on it is gone.
+        With background_teardown the whole walk runs as one background teardown, so the order still
+        holds
+
+        :param stacks: dict of node name to CloudFormationStack, only the nodes that were created
+        :param stack_names: dict of node name to stack name
+        :param failed: True if the test, or the creation of another node, failed
+        :raises: the first deletion error """
+        if self._background_teardown:
+            description = f'CloudFormation stack graph {", ".join(sorted(stack_names.values()))}'
+            background_teardowns.submit(description, self._delete_graph, stacks, stack_names,
+                                        failed, raise_errors=True)
+            return
+        self._delete_graph(stacks, stack_names, failed, raise_errors=not failed)
+
+    def _delete_graph(self, stacks, stack_names, failed, raise_errors):
+        """ Delete the nodes in reverse dependency order, waiting for each delete to complete before
+        the stacks it depends on are deleted, see _teardown_graph """
+        dependents = {name: {dependent for dependent in stacks
+                             if name in self._dependencies[dependent]}
+                      for name in stacks}
+
+        def delete(name):
+            if not stacks[name]._keeps_stack(failed):
+                stacks[name]._delete_stack(stack_name=stack_names[name])
+
+        _, errors = run_graph(dependents, delete, max_workers=self._max_workers,
+                              halt_on_error=False)
+        for name, error in errors.items():
+            print(f'Node {name} failed to delete: {error}')
+        if errors and raise_errors:
+            raise errors[max(errors, key=self._order.index)]
@@ -0,0 +1,154 @@
+"""
+Pools of pre-provisioned CloudFormation stacks that tests lease instead of waiting on stack creation
+"""
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StackPool:
+    """ Keeps up to size stacks of one template created ahead of the tests that need them.
+
+    Creations run in a background thread pool, at most max_in_flight at a time.  Each test leases a ready stack
+    (blocking only if none is ready yet) and the pool immediately starts a replacement, so creation of the next
+    stack overlaps with the current test.  The pool never creates more stacks than registered tests still need. """
+
+    def __init__(self, create, size=2, max_in_flight=None):
+        """ Constructor
+
+        :param create: callable returning (stack_name, outputs) for a newly created stack
+        :param size: number of stacks to keep ready or being created (default 2)
+        :param max_in_flight: maximum concurrent stack creations (default size) """
+        if size < 1:
+            raise ValueError('pool size must be at least 1')
+        self._create = create
+        self._size = size
+        self._max_in_flight = max_in_flight if max_in_flight else size
+        self._executor = ThreadPoolExecutor(max_workers=self._max_in_flight)
+        self._condition = threading.Condition()
+        self._ready = []
+        self._in_flight = 0
+        self._demand = 0
+        self._draining = False
+
+    def register(self):
+        """ Record one more (future) test that will lease a stack """
+        with self._condition:
+            self._demand += 1
+
+    def reset_demand(self):
+        """ Forget the tests registered so far, before registering them again """
+        with self._condition:
+            self._demand = 0
+
+    def warm(self):
+        """ Start creating stacks ahead of the first lease """
+        with self._condition:
+            self._replenish()
+
+    def lease(self):
+        """ Take a ready stack out of the pool, waiting for one if necessary
+
+        :returns: (stack_name, outputs)
+        :raises: the creation error if the stack handed to this lease failed to create """
+        with self._condition:
+            if self._draining:
+                raise RuntimeError('stack pool is drained')
+            self._demand = max(self._demand, 1)
+            self._replenish()
+            while not self._ready and not self._draining:
+                self._condition.wait()
+            if not self._ready:
+                raise RuntimeError('stack pool is drained')
+            stack, error = self._ready.pop(0)
+            self._demand -= 1
+            self._replenish()
+        if error is not None:
+            raise error
+        return stack
+
+    def drain(self, teardown):
+        """ Stop creating stacks, wait for creations in flight and tear down every stack nobody leased
+
+        :param teardown: callable(stack_name) deleting an unleased stack """
+        with self._condition:
+            self._draining = True
+            self._condition.notify_all()
+            while self._in_flight:
+                self._condition.wait()
+            leftovers = [stack for stack, error in self._ready if error is None]
+            self._ready = []
+        self._executor.shutdown(wait=True)
+        for stack_name, _ in leftovers:
+            teardown(stack_name)
+
+    def _replenish(self):
+        """ Submit creations until ready + in flight covers the remaining demand; caller holds the condition """
+        if self._draining:
+            return
+        target = min(self._size, self._demand)
+        while len(self._ready) + self._in_flight < target and self._in_flight < self._max_in_flight:
+            self._in_flight += 1
+            self._executor.submit(self._create_one)
+
+    def _create_one(self):
+        """ Background creation of one pooled stack """
+        try:
+            result = (self._create(), None)
+        except Exception as error:
+            result = (None, error)
+        with self._condition:
+            self._in_flight -= 1
+            self._ready.append(result)
+            self._replenish()
+            self._condition.notify_all()
+
+
+class StackPoolRegistry:
+    """ One StackPool per stack fingerprint, drained together at the end of the session """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._atexit_registered = False
+
+    def pool(self, key, create, teardown, size, max_in_flight=None):
+        """ Return the pool for key, making it on first use
+
+        :param key: stack fingerprint
+        :param create: callable returning (stack_name, outputs)
+        :param teardown: callable(stack_name) used to delete unleased stacks when draining
+        :param size: pool size
+        :param max_in_flight: maximum concurrent creations """
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = (StackPool(create, size=size, max_in_flight=max_in_flight), teardown)
+                if not self._atexit_registered:
+                    atexit.register(self.drain_all)
+                    self._atexit_registered = True
+            return self._pools[key][0]
+
+    def reset_demand(self):
+        """ Forget the tests registered so far with every known pool """
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool, _ in pools:
+            pool.reset_demand()
+
+    def warm_all(self):
+        """ Start pre-provisioning for every known pool """
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool, _ in pools:
+            pool.warm()
+
+    def drain_all(self):
+        """ Drain every pool and forget about it """
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool, teardown in pools:
+            pool.drain(teardown)
+
+
+stack_pools = StackPoolRegistry()
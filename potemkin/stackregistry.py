@@ -0,0 +1,159 @@
+"""
+Registry of CloudFormation stacks shared between tests for the lifetime of a test session
+"""
+import atexit
+import threading
+
+
+class _SharedStack:
+    """ A live stack and the bookkeeping needed to know when its last user is done """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+        self.failed = False
+        self.created = False
+        self.error = None
+        self.stack_name = None
+        self.outputs = None
+        self.teardown = None
+
+
+class SharedStackRegistry:
+    """ Reference counted stacks keyed by a fingerprint of template, parameters and profile.
+
+    Every decorated test registers itself at decoration time, so the registry knows how many users a stack
+    has before the first one runs.  Under pytest the plugin recounts them from the selected tests.  The first
+    test to acquire a key creates the stack, the others reuse it, and the last one to release it tears it
+    down.  Anything still alive at the end of the session (deselected or skipped tests never release) is torn
+    down by teardown_all. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks = {}
+        self._atexit_registered = False
+
+    def _entry(self, key):
+        with self._lock:
+            if key not in self._stacks:
+                self._stacks[key] = _SharedStack()
+            return self._stacks[key]
+
+    def register(self, key):
+        """ Record one more (future) user of the stack for key """
+        entry = self._entry(key)
+        with entry.lock:
+            entry.users += 1
+
+    def reset_users(self):
+        """ Forget the users registered so far for stacks not yet created, before registering them again """
+        with self._lock:
+            entries = list(self._stacks.values())
+        for entry in entries:
+            with entry.lock:
+                if not entry.created:
+                    entry.users = 0
+
+    def acquire(self, key, create, teardown):
+        """ Return (stack_name, outputs) for key, creating the stack on first use
+
+        :param key: stack fingerprint
+        :param create: callable returning (stack_name, outputs), only invoked by the first user
+        :param teardown: callable(stack_name, failed) invoked once the last user releases the stack """
+        entry = self._entry(key)
+        with entry.lock:
+            if not entry.created and entry.error is None:
+                try:
+                    entry.stack_name, entry.outputs = create()
+                    entry.created = True
+                    entry.teardown = teardown
+                    self._register_atexit()
+                except Exception as error:
+                    entry.error = error
+            if entry.error is not None:
+                entry.users -= 1
+                raise entry.error
+            return entry.stack_name, entry.outputs
+
+    def release(self, key, failed=False):
+        """ Give up one use of the stack for key, tearing it down if this was the last user
+
+        :param key: stack fingerprint
+        :param failed: True if the test using the stack failed """
+        entry = self._entry(key)
+        with entry.lock:
+            entry.users -= 1
+            entry.failed = entry.failed or failed
+            if entry.users > 0:
+                return
+            self._teardown_entry(entry)
+
+    def teardown_all(self):
+        """ Tear down every stack that is still alive regardless of remaining users """
+        with self._lock:
+            entries = list(self._stacks.values())
+        for entry in entries:
+            with entry.lock:
+                self._teardown_entry(entry)
+
+    def _teardown_entry(self, entry):
+        """ Tear down the entry's stack once; caller must hold entry.lock """
+        if not entry.created:
+            return
+        entry.created = False
+        entry.users = 0
+        entry.teardown(entry.stack_name, entry.failed)
+
+    def _register_atexit(self):
+        """ Make sure stacks get cleaned up even when the pytest plugin is not loaded """
+        with self._lock:
+            if not self._atexit_registered:
+                atexit.register(self.teardown_all)
+                self._atexit_registered = True
+
+
+shared_stacks = SharedStackRegistry()
+
+
+class _ReusedStack:
+    """ A long lived stack that is updated to each test's parameters """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stack_name = None
+        self.parameters = None
+        self.outputs = None
+        self.failed = False
+        self.teardown = None
+
+
+class ReusedStackRegistry:
+    """ One long lived stack per template and profile, used by one test at a time and torn down at session end """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks = {}
+        self._atexit_registered = False
+
+    def stack(self, key):
+        """ The reused stack entry for key; hold its lock while creating, updating or using the stack """
+        with self._lock:
+            if key not in self._stacks:
+                self._stacks[key] = _ReusedStack()
+                if not self._atexit_registered:
+                    atexit.register(self.teardown_all)
+                    self._atexit_registered = True
+            return self._stacks[key]
+
+    def teardown_all(self):
+        """ Tear down every reused stack """
+        with self._lock:
+            entries = list(self._stacks.values())
+        for entry in entries:
+            with entry.lock:
+                if entry.stack_name:
+                    stack_name, entry.stack_name = entry.stack_name, None
+                    entry.teardown(stack_name, entry.failed)
+
+
+reused_stacks = ReusedStackRegistry()
@@ -0,0 +1,81 @@
+"""
+Background teardown of initial conditions so tests don't wait on slow deletes
+"""
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TeardownError(Exception):
+    """ One or more background teardowns failed """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.name = 'teardown_error'
+
+    def __str__(self):
+        details = '\n'.join(f'  {description}: {error}' for description, error in self.failures)
+        return f'{self.name}: {len(self.failures)} teardown(s) failed\n{details}'
+
+
+class BackgroundTeardown:
+    """ Runs teardowns on a background executor and collects their failures until wait() is called """
+
+    def __init__(self, max_workers=8):
+        """ Constructor
+
+        :param max_workers: maximum concurrent teardowns (default 8) """
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = []
+
+    def submit(self, description, function, *args, **kwargs):
+        """ Start a teardown in the background and return its future
+
+        :param description: human readable name of what is being torn down, used when reporting failures
+        :param function: teardown callable
+        :returns: concurrent.futures.Future """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix='potemkin-teardown')
+                atexit.register(self._wait_at_exit)
+            future = self._executor.submit(function, *args, **kwargs)
+            self._pending.append((description, future))
+        return future
+
+    def pending(self):
+        """ Number of submitted teardowns that have not completed yet """
+        with self._lock:
+            return sum(1 for _, future in self._pending if not future.done())
+
+    def wait(self):
+        """ Block until every submitted teardown completes
+
+        :raises TeardownError: listing every teardown that failed """
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+        failures = []
+        for description, future in pending:
+            error = future.exception()
+            if error is not None:
+                failures.append((description, error))
+        if failures:
+            raise TeardownError(failures)
+
+    def _wait_at_exit(self):
+        """ Last chance barrier when the pytest plugin is not loaded """
+        try:
+            self.wait()
+        except TeardownError as error:
+            print(error)
+
+
+background_teardowns = BackgroundTeardown()
+
+
+def wait_for_teardowns():
+    """ Session end barrier: wait for all background teardowns and raise TeardownError if any failed """
+    background_teardowns.wait()
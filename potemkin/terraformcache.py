@@ -0,0 +1,131 @@
+"""
+Cache of initialized terraform roots and a shared provider plugin cache, safe across threads and processes
+"""
+import contextlib
+import os
+import re
+import shutil
+
+from .utilities import fingerprint
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+    import msvcrt
+
+
+COMPLETE_MARKER = '.potemkin-init-complete'
+INIT_BLOCK_PATTERN = re.compile(r'^\s*(module\s+"|provider\s+"|terraform\s*\{)', re.MULTILINE)
+PROVIDER_PREFIX_PATTERN = re.compile(r'^\s*(?:resource|data)\s+"([a-z0-9]+)_', re.MULTILINE)
+
+
+def default_cache_dir():
+    """ POTEMKIN_CACHE_DIR, or ~/.cache/potemkin """
+    return os.environ.get('POTEMKIN_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'potemkin'))
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """ Exclusive lock on path, held across threads and processes (pytest-xdist workers) """
+    with open(path, 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:  # pragma: no cover - windows
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:  # pragma: no cover - windows
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def init_fingerprint(root):
+    """ Hash of everything terraform init depends on.
+
+    That is the dependency lock file, the providers implied by resource and data types, the content of any
+    file declaring module, provider or terraform blocks, and the terraform executable itself.  Changes to
+    other resource definitions don't invalidate the cache.
+
+    :param root: terraform root directory """
+    lock_file = os.path.join(root, '.terraform.lock.hcl')
+    lock_content = None
+    if os.path.exists(lock_file):
+        with open(lock_file, 'r') as lock:
+            lock_content = lock.read()
+
+    init_files = []
+    provider_prefixes = set()
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories[:] = sorted(subdirectory for subdirectory in subdirectories if subdirectory != '.terraform')
+        for name in sorted(files):
+            if not (name.endswith('.tf') or name.endswith('.tf.json')):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, 'r') as terraform_file:
+                content = terraform_file.read()
+            provider_prefixes.update(PROVIDER_PREFIX_PATTERN.findall(content))
+            if INIT_BLOCK_PATTERN.search(content):
+                init_files.append((os.path.relpath(path, root), content))
+
+    executable = shutil.which('terraform')
+    executable_stat = os.stat(executable) if executable else None
+    return fingerprint(
+        lock_content,
+        sorted(provider_prefixes),
+        init_files,
+        [executable, executable_stat.st_size, executable_stat.st_mtime] if executable_stat else None
+    )
+
+
+class InitCache:
+    """ Runs terraform init once per init fingerprint and hands the result to every working copy.
+
+    The first working copy with a new fingerprint is initialized in the cache directory, under an exclusive
+    file lock so concurrent threads and workers wait instead of initializing too.  Every working copy then
+    gets a copy of the cached .terraform directory (providers are symlinks into the shared plugin cache) and
+    dependency lock file. """
+
+    def __init__(self, cache_dir=None):
+        """ Constructor
+
+        :param cache_dir: where to keep initialized roots and the plugin cache (default default_cache_dir()) """
+        self.directory = os.path.join(cache_dir if cache_dir else default_cache_dir(), 'terraform')
+        self.init_directory = os.path.join(self.directory, 'init')
+        self.plugin_cache_dir = os.environ.get('TF_PLUGIN_CACHE_DIR',
+                                               os.path.join(self.directory, 'plugin-cache'))
+        self._plugin_cache_lock = os.path.join(self.directory, 'plugin-cache.lock')
+
+    def environment(self):
+        """ Environment variables terraform needs to use the shared plugin cache """
+        return {'TF_PLUGIN_CACHE_DIR': self.plugin_cache_dir}
+
+    def prepare(self, working_copy, run_init):
+        """ Make working_copy initialized, running init only if the cache has no entry for its fingerprint
+
+        :param working_copy: terraform root to initialize
+        :param run_init: callable(directory) running terraform init in directory
+        :returns: True if the cache was used, False if init had to run """
+        os.makedirs(self.init_directory, exist_ok=True)
+        os.makedirs(self.plugin_cache_dir, exist_ok=True)
+        entry = os.path.join(self.init_directory, init_fingerprint(working_copy))
+
+        hit = True
+        with file_lock(f'{entry}.lock'):
+            if not os.path.exists(os.path.join(entry, COMPLETE_MARKER)):
+                hit = False
+                shutil.rmtree(entry, ignore_errors=True)
+                shutil.copytree(working_copy, entry)
+                with file_lock(self._plugin_cache_lock):
+                    run_init(entry)
+                open(os.path.join(entry, COMPLETE_MARKER), 'w').close()
+
+        if os.path.exists(os.path.join(entry, '.terraform')):
+            shutil.copytree(os.path.join(entry, '.terraform'), os.path.join(working_copy, '.terraform'),
+                            symlinks=True)
+        lock_file = os.path.join(entry, '.terraform.lock.hcl')
+        if os.path.exists(lock_file):
+            shutil.copy2(lock_file, working_copy)
+        return hit
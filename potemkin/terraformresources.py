@@ -1,11 +1,75 @@
 """
 TerraformResources decorator
 """
+import atexit
+import fnmatch
+import hashlib
 import time
 import os
-import subprocess
+import shutil
 import json
-import boto3
+import re
+import tempfile
+import threading
+
+from .cassette import active_cassette
+from .instrumentation import instrumentation
+from .teardown import background_teardowns
+from .terraformcache import InitCache
+from .terraformrunner import TerraformRunner
+from .utilities import fingerprint
+
+
+PLAN_FILE = 'potemkin.tfplan'
+DESTROY_ARGS = ['destroy', '-auto-approve', '-input=false']
+LOCAL_STATE_PATTERNS = ('.terraform', 'terraform.tfstate*', 'terraform.tfstate.d', '.terraform.tfstate.lock.info')
+BACKEND_PATTERN = re.compile(r'^\s*backend\s+"(\w+)"', re.MULTILINE)
+
+
+class _ReusedRoot:
+    """ Infrastructure kept alive between tests applying the same terraform root """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.working_copy = None
+        self.outputs = None
+        self.failed = False
+        self.teardown = None
+
+
+class ReusedRoots:
+    """ Working copies of terraform roots kept applied for the whole session and destroyed at its end """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roots = {}
+        self._atexit_registered = False
+
+    def root(self, key):
+        """ The reused root for key, created on first use """
+        with self._lock:
+            if key not in self._roots:
+                self._roots[key] = _ReusedRoot()
+                if not self._atexit_registered:
+                    atexit.register(self.teardown_all)
+                    self._atexit_registered = True
+            return self._roots[key]
+
+    def teardown_all(self):
+        """ Destroy every reused root, reporting rather than raising failures so every root gets its chance """
+        with self._lock:
+            roots = list(self._roots.values())
+        for root in roots:
+            with root.lock:
+                if root.working_copy:
+                    working_copy, root.working_copy = root.working_copy, None
+                    try:
+                        root.teardown(working_copy, root.failed)
+                    except Exception as error:
+                        print(f'Failed to destroy reused terraform root {working_copy}: {error}')
+
+
+reused_roots = ReusedRoots()
 
 
 class TerraformResources:
@@ -16,77 +80,292 @@ class TerraformResources:
                  parameters=None,
                  aws_profile=None,
                  teardown=True,
-                 teardown_fail=True):
+                 teardown_fail=True,
+                 background_teardown=False,
+                 working_dir=None,
+                 init_cache=True,
+                 cache_dir=None,
+                 timeout=None,
+                 reuse=False):
         """ Constructor
 
-        :param relative_path_to_terraform_root: directory containing terraform code.
+        :param relative_path_to_terraform_root: directory containing terraform code.  Every test runs terraform in its
+                                                own copy of this directory, with its own state, so tests can apply
+                                                the same root concurrently.  Local module sources must be inside it.
         :param parameters: Parameters to pass to terraform (requires variable block in terraform).
         :param aws_profile: The aws profile to use. If None, uses current environment.
         :param teardown: Teardown resources after test completion. (default True)
-        :param teardown_fail: Teardown resources after tests complete with one or more failure. If False, overrides teardown. (default True)"""
+        :param teardown_fail: Teardown resources after tests complete with one or more failure. If False, overrides teardown. (default True)
+        :param background_teardown: Run terraform destroy in the background instead of waiting for it.  Failures are
+                                    reported at the end of the session. (default False)
+        :param working_dir: Directory to make the working copies in. (default system temporary directory)
+        :param init_cache: Only run terraform init when the lock file, providers or modules change, and share
+                           downloaded providers through TF_PLUGIN_CACHE_DIR. (default True)
+        :param cache_dir: Directory for the init and plugin caches. (default POTEMKIN_CACHE_DIR or ~/.cache/potemkin)
+        :param timeout: Deadline in minutes for each terraform command, after which terraform and its providers are
+                        killed. (default no deadline)
+        :param reuse: Keep the infrastructure alive for the next test applying the same root.  Before each test
+                      terraform plan checks for changes (e.g. different parameters) and only the diff is applied;
+                      nothing is applied if there are none.  Tests on the same root run one at a time and the
+                      infrastructure is destroyed at the end of the session. (default False)"""
 
         self._relative_path_to_terraform_root = relative_path_to_terraform_root
         self._aws_profile = aws_profile
         self._parameters = parameters if parameters else {}
         self._teardown = teardown
         self._teardown_fail = teardown_fail
+        self._background_teardown = background_teardown
+        self._working_dir = working_dir
+        self._init_cache = InitCache(cache_dir) if init_cache else None
+        self._timeout = timeout
+        self._reuse = reuse
 
     def __call__(self, user_defined_test_function):
         """ The heart of the matter to create the resources, invoke the pytest function and then destroy """
+        cassette = active_cassette()
+        if cassette.replaying:
+            return self._replayed(user_defined_test_function, cassette)
+        if cassette.recording:
+            user_defined_test_function = self._recorded(user_defined_test_function, cassette)
 
         def decorated_test_function():
-            os.chdir(self._relative_path_to_terraform_root)
-            self._terraform('init')
-            self._terraform_apply()
+            if self._reuse:
+                self._run_with_reused_root(user_defined_test_function)
+                return
+
+            working_copy = self._working_copy()
+            try:
+                self._terraform_init(working_copy)
+                tf_outputs = self._terraform_apply(working_copy)
+            except Exception:
+                print(f'terraform state left in {working_copy}')
+                raise
 
             try:
-                user_defined_test_function(
-                    tf_outputs=self._terraform_outputs())
+                with self._timer('test'):
+                    user_defined_test_function(tf_outputs=tf_outputs)
             except Exception as error:
                 print(error)
-                if self._teardown and self._teardown_fail:
-                    self._terraform('destroy -auto-approve')
+                self._terraform_destroy(working_copy, failed=True)
                 raise
 
-            if self._teardown:
-                self._terraform('destroy -auto-approve')
+            self._terraform_destroy(working_copy)
 
+        decorated_test_function.potemkin_group = fingerprint(*self._reused_root_key()) if self._reuse else None
         return decorated_test_function
 
-    def _terraform_apply(self):
-        """ Create terraform apply command with parameters """
-        vars = ''
+    def _cassette_key(self):
+        """ Roots are recorded per content of the root directory and parameters """
+        digest = hashlib.sha256()
+        root = os.path.join(os.getcwd(), self._relative_path_to_terraform_root)
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories[:] = sorted(name for name in subdirectories if not _local_state(name))
+            for name in sorted(files):
+                if _local_state(name):
+                    continue
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, root).encode('utf-8') + b'\0')
+                with open(path, 'rb') as root_file:
+                    digest.update(root_file.read())
+        return fingerprint(digest.hexdigest(), self._parameters)
+
+    def _recorded(self, user_defined_test_function, cassette):
+        """ Wrap the test to record the outputs it gets """
+        key = self._cassette_key()
+
+        def recorded_test_function(tf_outputs):
+            cassette.record_terraform(key, tf_outputs)
+            user_defined_test_function(tf_outputs=tf_outputs)
+
+        return recorded_test_function
+
+    def _replayed(self, user_defined_test_function, cassette):
+        """ Invoke the test with recorded outputs, without running terraform """
+        key = self._cassette_key()
+
+        def replayed_test_function():
+            tf_outputs = cassette.terraform(key)
+            with self._timer('test'):
+                user_defined_test_function(tf_outputs=tf_outputs)
+
+        replayed_test_function.potemkin_group = None
+        return replayed_test_function
+
+    def _reused_root_key(self):
+        """ Reused infrastructure is kept per root directory and profile """
+        return os.path.join(os.getcwd(), self._relative_path_to_terraform_root), self._aws_profile
+
+    def _run_with_reused_root(self, user_defined_test_function):
+        """ Reconverge the session wide infrastructure for this root to this test's parameters, then invoke the test """
+        root = reused_roots.root(self._reused_root_key())
+        with root.lock:
+            if root.working_copy is None:
+                root.working_copy = self._working_copy()
+                root.teardown = self._terraform_destroy
+                self._terraform_init(root.working_copy)
+                root.outputs = self._terraform_apply(root.working_copy)
+            else:
+                root.outputs = self._terraform_reconverge(root.working_copy, root.outputs)
+
+            try:
+                with self._timer('test'):
+                    user_defined_test_function(tf_outputs=root.outputs)
+            except Exception as error:
+                print(error)
+                root.failed = True
+                raise
+
+    def _terraform_reconverge(self, working_copy, outputs):
+        """ Plan against the live infrastructure and apply only if there are changes
+
+        :param working_copy: directory the infrastructure was applied from
+        :param outputs: outputs of the last apply
+        :returns: dictionary of outputs """
+        result = self._terraform(['plan', '-detailed-exitcode', '-input=false', f'-out={PLAN_FILE}'] +
+                                 self._var_args(), working_copy, ok_returncodes=(0, 2))
+        if result.returncode == 0:
+            print('terraform plan: no changes, skipping apply')
+            return outputs if outputs is not None else self._terraform_outputs(working_copy)
+        result = self._terraform(['apply', '-input=false', '-json', PLAN_FILE], working_copy, json_stream=True)
+        if result.outputs is None:
+            return self._terraform_outputs(working_copy)
+        return result.outputs
+
+    def _working_copy(self):
+        """ Copy the terraform root, minus any local state or .terraform directory, into a fresh directory """
+        root = os.path.join(os.getcwd(), self._relative_path_to_terraform_root)
+        working_copy = os.path.join(tempfile.mkdtemp(prefix='potemkin-tf-', dir=self._working_dir), 'root')
+        shutil.copytree(root, working_copy, ignore=shutil.ignore_patterns(*LOCAL_STATE_PATTERNS))
+        return working_copy
+
+    def _terraform_init(self, working_copy):
+        """ terraform init, through the init cache if enabled """
+        def init(directory):
+            self._terraform(['init', '-input=false'], directory)
+
+        if self._init_cache:
+            self._init_cache.prepare(working_copy, init)
+        else:
+            init(working_copy)
+        if _remote_backend(working_copy):
+            self._terraform(['workspace', 'new', _workspace(working_copy)], working_copy)
+
+    def _terraform_destroy(self, working_copy, failed=False):
+        """ Destroy unless teardown is disabled, or the test failed and teardown_fail is disabled
+
+        :param working_copy: directory terraform was applied in
+        :param failed: True if the test failed """
+        if self._destroys_now(working_copy, failed):
+            self._destroy_working_copy(working_copy)
+
+    def _destroys_now(self, working_copy, failed):
+        """ True if the caller is to destroy now, False if the state is left or the destroy was handed to the
+        background teardowns
+
+        :param working_copy: directory terraform was applied in
+        :param failed: True if the test failed """
+        if not self._teardown or (failed and not self._teardown_fail):
+            print(f'terraform state left in {working_copy}')
+            return False
+        if self._background_teardown:
+            background_teardowns.submit(f'terraform root {self._relative_path_to_terraform_root} ({working_copy})',
+                                        self._destroy_working_copy, working_copy)
+            return False
+        return True
+
+    def _destroy_working_copy(self, working_copy):
+        """ terraform destroy, then remove the working copy """
+        self._terraform(DESTROY_ARGS, working_copy)
+        self._remove_working_copy(working_copy)
+
+    def _remove_working_copy(self, working_copy):
+        """ Remove a destroyed working copy, and its workspace from a remote backend """
+        self._delete_workspace(working_copy)
+        shutil.rmtree(os.path.dirname(working_copy), ignore_errors=True)
+
+    def _delete_workspace(self, working_copy):
+        """ Remove the working copy's workspace, and so its state, from a remote backend """
+        if not _remote_backend(working_copy):
+            return
+        self._terraform(['workspace', 'select', 'default'], working_copy)
+        self._terraform(['workspace', 'delete', _workspace(working_copy)], working_copy)
+
+    def _terraform_apply(self, working_copy):
+        """ Apply with parameters, streaming machine readable progress
+
+        :returns: dictionary of outputs, collected from the apply stream """
+        result = self._terraform(self._apply_args(), working_copy, json_stream=True)
+        if result.outputs is None:
+            return self._terraform_outputs(working_copy)
+        return result.outputs
+
+    def _apply_args(self):
+        """ terraform apply arguments, with parameters """
+        return ['apply', '-auto-approve', '-input=false', '-json'] + self._var_args()
+
+    def _var_args(self):
+        """ -var arguments for the parameters """
+        args = []
         for param in self._parameters:
-            vars += f' -var {param}={self._parameters[param]}'
-        command = f'apply -auto-approve{vars}'
-        self._terraform(command)
+            args += ['-var', f'{param}={self._parameters[param]}']
+        return args
 
-    def _terraform_outputs(self):
+    def _terraform_outputs(self, working_copy):
         """ Get terraform outputs and convert to dict """
-        response = self._terraform('output -json')
-        output_dict = json.loads(response)
+        return self._parse_outputs(self._terraform(['output', '-json'], working_copy, capture=True).stdout)
+
+    @staticmethod
+    def _parse_outputs(response):
+        """ dict of output name to value from the stdout of terraform output -json """
+        output_dict = json.loads(response) if response else {}
         return {var: output_dict[var]["value"] for var in output_dict}
 
-    def _terraform(self, command):
-        """ Run terraform command, adding AWS_PROFILE to environment if aws_profile is specified """
+    def _terraform(self, args, cwd, **run_options):
+        """ Run terraform, adding AWS_PROFILE to environment if aws_profile is specified
+
+        :param args: list of terraform arguments
+        :param cwd: directory to run terraform in
+        :param run_options: passed on to TerraformRunner.run
+        :returns: TerraformResult """
+        runner = TerraformRunner(env=self._environment(),
+                                 timeout=self._timeout * 60 if self._timeout else None)
+        with self._timer(args[0]):
+            return runner.run(args, cwd, **run_options)
 
+    def _environment(self):
+        """ Environment for terraform: the current one, plus AWS_PROFILE and init cache settings """
         tf_env = os.environ.copy()
         if self._aws_profile:
             tf_env["AWS_PROFILE"] = self._aws_profile
+        if self._init_cache:
+            tf_env.update(self._init_cache.environment())
+        return tf_env
 
-        full_command = f'terraform {command}'
-        response = subprocess.run(full_command.split(" "),
-                                  stdout=subprocess.PIPE,
-                                  env=tf_env)
-        stdout = response.stdout.decode("utf-8") if response.stdout else ''
-        stderr = response.stderr.decode("utf-8") if response.stderr else ''
-        if response.returncode == 0:
-            print(f'terraform command: {full_command}')
-            print(stdout)
-            return stdout
-        else:
-            raise f'ERROR:\nstdout: {stdout}\n\nstderr: {stderr}'
+    def _timer(self, phase):
+        """ Time a phase of this root's lifecycle, see potemkin.instrumentation """
+        return instrumentation.timer('terraform', self._relative_path_to_terraform_root, phase)
 
     def _now(self):
         """ Integer format of current time """
         return int(round(time.time()))
+
+
+def _local_state(name):
+    """ True for files and directories terraform creates in a root, which are not part of its definition """
+    return any(fnmatch.fnmatch(name, pattern) for pattern in LOCAL_STATE_PATTERNS)
+
+
+def _remote_backend(root):
+    """ True if the root's terraform block configures a backend other than local, whose state every working
+    copy would otherwise share """
+    for name in sorted(os.listdir(root)):
+        if name.endswith('.tf'):
+            with open(os.path.join(root, name), 'r') as terraform_file:
+                if any(backend != 'local' for backend in BACKEND_PATTERN.findall(terraform_file.read())):
+                    return True
+    return False
+
+
+def _workspace(working_copy):
+    """ Name of the workspace a working copy keeps its remote state in, unique like its temporary directory """
+    return os.path.basename(os.path.dirname(working_copy))
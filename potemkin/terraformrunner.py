@@ -0,0 +1,180 @@
+"""
+Streaming terraform subprocess execution
+"""
+import json
+import os
+import signal
+import subprocess
+import threading
+from collections import deque
+
+
+STDERR_TAIL_LINES = 200
+KILL_GRACE_SECONDS = 10
+
+
+class TerraformError(Exception):
+    """ terraform exited with an error or ran past its deadline """
+
+    def __init__(self, command, returncode, stderr, diagnostics=None, timed_out=False):
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr
+        self.diagnostics = diagnostics if diagnostics else []
+        self.timed_out = timed_out
+        self.name = 'terraform_error'
+
+    def __str__(self):
+        reason = 'timed out' if self.timed_out else f'exited with {self.returncode}'
+        details = '\n'.join(self.diagnostics) if self.diagnostics else self.stderr
+        return f'{self.name}: {self.command} {reason}\n{details}'
+
+
+class TerraformResult:
+    """ What a terraform run produced """
+
+    def __init__(self):
+        self.stdout = ''
+        self.returncode = None
+        self.outputs = None
+        self.resource_timings = {}
+        self.diagnostics = []
+
+
+class TerraformRunner:
+    """ Runs terraform, handling its stdout line by line as it is produced instead of buffering it.
+
+    With json_stream, every line is a machine readable message (terraform apply/plan -json): progress and
+    per resource timings are printed live and the outputs are collected from the stream, so no separate
+    terraform output run is needed.  A deadline kills the whole process group, including providers. """
+
+    def __init__(self, env=None, timeout=None):
+        """ Constructor
+
+        :param env: environment for terraform (default current environment)
+        :param timeout: deadline in seconds for each terraform run (default no deadline) """
+        self._env = env
+        self._timeout = timeout
+
+    def run(self, args, cwd, json_stream=False, capture=False, ok_returncodes=(0,)):
+        """ Run terraform with args in cwd
+
+        :param args: list of terraform arguments, e.g. ['apply', '-auto-approve', '-json']
+        :param cwd: terraform root to run in
+        :param json_stream: stdout is terraform's machine readable message stream
+        :param capture: keep stdout in the result (only for small outputs, e.g. terraform output -json)
+        :param ok_returncodes: exit codes that are not errors
+        :returns: TerraformResult, with returncode set
+        :raises TerraformError: on any other exit code or when the deadline passes """
+        command = ' '.join(['terraform'] + args)
+        print(f'terraform command: {command}')
+        process = subprocess.Popen(['terraform'] + args,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   cwd=cwd,
+                                   env=self._env,
+                                   start_new_session=os.name == 'posix')
+
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        stderr_reader = threading.Thread(target=self._drain, args=(process.stderr, stderr_tail), daemon=True)
+        stderr_reader.start()
+        timed_out = threading.Event()
+        deadline = None
+        if self._timeout:
+            deadline = threading.Timer(self._timeout, self._kill, args=(process, timed_out))
+            deadline.daemon = True
+            deadline.start()
+
+        result = TerraformResult()
+        captured = []
+        try:
+            for raw_line in process.stdout:
+                self._handle_line(raw_line, result, json_stream, captured if capture else None)
+            returncode = process.wait()
+        except Exception:
+            self._kill(process, threading.Event())
+            raise
+        finally:
+            if deadline:
+                deadline.cancel()
+            stderr_reader.join()
+
+        result.stdout = '\n'.join(captured)
+        result.returncode = returncode
+        self._check_result(command, result, stderr_tail, timed_out.is_set(), ok_returncodes)
+        return result
+
+    def _handle_line(self, raw_line, result, json_stream, captured=None):
+        """ Act on one line of terraform's stdout: keep it, handle it as a -json message or print it
+
+        :param raw_line: the line as read from stdout, bytes
+        :param result: TerraformResult updated from -json messages
+        :param json_stream: stdout is terraform's machine readable message stream
+        :param captured: list to keep the line in, None to not keep stdout """
+        line = self._decode(raw_line)
+        if captured is not None:
+            captured.append(line)
+        if json_stream:
+            self._handle_message(line, result)
+        elif captured is None:
+            print(line)
+
+    @staticmethod
+    def _check_result(command, result, stderr_tail, timed_out, ok_returncodes):
+        """ Raise TerraformError unless terraform finished in time with an ok exit code """
+        if timed_out or result.returncode not in ok_returncodes:
+            raise TerraformError(command, result.returncode, '\n'.join(stderr_tail), result.diagnostics,
+                                 timed_out=timed_out)
+
+    def _handle_message(self, line, result):
+        """ Act on one terraform -json message """
+        try:
+            message = json.loads(line)
+        except ValueError:
+            print(line)
+            return
+        message_type = message.get('type')
+        if message_type == 'outputs':
+            outputs = message.get('outputs', {})
+            # the stream leaves out the values of sensitive outputs, terraform output -json has them
+            if any(output.get('sensitive') for output in outputs.values()):
+                result.outputs = None
+            else:
+                result.outputs = {name: output.get('value') for name, output in outputs.items()}
+        elif message_type in ('apply_complete', 'apply_errored'):
+            hook = message.get('hook', {})
+            address = hook.get('resource', {}).get('addr')
+            result.resource_timings[address] = hook.get('elapsed_seconds')
+            print(message.get('@message', line))
+        elif message_type == 'diagnostic':
+            diagnostic = message.get('diagnostic', {})
+            result.diagnostics.append(f'{diagnostic.get("summary", "")}: {diagnostic.get("detail", "")}')
+            print(message.get('@message', line))
+        elif message_type in ('apply_start', 'change_summary', 'planned_change', 'resource_drift'):
+            print(message.get('@message', line))
+
+    @staticmethod
+    def _decode(raw_line):
+        """ One line of terraform's output as text, without the line ending """
+        return raw_line.decode('utf-8', errors='replace').rstrip('\n')
+
+    @classmethod
+    def _drain(cls, stream, tail):
+        """ Read a stream to the end, keeping only its last lines """
+        for raw_line in stream:
+            tail.append(cls._decode(raw_line))
+
+    @staticmethod
+    def _kill(process, timed_out):
+        """ Deadline passed: terminate terraform and its providers, then kill them if they linger """
+        timed_out.set()
+        if os.name != 'posix':
+            process.kill()
+            return
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
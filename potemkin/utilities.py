@@ -1,6 +1,11 @@
 """ Utilities not specific to an aws Service """
+import functools
+import hashlib
+import inspect
+import json
 from random import randint
-from time import sleep
+
+from .retry import RetryPolicy
 
 
 def random_name(name, digits=10):
@@ -11,33 +16,88 @@ def random_name(name, digits=10):
     return f'{name}{randint(range_low, range_high)}'
 
 
+def fingerprint(*parts):
+    """ Stable sha256 hex digest of the given json serializable parts, e.g. template content and parameters """
+
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def package_version():
+    """ Installed version of potemkin-decorator, 'unknown' when running from an uninstalled tree """
+
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:  # python < 3.8
+        try:
+            import pkg_resources
+            return pkg_resources.get_distribution('potemkin-decorator').version
+        except Exception:
+            return 'unknown'
+    try:
+        return version('potemkin-decorator')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
 class WaitUntilTrueException(Exception):
     """ Custom exception for wait_until_true function"""
 
-    def __init__(self, value):
+    def __init__(self, value, outcome=None):
         self.value = value
+        self.outcome = outcome
         self.name = 'wait_until_true_exception'
 
     def __str__(self):
         return f'{self.name}: {self.value}'
 
 
-def wait_until_true(function, wait_period=20, attempts=15):
+def wait_until_true(function=None, wait_period=20, attempts=15, backoff=None, deadline=None,
+                    retry_on=(), predicate=bool, policy=None):
     """
     Decorator that sleeps and retries a function until the return value returns a truthy value or
     it times out and raises an exception.
 
+    Use it bare, @wait_until_true, or with arguments, @wait_until_true(attempts=5, deadline=60).
+    Coroutine functions are retried with asyncio.sleep.  The RetryOutcome of the latest call, with
+    its attempts and seconds waited, is kept in the wrapper's last_outcome attribute.
+
     :param wait_period: time to wait between attempts (default 20 seconds)
-    :param attempts: number of attempts before erroring
+    :param attempts: number of attempts before erroring, None for the deadline alone (default 15)
+    :param backoff: wait strategy instead of wait_period, e.g. potemkin.waiters.DecorrelatedJitter()
+                    (optional)
+    :param deadline: seconds after which no attempt is started (optional)
+    :param retry_on: exception types to retry, or callable(exception) returning True to retry
+                     (default none)
+    :param predicate: callable(return value) returning True when it is acceptable
+                      (default truthiness)
+    :param policy: potemkin.retry.RetryPolicy, instead of the arguments above (optional)
     :returns: functions response or raises error if all attempts do not result in a truthy value
     """
+    if policy is None:
+        policy = RetryPolicy(wait_period=wait_period, attempts=attempts, backoff=backoff,
+                             deadline=deadline, retry_on=retry_on, predicate=predicate)
+
+    def decorate(function):
+        def result(outcome):
+            wrapper.last_outcome = outcome
+            if not outcome.satisfied:
+                raise WaitUntilTrueException('all retries used', outcome) from outcome.exception
+            return outcome.value
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                return result(await policy.run_async(function, *args, **kwargs))
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                return result(policy.run(function, *args, **kwargs))
 
-    def wrapper(*args, **kwargs):
-        for _ in range(attempts):
-            return_value = function(*args, **kwargs)
-            if return_value:
-                return return_value
-            sleep(wait_period)
-        raise WaitUntilTrueException('all retries used')
+        wrapper.last_outcome = None
+        return wrapper
 
-    return wrapper
+    return decorate(function) if function is not None else decorate
@@ -0,0 +1,149 @@
+"""
+Wait strategies for polling and retrying, and a waiter polling CloudFormation until a stack settles
+"""
+import random
+import re
+import time
+
+
+RESOURCE_TYPE_PATTERN = re.compile(r'''["']?Type["']?\s*:\s*["']?([A-Za-z0-9]+::[A-Za-z0-9]+::[A-Za-z0-9:]+)''')
+
+
+def template_resource_types(template_body):
+    """ Resource types declared in a yml or json CloudFormation template
+
+    :param template_body: template content
+    :returns: set of resource types, e.g. {'AWS::EC2::EIP'} """
+    return set(RESOURCE_TYPE_PATTERN.findall(template_body))
+
+
+class SystemClock:
+    """ Real time """
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class FixedDelay:
+    """ Poll at a fixed period.  FixedDelay(20) reproduces the original botocore waiter configuration """
+
+    def __init__(self, delay=20):
+        """ Constructor
+
+        :param delay: seconds between polls (default 20) """
+        self._delay = delay
+
+    def delays(self, resource_types=()):
+        """ Generate successive sleep periods
+
+        :param resource_types: resource types in the stack (unused) """
+        while True:
+            yield self._delay
+
+
+class AdaptiveBackoff:
+    """ Exponential backoff with jitter starting from a short delay.
+
+    When resource_hints gives expected creation times for resource types in the template, the first poll
+    is postponed until the slowest of them is expected to be done, then polling backs off from initial_delay. """
+
+    def __init__(self,
+                 initial_delay=2,
+                 multiplier=1.5,
+                 max_delay=10,
+                 jitter=0.2,
+                 resource_hints=None,
+                 rng=None):
+        """ Constructor
+
+        :param initial_delay: first sleep period in seconds (default 2)
+        :param multiplier: growth factor applied to each successive sleep period (default 1.5)
+        :param max_delay: upper bound for a sleep period in seconds (default 10)
+        :param jitter: fraction by which a sleep period is randomly shortened or lengthened (default 0.2)
+        :param resource_hints: dictionary of resource type: expected seconds to create (optional)
+        :param rng: random.Random instance, for deterministic jitter (optional) """
+        self._initial_delay = initial_delay
+        self._multiplier = multiplier
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self._resource_hints = resource_hints if resource_hints else {}
+        self._rng = rng if rng else random.Random()
+
+    def expected_duration(self, resource_types):
+        """ Longest hinted duration among resource_types, 0 if none are hinted """
+        return max([self._resource_hints.get(resource_type, 0) for resource_type in resource_types], default=0)
+
+    def delays(self, resource_types=()):
+        """ Generate successive sleep periods
+
+        :param resource_types: resource types in the stack, looked up in resource_hints """
+        expected = self.expected_duration(resource_types)
+        if expected > self._initial_delay:
+            yield expected
+        delay = self._initial_delay
+        while True:
+            yield self._jittered(delay)
+            delay = min(delay * self._multiplier, self._max_delay)
+
+    def _jittered(self, delay):
+        spread = delay * self._jitter
+        return max(0, delay + self._rng.uniform(-spread, spread))
+
+
+class DecorrelatedJitter:
+    """ Decorrelated jitter backoff: each sleep is drawn between initial_delay and three times the
+    previous sleep, capped at max_delay.  Spreads out the retries of callers that failed at the same
+    moment """
+
+    def __init__(self, initial_delay=1, max_delay=20, rng=None):
+        """ Constructor
+
+        :param initial_delay: shortest sleep period in seconds (default 1)
+        :param max_delay: upper bound for a sleep period in seconds (default 20)
+        :param rng: random.Random instance, for deterministic jitter (optional) """
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._rng = rng if rng else random.Random()
+
+    def delays(self, resource_types=()):
+        """ Generate successive sleep periods
+
+        :param resource_types: resource types involved (unused) """
+        delay = self._initial_delay
+        while True:
+            delay = min(self._max_delay, self._rng.uniform(self._initial_delay, delay * 3))
+            yield delay
+
+
+class StackWaiter:
+    """ Polls until done or a deadline passes, sleeping according to a wait strategy """
+
+    def __init__(self, strategy=None, clock=None):
+        """ Constructor
+
+        :param strategy: FixedDelay, AdaptiveBackoff or anything with a delays(resource_types) generator
+                         (default AdaptiveBackoff())
+        :param clock: object with monotonic() and sleep(seconds), for testing (default SystemClock()) """
+        self.strategy = strategy if strategy else AdaptiveBackoff()
+        self.clock = clock if clock else SystemClock()
+
+    def wait(self, poll, deadline, resource_types=()):
+        """ Sleep, then poll, until poll reports done or the deadline is spent
+
+        :param poll: callable returning (done, value)
+        :param deadline: budget in seconds
+        :param resource_types: resource types involved, passed on to the strategy
+        :returns: (done, value) of the last poll """
+        start = self.clock.monotonic()
+        value = None
+        for delay in self.strategy.delays(resource_types):
+            remaining = deadline - (self.clock.monotonic() - start)
+            if remaining <= 0:
+                return False, value
+            self.clock.sleep(min(delay, remaining))
+            done, value = poll()
+            if done:
+                return True, value
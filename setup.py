@@ -12,6 +12,15 @@ setup(
       'boto3==1.12.26'
     ],
 
+    entry_points={
+      'pytest11': [
+        'potemkin = potemkin.pytest_plugin'
+      ],
+      'console_scripts': [
+        'potemkin = potemkin.cli:main'
+      ]
+    },
+
     author='Eric Kascic',
     author_email='eric.kascic@stelligent.com',
     description='Decorator to help for AWS/boto integration testing in pytest',
@@ -19,5 +28,5 @@ setup(
     long_description_content_type='text/markdown',
     url='https://github.com/stelligent/potemkin-decorator',
     license='MIT',
-    python_requires='>=3.6'
+    python_requires='>=3.7'
 )
\ No newline at end of file
@@ -0,0 +1,91 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from potemkin import aio
+from potemkin.waiters import FixedDelay
+
+from conftest import evaluation
+
+
+def _stack(cloudformation, template, **kwargs):
+    stack = aio.AsyncCloudFormationStack(template, stack_name_stem='TestStack',
+                                         wait_strategy=FixedDelay(0), **kwargs)
+    stack._cloudformation_client = cloudformation
+    return stack
+
+
+def test_stacks_provisioned_concurrently(cloudformation, template):
+    """ test several stacks come up at once on one event loop and are all deleted afterwards """
+    stacks = [_stack(cloudformation, template, parameters={'BucketName': f'bucket-{n}'})
+              for n in range(3)]
+
+    async def test():
+        async with contextlib.AsyncExitStack() as exit_stack:
+            provisioned = await asyncio.gather(*(exit_stack.enter_async_context(stack.provisioned())
+                                                 for stack in stacks))
+            assert len(cloudformation.created) == 3
+            assert not cloudformation.deleted
+            return provisioned
+
+    provisioned = asyncio.run(test())
+
+    assert [outputs for _, outputs in provisioned] == [{'BucketNameOut': 'bucket'}] * 3
+    assert sorted(cloudformation.deleted) == sorted(name for name, _ in provisioned)
+
+
+def test_decorated_async_test_gets_outputs(cloudformation, template):
+    """ test the decorator hands outputs to an async test and deletes the stack when it fails """
+    seen = []
+
+    async def test(stack_outputs, stack_name):
+        seen.append((stack_name, stack_outputs))
+        raise AssertionError('failed')
+
+    with pytest.raises(AssertionError):
+        asyncio.run(_stack(cloudformation, template)(test)())
+
+    assert seen == [(cloudformation.created[0], {'BucketNameOut': 'bucket'})]
+    assert cloudformation.deleted == cloudformation.created
+
+
+def test_terraform_roots_applied_concurrently(terraform_stub, terraform_root, tmp_path):
+    """ test two roots are applied by asyncio subprocesses at once and tests get their outputs """
+    seen = []
+
+    async def test(tf_outputs):
+        seen.append(tf_outputs)
+
+    async def run():
+        await asyncio.gather(*(
+            aio.AsyncTerraformResources(terraform_root, parameters={'name': str(n)},
+                                        working_dir=str(tmp_path))(test)()
+            for n in range(2)
+        ))
+
+    asyncio.run(run())
+
+    commands = [invocation['args'][0] for invocation in terraform_stub()]
+    assert seen == [{'EIPOutput': 'eipalloc-1'}] * 2
+    assert sorted(command for command in commands if command != 'init') == \
+        ['apply', 'apply', 'destroy', 'destroy']
+
+
+def test_rules_awaited_concurrently(configservice):
+    """ test waiting on several rules at once returns each rule's verdict """
+    configservice.results = {
+        'eip-attached': [evaluation('eipalloc-1')],
+        'ebs-encrypted': [evaluation('vol-1', 'COMPLIANT', rule_name='ebs-encrypted',
+                                     resource_type='AWS::EC2::Volume')]
+    }
+
+    verdicts = asyncio.run(aio.config_rules_wait_for_compliance_results(configservice, {
+        'eip-attached': {'eipalloc-1': 'NON_COMPLIANT'},
+        'ebs-encrypted': {'vol-1': 'NON_COMPLIANT'}
+    }, wait_period=0, max_attempts=2))
+
+    assert verdicts == {'eip-attached': True, 'ebs-encrypted': False}
+    found = asyncio.run(aio.config_rule_wait_for_resource(configservice, 'eipalloc-1',
+                                                          'eip-attached'))
+    assert found == evaluation('eipalloc-1')
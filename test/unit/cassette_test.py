@@ -0,0 +1,163 @@
+import json
+from datetime import datetime, timezone
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+
+from potemkin import cassette
+from potemkin import configservice as config
+from potemkin.cloudformationstack import CloudFormationStack
+from potemkin.instrumentation import instrumentation
+from potemkin.rulepoller import rule_pollers
+from potemkin.terraformresources import TerraformResources
+from potemkin.waiters import FixedDelay
+
+from conftest import evaluation
+
+
+RECORDED_AT = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+CONFIG_RESPONSES = {
+    'DescribeConfigRules': {'ConfigRules': []},
+    'GetComplianceDetailsByConfigRule': {'EvaluationResults': [{
+        'EvaluationResultIdentifier': {'EvaluationResultQualifier': {
+            'ConfigRuleName': 'eip-attached', 'ResourceType': 'AWS::EC2::EIP', 'ResourceId': 'eipalloc-1'
+        }},
+        'ComplianceType': 'NON_COMPLIANT',
+        'ResultRecordedTime': RECORDED_AT.timestamp()
+    }]}
+}
+
+
+class RawBody:
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+@pytest.fixture(autouse=True)
+def no_cassette(monkeypatch):
+    """ the active cassette is process wide, put the 'off' one back after each test """
+    monkeypatch.setattr(cassette, '_active', cassette.Cassette())
+
+
+def _config_client(sent, responses=None):
+    configservice = boto3.session.Session(region_name='us-east-1').client(
+        'config', aws_access_key_id='id', aws_secret_access_key='secret'
+    )
+    responses = CONFIG_RESPONSES if responses is None else responses
+
+    def send(request, **kwargs):
+        operation = request.headers['X-Amz-Target'].decode().split('.')[-1]
+        sent.append(operation)
+        return AWSResponse(request.url, 200, {}, RawBody(json.dumps(responses[operation]).encode()))
+
+    configservice.meta.events.register('before-send', send)
+    return configservice
+
+
+def test_stack_outputs_replayed_without_cloudformation(cloudformation, template, tmp_path):
+    """ test a recorded stack's outputs are handed to the test again on replay, creating nothing """
+    path = str(tmp_path / 'cassette.json')
+    seen = []
+
+    cassette.use_cassette(path, cassette.RECORD)
+    stack = CloudFormationStack(template, stack_name_stem='TestStack', wait_strategy=FixedDelay(0))
+    stack._cloudformation_client = cloudformation
+    stack(lambda outputs, name: seen.append((name, outputs)))()
+    cassette.active_cassette().save()
+
+    cassette.use_cassette(path, cassette.REPLAY)
+    stack = CloudFormationStack(template, stack_name_stem='TestStack', wait_strategy=FixedDelay(0))
+    stack._cloudformation_client = object()
+    stack(lambda outputs, name: seen.append((name, outputs)))()
+
+    assert len(cloudformation.created) == 1
+    assert seen[1] == seen[0]
+
+
+def test_config_responses_replayed_without_sending(tmp_path):
+    """ test config waiters get recorded responses back, datetimes included, with no requests sent """
+    path = str(tmp_path / 'cassette.json')
+    sent = []
+
+    cassette.use_cassette(path, cassette.RECORD)
+    recorded = config.config_rule_wait_for_resource(_config_client(sent), 'eipalloc-1', 'eip-attached')
+    cassette.active_cassette().save()
+    recorded_calls = len(sent)
+
+    config._rule_profiles.clear()
+    rule_pollers.clear()
+    cassette.use_cassette(path, cassette.REPLAY)
+    replayed = config.config_rule_wait_for_resource(_config_client(sent), 'eipalloc-1', 'eip-attached')
+
+    assert recorded_calls == 1
+    assert len(sent) == recorded_calls
+    assert replayed == recorded
+    assert replayed['ResultRecordedTime'] == RECORDED_AT
+
+
+def test_tests_waiting_on_one_rule_replay_their_own_responses(tmp_path, monkeypatch):
+    """ test a test waiting for a result and a later one waiting for its removal don't get each other's responses """
+    path = str(tmp_path / 'cassette.json')
+    removed = dict(CONFIG_RESPONSES, GetComplianceDetailsByConfigRule={'EvaluationResults': []})
+
+    def present():
+        monkeypatch.setattr(instrumentation, 'current_test', 'test_present')
+        return config.config_rule_wait_for_resource(_config_client([]), 'eipalloc-1', 'eip-attached')
+
+    def absent(responses=None):
+        monkeypatch.setattr(instrumentation, 'current_test', 'test_removed')
+        return config.config_rule_wait_for_absent_resources(_config_client([], responses), 'eip-attached',
+                                                            ['eipalloc-1'], wait_period=0, max_attempts=1)
+
+    cassette.use_cassette(path, cassette.RECORD)
+    recorded = present()
+    config._rule_profiles.clear()
+    rule_pollers.clear()
+    assert absent(removed) == []
+    cassette.active_cassette().save()
+
+    for replay in (absent, present):
+        config._rule_profiles.clear()
+        rule_pollers.clear()
+        cassette.use_cassette(path, cassette.REPLAY)
+        assert replay() == ([] if replay is absent else recorded)
+
+
+def test_recorded_calls_independent_of_earlier_tests(configservice, tmp_path):
+    """ test a recording test pages through the rule even when an earlier test taught the profile that
+    per resource lookups are cheaper, so replaying it alone asks for the same calls """
+    configservice.scopes['eip-attached'] = ['AWS::EC2::EIP']
+    configservice.results['eip-attached'] = [evaluation('eipalloc-2')]
+    profile = config._rule_profile(configservice, 'eip-attached')
+    profile.result_volume = 10000
+    configservice.calls.clear()
+
+    cassette.use_cassette(str(tmp_path / 'cassette.json'), cassette.RECORD)
+    config.scan_rule_results(configservice, 'eip-attached', ['eipalloc-1'])
+
+    assert [operation for operation, _ in configservice.calls] == ['get_compliance_details_by_config_rule']
+
+
+def test_terraform_outputs_replayed_without_terraform(terraform_stub, terraform_root, tmp_path):
+    """ test recorded terraform outputs are replayed until the root changes """
+    path = str(tmp_path / 'cassette.json')
+    seen = []
+
+    cassette.use_cassette(path, cassette.RECORD)
+    TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: seen.append(tf_outputs))()
+    cassette.active_cassette().save()
+    invocations = len(terraform_stub())
+
+    cassette.use_cassette(path, cassette.REPLAY)
+    TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: seen.append(tf_outputs))()
+    assert len(terraform_stub()) == invocations
+    assert seen == [{'EIPOutput': 'eipalloc-1'}] * 2
+
+    with open(f'{terraform_root}/main.tf', 'a') as main:
+        main.write('resource "aws_eip" "eip2" {}\n')
+    with pytest.raises(cassette.CassetteMissError):
+        TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: None)()
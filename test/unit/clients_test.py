@@ -0,0 +1,57 @@
+import threading
+
+import boto3
+
+from potemkin import configservice as config
+from potemkin.clients import ClientPool
+from conftest import evaluation
+
+
+REAL_SESSION = boto3.session.Session
+
+
+class FakeSession:
+    """ records sessions; clients are real ones for a fixed region, so profiles are never looked up """
+    created = []
+
+    def __init__(self, profile_name=None, region_name=None):
+        self.profile_name = profile_name
+        self.region_name = region_name
+        FakeSession.created.append(self)
+
+    def client(self, service, region_name=None, config=None):
+        return REAL_SESSION(region_name='us-east-1').client(service, config=config)
+
+
+def test_clients_shared_across_threads_sessions_per_thread(monkeypatch):
+    """ test one client per profile, region and service for every thread, built from per thread sessions """
+    monkeypatch.setattr('boto3.session.Session', FakeSession)
+    FakeSession.created = []
+    pool = ClientPool(max_pool_connections=64)
+    clients = []
+    sessions = []
+
+    def use_pool():
+        clients.append(pool.client('config'))
+        sessions.append(pool.session())
+
+    threads = [threading.Thread(target=use_pool) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].meta.service_model.service_name == 'config'
+    assert clients[0].meta.config.max_pool_connections == 64
+    assert len({id(session) for session in sessions}) == 4
+    assert pool.client('config', profile='dev') is not clients[0]
+    assert pool.client('cloudformation') is not clients[0]
+
+
+def test_config_helpers_use_pooled_client_when_none_given(configservice, monkeypatch):
+    """ test passing None for the client uses the pooled AWS Config client """
+    monkeypatch.setattr(config, 'client', lambda service: configservice)
+    configservice.results['eip-attached'] = [evaluation('eipalloc-1')]
+
+    assert config.config_rule_wait_for_resource(None, 'eipalloc-1', 'eip-attached') == evaluation('eipalloc-1')
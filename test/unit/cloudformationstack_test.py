@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from potemkin.cloudformationstack import CloudFormationStack
+from potemkin.reaper import stem_pattern
+from potemkin.stackregistry import ReusedStackRegistry, SharedStackRegistry
+from potemkin.waiters import FixedDelay
+
+
+def _decorate(cloudformation, template, test_function, **kwargs):
+    stack = CloudFormationStack(template, stack_name_stem='TestStack', wait_strategy=FixedDelay(0), **kwargs)
+    stack._cloudformation_client = cloudformation
+    return stack(test_function)
+
+
+def test_stack_created_and_deleted_per_test(cloudformation, template):
+    """ test default behaviour creates and deletes one stack per decorated test """
+    seen = []
+    test_one = _decorate(cloudformation, template, lambda outputs, name: seen.append(name))
+    test_two = _decorate(cloudformation, template, lambda outputs, name: seen.append(name))
+
+    test_one()
+    test_two()
+
+    assert len(cloudformation.created) == 2
+    assert cloudformation.deleted == cloudformation.created
+
+
+def test_shared_stack_created_once_and_deleted_after_last_user(cloudformation, template, monkeypatch):
+    """ test share=True hands one stack to every user and deletes it when the last one finishes """
+    monkeypatch.setattr('potemkin.cloudformationstack.shared_stacks', SharedStackRegistry())
+    seen = []
+    tests = [
+        _decorate(cloudformation, template, lambda outputs, name: seen.append((name, outputs)), share=True)
+        for _ in range(3)
+    ]
+
+    tests[0]()
+    tests[1]()
+    assert cloudformation.deleted == []
+
+    tests[2]()
+    assert len(cloudformation.created) == 1
+    assert cloudformation.deleted == cloudformation.created
+    assert {name for name, _ in seen} == set(cloudformation.created)
+    assert all(outputs == {'BucketNameOut': 'bucket'} for _, outputs in seen)
+
+
+def test_shared_stack_not_shared_across_parameters(cloudformation, template, monkeypatch):
+    """ test stacks with different parameters get different shared stacks """
+    monkeypatch.setattr('potemkin.cloudformationstack.shared_stacks', SharedStackRegistry())
+    first = _decorate(cloudformation, template, lambda outputs, name: None, share=True, parameters={'A': '1'})
+    second = _decorate(cloudformation, template, lambda outputs, name: None, share=True, parameters={'A': '2'})
+
+    first()
+    second()
+
+    assert len(cloudformation.created) == 2
+
+
+def test_shared_stack_kept_on_failure_when_teardown_fail_disabled(cloudformation, template, monkeypatch):
+    """ test a failing user keeps the shared stack alive when teardown_fail=False """
+    registry = SharedStackRegistry()
+    monkeypatch.setattr('potemkin.cloudformationstack.shared_stacks', registry)
+
+    def failing_test(outputs, name):
+        raise AssertionError('boom')
+
+    failing = _decorate(cloudformation, template, failing_test, share=True, teardown_fail=False)
+    passing = _decorate(cloudformation, template, lambda outputs, name: None, share=True, teardown_fail=False)
+
+    with pytest.raises(AssertionError):
+        failing()
+    passing()
+    registry.teardown_all()
+
+    assert cloudformation.deleted == []
+
+
+def test_reused_stack_updated_in_place_between_parameter_sets(cloudformation, template, monkeypatch):
+    """ test reuse_stack=True moves one stack between parameter sets with change sets """
+    registry = ReusedStackRegistry()
+    monkeypatch.setattr('potemkin.cloudformationstack.reused_stacks', registry)
+    seen = []
+    for versioning in ('Enabled', 'Suspended', 'Suspended'):
+        _decorate(cloudformation, template, lambda outputs, name: seen.append(name), reuse_stack=True,
+                  parameters={'Versioning': versioning})()
+
+    assert len(cloudformation.created) == 1
+    assert cloudformation.executed == cloudformation.created
+    assert cloudformation.change_sets == {}
+    assert set(seen) == set(cloudformation.created)
+    assert cloudformation.deleted == []
+
+    registry.teardown_all()
+    assert cloudformation.deleted == cloudformation.created
+
+
+def test_reused_stack_recreated_when_change_set_replaces_unsafe_resource(cloudformation, template, monkeypatch):
+    """ test a change set replacing an unsafe resource is discarded in favour of a new stack """
+    monkeypatch.setattr('potemkin.cloudformationstack.reused_stacks', ReusedStackRegistry())
+    for bucket_name in ('first', 'second'):
+        _decorate(cloudformation, template, lambda outputs, name: None, reuse_stack=True,
+                  unsafe_replacements=['AWS::S3::Bucket'], parameters={'BucketName': bucket_name})()
+
+    assert len(cloudformation.created) == 2
+    assert cloudformation.executed == []
+    assert cloudformation.deleted == cloudformation.created[:1]
+
+
+def test_reuse_stack_exclusive_with_share(template):
+    """ test reuse_stack cannot be combined with another stack lifetime """
+    with pytest.raises(ValueError):
+        CloudFormationStack(template, share=True, reuse_stack=True)
+
+
+def test_stack_names_unique_within_the_same_second(template, monkeypatch):
+    """ test names generated concurrently in the same second differ and still carry stem and worker id """
+    monkeypatch.setenv('PYTEST_XDIST_WORKER', 'gw7')
+    stack = CloudFormationStack(template, stack_name_stem='TestStack')
+    monkeypatch.setattr(stack, '_now', lambda: 1600000000)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        names = list(executor.map(lambda _: stack._unique_stack_name('TestStack'), range(200)))
+
+    assert len(set(names)) == 200
+    assert all(name.startswith('TestStack1600000000-gw7-') for name in names)
+    assert all(stem_pattern('TestStack').match(name) for name in names)
@@ -0,0 +1,134 @@
+import threading
+
+import boto3
+
+from potemkin import configservice as config
+from potemkin.instrumentation import instrumentation
+from potemkin.retry import RetryPolicy
+from conftest import evaluation
+
+
+def _rule_with_results(configservice, count, rule_name='eip-attached'):
+    configservice.results[rule_name] = [evaluation(f'eipalloc-{index}') for index in range(count)]
+
+
+def test_scan_stops_paginating_once_all_ids_found(configservice):
+    """ test the scanner stops reading pages once every requested id has been found """
+    configservice.page_size = 10
+    _rule_with_results(configservice, 1000)
+
+    found = config.scan_rule_results(configservice, 'eip-attached', ['eipalloc-3', 'eipalloc-15'])
+
+    assert set(found) == {'eipalloc-3', 'eipalloc-15'}
+    assert [operation for operation, _ in configservice.calls].count('get_compliance_details_by_config_rule') == 2
+
+
+def test_wait_for_compliance_results(configservice):
+    """ test present results must match and absent results must be missing """
+    _rule_with_results(configservice, 5)
+
+    assert config.config_rule_wait_for_compliance_results(
+        configservice, 'eip-attached', {'eipalloc-1': 'NON_COMPLIANT', 'dummy': 'NOT_APPLICABLE'},
+        wait_period=0, max_attempts=2)
+    assert not config.config_rule_wait_for_compliance_results(
+        configservice, 'eip-attached', {'eipalloc-1': 'COMPLIANT'},
+        wait_period=0, max_attempts=2)
+
+
+def test_wait_for_absent_resources_returns_remaining(configservice):
+    """ test ids still present after the last attempt are returned """
+    _rule_with_results(configservice, 5)
+
+    assert config.config_rule_wait_for_absent_resources(
+        configservice, 'eip-attached', ['eipalloc-1', 'gone'], wait_period=0, max_attempts=2) == ['eipalloc-1']
+    assert config.config_rule_wait_for_absent_resources(
+        configservice, 'eip-attached', ['gone'], wait_period=0, max_attempts=2) == []
+
+
+def test_wait_for_resource_returns_evaluation(configservice):
+    """ test the evaluation result for the resource is returned """
+    _rule_with_results(configservice, 5)
+
+    assert config.config_rule_wait_for_resource(configservice, 'eipalloc-2', 'eip-attached') == evaluation('eipalloc-2')
+
+
+def test_query_switches_to_per_resource_for_large_scoped_rules(configservice):
+    """ test a rule with many results is queried per resource once its volume is known """
+    configservice.page_size = 100
+    configservice.scopes['eip-attached'] = ['AWS::EC2::EIP']
+    _rule_with_results(configservice, 2000)
+
+    first = config.scan_rule_results(configservice, 'eip-attached', ['eipalloc-1999', 'missing'])
+    configservice.calls.clear()
+    second = config.scan_rule_results(configservice, 'eip-attached', ['eipalloc-1999', 'missing'])
+
+    assert first == second == {'eipalloc-1999': evaluation('eipalloc-1999')}
+    assert [operation for operation, _ in configservice.calls] == ['get_compliance_details_by_resource'] * 2
+
+
+def test_query_stays_per_rule_without_scope(configservice):
+    """ test rules without resource type scope are always paginated by rule """
+    configservice.page_size = 100
+    _rule_with_results(configservice, 2000)
+
+    config.scan_rule_results(configservice, 'eip-attached', ['missing'])
+    configservice.calls.clear()
+    config.scan_rule_results(configservice, 'eip-attached', ['missing'])
+
+    assert {operation for operation, _ in configservice.calls} == {'get_compliance_details_by_config_rule'}
+
+
+def test_multiple_rules_waited_concurrently(configservice):
+    """ test every rule gets a verdict and evaluations start with a single call """
+    for rule_name in ('eip-attached', 's3-encrypted', 'sg-open'):
+        configservice.results[rule_name] = [evaluation('res-1', rule_name=rule_name)]
+
+    verdicts = config.config_rules_wait_for_compliance_results(
+        configservice,
+        {
+            'eip-attached': {'res-1': 'NON_COMPLIANT'},
+            's3-encrypted': {'res-1': 'COMPLIANT'},
+            'sg-open': {'res-2': 'NOT_APPLICABLE'}
+        },
+        wait_period=0, max_attempts=2, evaluate=True, max_concurrency=2)
+
+    assert verdicts == {'eip-attached': True, 's3-encrypted': False, 'sg-open': True}
+    assert [call for call in configservice.calls if call[0] == 'start_config_rules_evaluation'] == [
+        ('start_config_rules_evaluation', ('eip-attached', 's3-encrypted', 'sg-open'))
+    ]
+
+
+def test_rule_wait_policy_tunes_every_waiter(configservice, monkeypatch):
+    """ test the module wide policy schedules the polls of waiters that don't pass their own """
+    _rule_with_results(configservice, 1)
+    monkeypatch.setattr(config, 'rule_wait_policy', RetryPolicy(wait_period=0, attempts=3))
+
+    assert config.config_rule_wait_for_resource(configservice, 'eipalloc-9', 'eip-attached') is None
+    assert instrumentation.totals()['rule']['eip-attached']['polls'] == 3
+
+
+def test_rule_scopes_described_per_rule_and_account(configservice):
+    """ test describing one rule's scope holds up no other rule, and other credentials get their own profile """
+    describing = threading.Event()
+    release = threading.Event()
+    describe = configservice.describe_config_rules
+
+    def slow_describe(ConfigRuleNames):
+        if ConfigRuleNames == ['slow-rule']:
+            describing.set()
+            release.wait(5)
+        return describe(ConfigRuleNames)
+
+    configservice.describe_config_rules = slow_describe
+    slow = threading.Thread(target=config._rule_profile, args=(configservice, 'slow-rule'))
+    slow.start()
+    describing.wait(5)
+    configservice.scopes['eip-attached'] = ['AWS::EC2::EIP']
+    assert config._rule_profile(configservice, 'eip-attached').resource_types == ['AWS::EC2::EIP']
+    release.set()
+    slow.join()
+
+    clients = [boto3.session.Session(region_name='us-east-1').client(
+        'config', aws_access_key_id=key, aws_secret_access_key='secret') for key in ('first', 'second')]
+    keys = {config._rule_profile_key(configservice, 'eip-attached') for configservice in clients}
+    assert len(keys) == 2
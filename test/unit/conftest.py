@@ -0,0 +1,312 @@
+import json
+import os
+import stat
+import sys
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+from potemkin import configservice as config_module
+from potemkin.instrumentation import instrumentation
+from potemkin.rulepoller import rule_pollers
+from potemkin.waiters import FixedDelay
+
+
+class FakeCloudFormation:
+    """ Just enough of the CloudFormation client for the decorators: every stack creates instantly """
+
+    def __init__(self, outputs=None, failing_resource=None):
+        self.outputs = outputs if outputs is not None else {'BucketNameOut': 'bucket'}
+        self.failing_resource = failing_resource
+        self.stacks = {}
+        self.events = {}
+        self.created = []
+        self.deleted = []
+        self.change_sets = {}
+        self.executed = []
+        self.undeletable = {}
+        self.throttled_deletes = 0
+
+    def create_stack(self, StackName, TemplateBody, Parameters, **kwargs):
+        self.created.append(StackName)
+        status = 'CREATE_FAILED' if self.failing_resource else 'CREATE_COMPLETE'
+        self.stacks[StackName] = {
+            'StackName': StackName,
+            'StackStatus': status,
+            'Parameters': Parameters,
+            'Tags': kwargs.get('Tags', []),
+            'CreationTime': datetime.now(timezone.utc),
+            'Outputs': [{'OutputKey': k, 'OutputValue': v} for k, v in self.outputs.items()]
+        }
+        self.events[StackName] = []
+        self._event(StackName, StackName, 'AWS::CloudFormation::Stack', 'CREATE_IN_PROGRESS')
+        self._event(StackName, 'Bucket', 'AWS::S3::Bucket', 'CREATE_IN_PROGRESS')
+        if self.failing_resource:
+            self._event(StackName, self.failing_resource, 'AWS::EC2::EIP', 'CREATE_FAILED', 'quota exceeded')
+            self._event(StackName, 'Bucket', 'AWS::S3::Bucket', 'CREATE_FAILED', 'Resource creation cancelled')
+        else:
+            self._event(StackName, 'Bucket', 'AWS::S3::Bucket', 'CREATE_COMPLETE')
+        self._event(StackName, StackName, 'AWS::CloudFormation::Stack', status)
+        return {'StackId': StackName}
+
+    def _event(self, stack_name, logical_id, resource_type, status, reason=''):
+        self.events[stack_name].insert(0, {
+            'EventId': f'{stack_name}-{len(self.events[stack_name])}',
+            'StackId': stack_name,
+            'LogicalResourceId': logical_id,
+            'PhysicalResourceId': stack_name if logical_id == stack_name else f'{logical_id}-id',
+            'ResourceType': resource_type,
+            'ResourceStatus': status,
+            'ResourceStatusReason': reason
+        })
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        """ pages of two events, newest first """
+        start = int(NextToken) if NextToken else 0
+        response = {'StackEvents': self.events[StackName][start:start + 2]}
+        if start + 2 < len(self.events[StackName]):
+            response['NextToken'] = str(start + 2)
+        return response
+
+    def describe_stack_resources(self, StackName):
+        return {'StackResources': [
+            {'LogicalResourceId': logical_id, 'ResourceStatus': 'DELETE_FAILED'}
+            for logical_id in self.undeletable.get(StackName, [])
+            if self.stacks.get(StackName, {}).get('StackStatus') == 'DELETE_FAILED'
+        ]}
+
+    def delete_stack(self, StackName, RetainResources=None):
+        """ stacks in undeletable end up DELETE_FAILED unless their stuck resources are retained """
+        if self.throttled_deletes:
+            self.throttled_deletes -= 1
+            raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'DeleteStack')
+        if StackName in self.undeletable and set(RetainResources or []) != set(self.undeletable[StackName]):
+            self.stacks[StackName]['StackStatus'] = 'DELETE_FAILED'
+            return
+        self.deleted.append(StackName)
+        self.stacks.pop(StackName, None)
+
+    def create_change_set(self, StackName, ChangeSetName, ChangeSetType, UsePreviousTemplate, Parameters, **kwargs):
+        """ changing BucketName replaces Bucket, any other parameter change modifies it in place """
+        previous = {p['ParameterKey']: p['ParameterValue'] for p in self.stacks[StackName]['Parameters']}
+        current = {p['ParameterKey']: p['ParameterValue'] for p in Parameters}
+        change_set = {'Status': 'CREATE_COMPLETE', 'ExecutionStatus': 'AVAILABLE', 'Parameters': Parameters}
+        if previous == current:
+            change_set.update(Status='FAILED', ExecutionStatus='UNAVAILABLE',
+                              StatusReason="The submitted information didn't contain changes.")
+        else:
+            replacement = 'True' if previous.get('BucketName') != current.get('BucketName') else 'False'
+            change_set['Changes'] = [{'ResourceChange': {
+                'LogicalResourceId': 'Bucket', 'ResourceType': 'AWS::S3::Bucket', 'Replacement': replacement
+            }}]
+        self.change_sets[(StackName, ChangeSetName)] = change_set
+
+    def describe_change_set(self, StackName, ChangeSetName, NextToken=None):
+        return self.change_sets[(StackName, ChangeSetName)]
+
+    def execute_change_set(self, StackName, ChangeSetName):
+        change_set = self.change_sets.pop((StackName, ChangeSetName))
+        self.stacks[StackName].update(StackStatus='UPDATE_COMPLETE', Parameters=change_set['Parameters'])
+        self.executed.append(StackName)
+
+    def delete_change_set(self, StackName, ChangeSetName):
+        del self.change_sets[(StackName, ChangeSetName)]
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(getattr(self, f'_{operation_name}_pages'))
+
+    def _describe_stacks_pages(self):
+        yield {'Stacks': list(self.stacks.values())}
+
+    def _list_stacks_pages(self, StackStatusFilter):
+        """ pages of two summaries """
+        summaries = [
+            {key: stack[key] for key in ('StackName', 'StackStatus', 'CreationTime')}
+            for stack in self.stacks.values() if stack['StackStatus'] in StackStatusFilter
+        ]
+        for start in range(0, len(summaries), 2):
+            yield {'StackSummaries': summaries[start:start + 2]}
+
+    def describe_stacks(self, StackName):
+        if StackName not in self.stacks:
+            raise ClientError(
+                {'Error': {'Code': 'ValidationError', 'Message': f'Stack with id {StackName} does not exist'}},
+                'DescribeStacks'
+            )
+        return {'Stacks': [self.stacks[StackName]]}
+
+
+@pytest.fixture
+def no_wait():
+    """ wait strategy that polls without sleeping """
+    return FixedDelay(0)
+
+
+@pytest.fixture
+def cloudformation():
+    return FakeCloudFormation()
+
+
+@pytest.fixture
+def template(tmp_path):
+    path = tmp_path / 'bucket.yml'
+    path.write_text('Resources:\n  Bucket:\n    Type: AWS::S3::Bucket\n')
+    return str(path)
+
+
+def evaluation(resource_id, compliance_type='NON_COMPLIANT', rule_name='eip-attached',
+               resource_type='AWS::EC2::EIP'):
+    return {
+        'EvaluationResultIdentifier': {
+            'EvaluationResultQualifier': {
+                'ConfigRuleName': rule_name,
+                'ResourceType': resource_type,
+                'ResourceId': resource_id
+            }
+        },
+        'ComplianceType': compliance_type
+    }
+
+
+class FakePaginator:
+    def __init__(self, pages):
+        self._pages = pages
+
+    def paginate(self, **kwargs):
+        return self._pages(**kwargs)
+
+
+class FakeConfigService:
+    """ AWS Config client serving canned evaluation results and counting API calls """
+
+    def __init__(self, results=None, page_size=100):
+        self.results = results if results is not None else {}
+        self.scopes = {}
+        self.page_size = page_size
+        self.calls = []
+
+    def describe_config_rules(self, ConfigRuleNames):
+        self.calls.append(('describe_config_rules', tuple(ConfigRuleNames)))
+        return {'ConfigRules': [
+            {'ConfigRuleName': name, 'Scope': {'ComplianceResourceTypes': self.scopes[name]}}
+            if name in self.scopes else {'ConfigRuleName': name}
+            for name in ConfigRuleNames
+        ]}
+
+    def get_compliance_details_by_resource(self, ResourceType, ResourceId, ComplianceTypes):
+        self.calls.append(('get_compliance_details_by_resource', ResourceId))
+        return {'EvaluationResults': [
+            result
+            for results in self.results.values()
+            for result in results
+            if result['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId'] == ResourceId
+            and result['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceType'] == ResourceType
+        ]}
+
+    def get_paginator(self, operation_name):
+        return FakePaginator(self._compliance_details_pages)
+
+    def _compliance_details_pages(self, ConfigRuleName, ComplianceTypes):
+        for start in range(0, len(self.results[ConfigRuleName]), self.page_size):
+            self.calls.append(('get_compliance_details_by_config_rule', ConfigRuleName))
+            yield {'EvaluationResults': self.results[ConfigRuleName][start:start + self.page_size]}
+
+    def start_config_rules_evaluation(self, ConfigRuleNames):
+        self.calls.append(('start_config_rules_evaluation', tuple(ConfigRuleNames)))
+
+
+@pytest.fixture
+def configservice():
+    return FakeConfigService()
+
+
+@pytest.fixture(autouse=True)
+def forget_rule_profiles():
+    """ rule profiles are process wide, don't let them leak between tests """
+    config_module._rule_profiles.clear()
+    rule_pollers.clear()
+
+
+@pytest.fixture(autouse=True)
+def forget_instrumentation():
+    """ instrumentation events are process wide, start every test without any """
+    instrumentation.clear()
+
+
+TERRAFORM_STUB = """#!{python}
+import json, os, sys
+with open({log!r}, 'a') as log:
+    log.write(json.dumps({{'args': sys.argv[1:], 'cwd': os.getcwd(),
+                           'plugin_cache': os.environ.get('TF_PLUGIN_CACHE_DIR')}}) + '\\n')
+command = sys.argv[1]
+variables = [sys.argv[index + 1] for index, arg in enumerate(sys.argv) if arg == '-var']
+if command == 'init':
+    os.makedirs('.terraform/providers', exist_ok=True)
+elif command == 'apply':
+    if os.environ.get('STUB_SLEEP'):
+        import time
+        time.sleep(float(os.environ['STUB_SLEEP']))
+    if sys.argv[-1].endswith('.tfplan'):
+        with open(sys.argv[-1]) as plan:
+            variables = json.load(plan)
+    with open('terraform.tfstate', 'w') as state:
+        json.dump(variables, state)
+    if '-json' in sys.argv:
+        for message in [
+            {{'type': 'apply_start', '@message': 'aws_eip.eip1: Creating...'}},
+            {{'type': 'apply_complete', '@message': 'aws_eip.eip1: Creation complete after 2s',
+              'hook': {{'resource': {{'addr': 'aws_eip.eip1'}}, 'elapsed_seconds': 2}}}},
+            {{'type': 'outputs', 'outputs': {{'EIPOutput': {{'sensitive': False, 'value': 'eipalloc-1'}}}}}}
+            if not os.environ.get('STUB_SENSITIVE') else
+            {{'type': 'outputs', 'outputs': {{'EIPOutput': {{'sensitive': False, 'value': 'eipalloc-1'}},
+                                             'Password': {{'sensitive': True}}}}}}
+        ]:
+            print(json.dumps(message), flush=True)
+elif command == 'plan':
+    applied = None
+    if os.path.exists('terraform.tfstate'):
+        with open('terraform.tfstate') as state:
+            applied = json.load(state)
+    out = [arg for arg in sys.argv if arg.startswith('-out=')][0][len('-out='):]
+    with open(out, 'w') as plan:
+        json.dump(variables, plan)
+    sys.exit(0 if applied == variables else 2)
+elif command == 'fail':
+    sys.stderr.write('Error: boom\\n')
+    sys.exit(1)
+elif command == 'output':
+    outputs = {{'EIPOutput': {{'value': 'eipalloc-1'}}}}
+    if os.environ.get('STUB_SENSITIVE'):
+        outputs['Password'] = {{'sensitive': True, 'value': 'hunter2'}}
+    print(json.dumps(outputs))
+"""
+
+
+@pytest.fixture
+def terraform_stub(tmp_path, monkeypatch):
+    """ fake terraform executable first on PATH; returns a function reading back its invocations """
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    log = tmp_path / 'terraform.log'
+    stub = bin_dir / 'terraform'
+    stub.write_text(TERRAFORM_STUB.format(python=sys.executable, log=str(log)))
+    stub.chmod(stub.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+    monkeypatch.setenv('POTEMKIN_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.delenv('TF_PLUGIN_CACHE_DIR', raising=False)
+
+    def invocations():
+        if not log.exists():
+            return []
+        return [json.loads(line) for line in log.read_text().splitlines()]
+
+    return invocations
+
+
+@pytest.fixture
+def terraform_root(tmp_path):
+    root = tmp_path / 'terraform'
+    root.mkdir()
+    (root / 'main.tf').write_text('resource "aws_eip" "eip1" {}\n')
+    return str(root)
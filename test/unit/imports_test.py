@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_import_potemkin_does_not_import_botocore():
+    """ test importing potemkin, its decorators, helpers and pytest plugin leaves boto3 and botocore unloaded """
+    code = (
+        'import sys\n'
+        'import potemkin, potemkin.pytest_plugin, potemkin.cli\n'
+        'from potemkin import CloudFormationStack, TerraformResources, config_rule_wait_for_compliance_results\n'
+        'print(sorted(module for module in sys.modules if module.split(".")[0] in ("boto3", "botocore")))\n'
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, check=True, capture_output=True,
+                            text=True).stdout
+
+    assert output.strip() == '[]'
@@ -0,0 +1,39 @@
+from potemkin import configservice as config
+from potemkin.cloudformationstack import CloudFormationStack
+from potemkin.instrumentation import instrumentation
+from potemkin.waiters import FixedDelay
+from conftest import evaluation
+
+
+def test_stack_phases_timed_and_attributed_to_test(cloudformation, template):
+    """ test every phase of a decorated test is recorded against the template and the running test """
+    seen = []
+    instrumentation.add_hook(seen.append)
+    instrumentation.current_test = 'test_bucket'
+    try:
+        stack = CloudFormationStack(template, stack_name_stem='TestStack', wait_strategy=FixedDelay(0))
+        stack._cloudformation_client = cloudformation
+        stack(lambda outputs, name: None)()
+    finally:
+        instrumentation.current_test = None
+        instrumentation.remove_hook(seen.append)
+
+    phases = instrumentation.totals()['stack'][template]
+    assert {'template_read', 'create_stack', 'wait', 'outputs', 'test', 'delete', 'polls'} <= set(phases)
+    assert phases['polls'] >= 2
+    assert seen == instrumentation.events()
+    assert all(event['test'] == 'test_bucket' for event in seen)
+    assert instrumentation.slowest('stack')[0][0] == template
+    assert 'test' not in instrumentation.slowest('stack')[0][2]
+
+
+def test_rule_polls_and_wait_recorded(configservice):
+    """ test config waits record their poll iterations and duration per rule """
+    configservice.results['eip-attached'] = [evaluation('eipalloc-1')]
+
+    config.config_rule_wait_for_resource(configservice, 'eipalloc-1', 'eip-attached')
+
+    totals = instrumentation.totals()['rule']['eip-attached']
+    assert totals['polls'] == 1
+    assert totals['fetches'] == 1
+    assert 'wait' in totals
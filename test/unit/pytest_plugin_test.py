@@ -0,0 +1,126 @@
+import pytest
+
+from potemkin import cloudformationstack, pytest_plugin
+from potemkin.cloudformationstack import CloudFormationStack
+from potemkin.instrumentation import instrumentation
+from potemkin.stackpool import StackPoolRegistry
+from potemkin.stackregistry import SharedStackRegistry
+
+
+class FakeItem:
+    def __init__(self, obj, nodeid=None):
+        self.obj = obj
+        self.nodeid = nodeid
+        self.markers = []
+
+    def get_closest_marker(self, name):
+        return next((marker for marker in self.markers if marker.name == name), None)
+
+    def add_marker(self, marker):
+        self.markers.append(marker.mark)
+
+
+def test_tests_sharing_a_stack_grouped_for_xdist(template, pytestconfig):
+    """ test tests that can hand a stack to each other get the same xdist_group, others get none """
+    pytest_plugin.pytest_configure(pytestconfig)
+    shared = [CloudFormationStack(template, share=True)(lambda outputs, name: None) for _ in range(2)]
+    other = CloudFormationStack(template, share=True, parameters={'A': '1'})(lambda outputs, name: None)
+    private = CloudFormationStack(template)(lambda outputs, name: None)
+    explicit = CloudFormationStack(template, share=True)(lambda outputs, name: None)
+    items = [FakeItem(test) for test in shared + [other, private, explicit]]
+    items[-1].markers.append(pytest.mark.xdist_group(name='mine').mark)
+
+    pytest_plugin.pytest_collection_modifyitems(None, items)
+
+    groups = [item.get_closest_marker('xdist_group') for item in items]
+    assert groups[0].kwargs == groups[1].kwargs
+    assert groups[0].kwargs != groups[2].kwargs
+    assert groups[3] is None
+    assert groups[4].kwargs == {'name': 'mine'}
+
+
+class FakeSession:
+    def __init__(self, items):
+        self.items = items
+
+
+@pytest.fixture
+def registries(monkeypatch, cloudformation):
+    """ fresh process wide registries, stacks created by the fake client """
+    pools, shared = StackPoolRegistry(), SharedStackRegistry()
+    for module in (cloudformationstack, pytest_plugin):
+        monkeypatch.setattr(module, 'stack_pools', pools)
+        monkeypatch.setattr(module, 'shared_stacks', shared)
+    monkeypatch.setattr(cloudformationstack, 'client', lambda service, profile=None: cloudformation)
+    monkeypatch.delenv('PYTEST_XDIST_WORKER', raising=False)
+    return pools
+
+
+def _items(template, no_wait, count, **kwargs):
+    return [FakeItem(CloudFormationStack(template, stack_name_stem='TestStack', wait_strategy=no_wait, **kwargs)(
+        lambda outputs, name: None), nodeid=f'test_{index}') for index in range(count)]
+
+
+def test_demand_counted_from_selected_tests(registries, cloudformation, template, no_wait):
+    """ test deselected tests neither get pool stacks created for them nor keep a shared stack alive """
+    pooled = _items(template, no_wait, 3, pool_size=3)
+    shared = _items(template, no_wait, 2, share=True, parameters={'BucketName': 'shared'})
+
+    pytest_plugin.pytest_collection_finish(FakeSession(pooled[:1] + shared[:1]))
+    shared[0].obj()
+
+    assert len(cloudformation.deleted) == 1
+    registries.drain_all()
+    assert len(cloudformation.created) == 2
+    assert sorted(cloudformation.deleted) == sorted(cloudformation.created)
+
+
+def test_xdist_worker_counts_leases_as_tests_arrive(registries, cloudformation, template, no_wait, monkeypatch):
+    """ test a worker warms nothing at collection and creates stacks only for the tests it is sent """
+    monkeypatch.setenv('PYTEST_XDIST_WORKER', 'gw1')
+    items = _items(template, no_wait, 4, pool_size=3)
+
+    pytest_plugin.pytest_collection_finish(FakeSession(items))
+    assert cloudformation.created == []
+
+    protocol = pytest_plugin.pytest_runtest_protocol(items[0], items[1])
+    next(protocol)
+    items[0].obj()
+    protocol.close()
+    registries.drain_all()
+
+    assert len(cloudformation.created) == 2
+    assert sorted(cloudformation.deleted) == sorted(cloudformation.created)
+
+
+class FakeTerminalReporter:
+    def __init__(self):
+        self.lines = []
+
+    def section(self, title):
+        self.lines.append(f'== {title} ==')
+
+    def write_line(self, line):
+        self.lines.append(line)
+
+
+def test_terminal_summary_lists_slowest_templates_and_busiest_operations():
+    """ test the summary ranks templates by time spent outside the test body """
+    instrumentation.emit('stack', 'slow.yml', 'wait', 90.0, 'seconds')
+    instrumentation.emit('stack', 'fast.yml', 'wait', 5.0, 'seconds')
+    instrumentation.emit('stack', 'fast.yml', 'test', 500.0, 'seconds')
+    instrumentation.increment('api', 'cloudformation.DescribeStacks', 'calls', amount=12)
+    reporter = FakeTerminalReporter()
+
+    pytest_plugin.pytest_terminal_summary(reporter)
+
+    templates = [line for line in reporter.lines if '.yml' in line]
+    assert 'slow.yml' in templates[0] and 'fast.yml' in templates[1]
+    assert any('12  cloudformation.DescribeStacks' in line for line in reporter.lines)
+
+
+def test_terminal_summary_silent_without_events():
+    """ test sessions that never used potemkin get no summary """
+    reporter = FakeTerminalReporter()
+    pytest_plugin.pytest_terminal_summary(reporter)
+    assert reporter.lines == []
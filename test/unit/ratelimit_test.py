@@ -0,0 +1,111 @@
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from potemkin import configservice as config
+from potemkin.ratelimit import RateLimiter, TokenBucket, is_throttling_error
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RawBody:
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+THROTTLED = b'<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code>' \
+            b'<Message>Rate exceeded</Message></Error><RequestId>1</RequestId></ErrorResponse>'
+NO_STACKS = b'<DescribeStacksResponse><DescribeStacksResult><Stacks/></DescribeStacksResult>' \
+            b'</DescribeStacksResponse>'
+
+
+def test_bucket_paces_calls_and_adapts_to_throttling():
+    """ test calls beyond the burst wait for the rate, which halves when throttled and recovers after """
+    clock = FakeClock()
+    bucket = TokenBucket(rate=4, burst=2, clock=clock)
+
+    waits = [bucket.acquire() for _ in range(4)]
+    assert waits[:2] == [0, 0]
+    assert clock.now == pytest.approx(0.5)
+
+    bucket.throttled()
+    assert bucket.rate == 2
+    assert bucket.acquire() == pytest.approx(0.5)
+
+    for _ in range(100):
+        bucket.succeeded()
+    assert bucket.rate == 4
+
+
+def test_installed_client_goes_through_limiter():
+    """ test every request of an installed client takes a token and throttling responses are counted """
+    limiter = RateLimiter(limits={'cloudformation': 1}, clock=FakeClock())
+    cloudformation = boto3.session.Session(region_name='us-east-1').client(
+        'cloudformation', aws_access_key_id='id', aws_secret_access_key='secret',
+        config=Config(retries={'total_max_attempts': 1})
+    )
+    limiter.install(cloudformation)
+    limiter.install(cloudformation)
+    responses = [THROTTLED, NO_STACKS]
+
+    def send(request, **kwargs):
+        body = responses.pop(0)
+        return AWSResponse(request.url, 400 if body is THROTTLED else 200, {}, RawBody(body))
+
+    cloudformation.meta.events.register('before-send', send)
+
+    with pytest.raises(ClientError):
+        cloudformation.describe_stacks()
+    assert cloudformation.describe_stacks()['Stacks'] == []
+
+    # the throttled first call emptied the bucket and halved its rate to 0.5/s
+    assert limiter.stats() == {('cloudformation', 'DescribeStacks'): {'calls': 2, 'throttled': 1, 'waited': 2.0}}
+
+
+def test_start_evaluations_retries_while_limit_exceeded(configservice, monkeypatch):
+    """ test evaluations are retried with backoff instead of silently skipped """
+    monkeypatch.setattr(config, '_clock', FakeClock())
+
+    class LimitExceededException(Exception):
+        pass
+
+    refusals = [LimitExceededException(), LimitExceededException()]
+    start = configservice.start_config_rules_evaluation
+
+    def start_config_rules_evaluation(ConfigRuleNames):
+        start(ConfigRuleNames)
+        if refusals:
+            raise refusals.pop()
+
+    configservice.exceptions = type('exceptions', (), {'LimitExceededException': LimitExceededException})
+    configservice.start_config_rules_evaluation = start_config_rules_evaluation
+
+    config.start_evaluations(configservice, 'eip-attached')
+
+    assert configservice.calls.count(('start_config_rules_evaluation', ('eip-attached',))) == 3
+    assert config._clock.now > 0
+
+
+def test_limit_exceeded_is_throttling_only_for_config():
+    """ test a CloudFormation quota error is not mistaken for throttling, AWS Config's evaluation limit is """
+    limit_exceeded = ClientError({'Error': {'Code': 'LimitExceededException', 'Message': 'limit'}}, 'Call')
+    throttled = ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'Call')
+
+    assert is_throttling_error(limit_exceeded, 'config')
+    assert not is_throttling_error(limit_exceeded, 'cloudformation')
+    assert not is_throttling_error(limit_exceeded)
+    assert is_throttling_error(throttled, 'cloudformation')
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+
+from potemkin import cli
+from potemkin.reaper import StackReaper
+from potemkin.waiters import FixedDelay
+
+
+class NoSleepClock:
+    def __init__(self):
+        self.sleeps = []
+
+    def monotonic(self):
+        return 0
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+def _create(cloudformation, stack_name, age_hours=0, tags=None):
+    cloudformation.create_stack(StackName=stack_name, TemplateBody='', Parameters=[], Tags=tags if tags else [])
+    cloudformation.stacks[stack_name]['CreationTime'] = datetime.now(timezone.utc) - timedelta(hours=age_hours)
+
+
+def test_find_matches_stem_age_and_tags(cloudformation):
+    """ test only stacks generated from the stem, old enough and carrying the tags are found """
+    _create(cloudformation, 'EipTestStack1600000000', age_hours=5, tags=[{'Key': 'team', 'Value': 'qa'}])
+    _create(cloudformation, 'EipTestStack1600000001-3', age_hours=5)
+    _create(cloudformation, 'EipTestStack1600000002', age_hours=1)
+    _create(cloudformation, 'EipTestStackProduction', age_hours=5)
+    _create(cloudformation, 'Other1600000000', age_hours=5)
+    reaper = StackReaper(cloudformation)
+
+    found = reaper.find(stems=['EipTestStack'], older_than=2)
+    assert [stack['StackName'] for stack in found] == ['EipTestStack1600000000', 'EipTestStack1600000001-3']
+
+    found = reaper.find(stems=['EipTestStack'], tags={'team': 'qa'})
+    assert [stack['StackName'] for stack in found] == ['EipTestStack1600000000']
+
+
+def test_reap_retries_throttling_and_retains_stuck_resources(cloudformation):
+    """ test throttled deletes are retried and DELETE_FAILED stacks are deleted retaining their stuck resources """
+    for index in range(6):
+        _create(cloudformation, f'TestStack160000000{index}')
+    cloudformation.undeletable['TestStack1600000002'] = ['Eni']
+    cloudformation.throttled_deletes = 3
+    clock = NoSleepClock()
+    reaper = StackReaper(cloudformation, max_workers=4, wait_strategy=FixedDelay(0), clock=clock)
+
+    report = reaper.reap(reaper.find(stems=['TestStack']))
+
+    assert report.failures == []
+    assert sorted(report.deleted) == sorted(f'TestStack160000000{index}' for index in range(6))
+    assert report.retained == {'TestStack1600000002': ['Eni']}
+    assert cloudformation.stacks == {}
+    assert len([delay for delay in clock.sleeps if delay > 0]) == 3
+
+
+def test_reap_command_requires_a_filter_and_honours_dry_run(cloudformation, monkeypatch):
+    """ test reap refuses to match every stack, deletes nothing on a dry run and leaves recent stacks alone
+    unless asked for all of them """
+    monkeypatch.setattr(cli, '_cloudformation_client', lambda profile, region: cloudformation)
+    monkeypatch.setattr('potemkin.reaper.SystemClock', NoSleepClock)
+    _create(cloudformation, 'TestStack1600000000', age_hours=5)
+    _create(cloudformation, 'TestStack1600000001')
+
+    assert cli.main(['reap']) == 2
+    assert cli.main(['reap', '--stem', 'TestStack', '--dry-run']) == 0
+    assert cloudformation.deleted == []
+    assert cli.main(['reap', '--stem', 'TestStack']) == 0
+    assert cloudformation.deleted == ['TestStack1600000000']
+    assert cli.main(['reap', '--stem', 'TestStack', '--all']) == 0
+    assert cloudformation.deleted == ['TestStack1600000000', 'TestStack1600000001']
@@ -0,0 +1,80 @@
+import asyncio
+import random
+
+import pytest
+
+from potemkin.retry import RetryPolicy
+from potemkin.utilities import WaitUntilTrueException, wait_until_true
+from potemkin.waiters import DecorrelatedJitter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_wait_until_true_keeps_its_original_call_style():
+    """ test the plain function form retries falsy results and raises once the attempts are used """
+    results = [None, 0, 'ready']
+    assert wait_until_true(lambda: results.pop(0), wait_period=0, attempts=3)() == 'ready'
+
+    never = wait_until_true(lambda: False, wait_period=0, attempts=2)
+    with pytest.raises(WaitUntilTrueException) as error:
+        never()
+    assert error.value.outcome.attempts == 2
+    assert never.last_outcome is error.value.outcome
+
+
+def test_deadline_retry_filter_and_predicate():
+    """ test retryable exceptions are retried until the deadline, others propagate, and the
+    predicate decides """
+    clock = FakeClock()
+    policy = RetryPolicy(attempts=None, deadline=60,
+                         backoff=DecorrelatedJitter(rng=random.Random(0)),
+                         retry_on=ConnectionError, clock=clock)
+
+    def unreachable():
+        raise ConnectionError('down')
+
+    outcome = policy.run(unreachable)
+    assert not outcome.satisfied
+    assert isinstance(outcome.exception, ConnectionError)
+    assert clock.now == outcome.elapsed == outcome.waited == 60
+
+    with pytest.raises(KeyError):
+        policy.run(lambda: {}['missing'])
+
+    counts = iter(range(10))
+    outcome = policy.replace(predicate=lambda count: count >= 3).run(lambda: next(counts))
+    assert (outcome.value, outcome.attempts) == (3, 4)
+
+
+def test_decorator_with_arguments_on_coroutine():
+    """ test the decorator form takes arguments and retries coroutines with asyncio.sleep """
+    calls = []
+
+    @wait_until_true(wait_period=0, attempts=5, retry_on=lambda error: 'throttled' in str(error))
+    async def eventually():
+        calls.append(len(calls))
+        if len(calls) < 3:
+            raise RuntimeError('throttled')
+        return calls
+
+    assert asyncio.run(eventually()) == [0, 1, 2]
+    assert eventually.last_outcome.attempts == 3
+    assert eventually.__name__ == 'eventually'
+
+
+def test_decorrelated_jitter_stays_within_bounds():
+    """ test every sleep lies between the initial and maximum delay """
+    delays = DecorrelatedJitter(initial_delay=1, max_delay=20, rng=random.Random(3)).delays()
+    sleeps = [next(delays) for _ in range(100)]
+
+    assert all(1 <= sleep <= 20 for sleep in sleeps)
+    assert max(sleeps) == 20
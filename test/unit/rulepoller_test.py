@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from potemkin import configservice as config
+from potemkin.retry import RetryPolicy
+from potemkin.rulepoller import RulePoller, RulePollerRegistry
+from conftest import evaluation
+
+
+def test_concurrent_waiters_share_fetches(configservice):
+    """ test threads waiting on the same rule are served by one fetch per interval """
+    configservice.results['eip-attached'] = []
+    fetches = []
+    results = {}
+
+    def fetch(resource_ids):
+        fetches.append(set(resource_ids))
+        if len(fetches) == 3:
+            configservice.results['eip-attached'] = [evaluation(f'eipalloc-{index}') for index in range(5)]
+        return config.scan_rule_results(configservice, 'eip-attached', resource_ids)
+
+    poller = RulePoller(fetch, ttl=0)
+
+    def wait(index):
+        results[index] = poller.wait([f'eipalloc-{index}'],
+                                     done=lambda found: bool(found),
+                                     result=lambda found: found.get(f'eipalloc-{index}'),
+                                     wait_period=0.05,
+                                     max_attempts=20)
+
+    threads = [threading.Thread(target=wait, args=(index,)) for index in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {index: evaluation(f'eipalloc-{index}') for index in range(5)}
+    assert len(fetches) < 5 * 3
+    assert poller.waiter_count() == 0
+
+
+def test_timed_out_waiter_gets_partial_result_and_is_unregistered():
+    """ test a waiter that runs out of attempts resolves with the last poll and leaves the poller """
+    fetches = []
+
+    def fetch(resource_ids):
+        fetches.append(resource_ids)
+        return {}
+
+    poller = RulePoller(fetch, ttl=0)
+    result = poller.wait(['missing'], done=lambda found: False, result=lambda found: 'timeout',
+                         wait_period=0, max_attempts=3)
+
+    assert result == 'timeout'
+    assert len(fetches) == 3
+    time.sleep(0.05)
+    assert poller.waiter_count() == 0
+
+
+def test_public_waiters_use_shared_poller(configservice):
+    """ test the public wait functions still work through the poller """
+    configservice.results['eip-attached'] = [evaluation('eipalloc-1')]
+
+    assert config.config_rule_wait_for_resource(configservice, 'eipalloc-1', 'eip-attached') == evaluation('eipalloc-1')
+
+
+def test_idle_pollers_forgotten_with_their_client(configservice):
+    """ test a poller leaves the registry once its last waiter finishes, so per test clients are not kept """
+    registry = RulePollerRegistry()
+    poller = registry.poller(configservice, 'eip-attached', fetch=lambda resource_ids: {'eipalloc-1': 'found'})
+
+    assert poller.wait(['eipalloc-1'], done=bool, result=lambda found: found['eipalloc-1']) == 'found'
+    deadline = time.monotonic() + 5
+    while len(registry) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(registry) == 0
+    assert registry.poller(configservice, 'eip-attached', fetch=lambda resource_ids: {}) is not poller
+
+
+def test_failing_policy_fails_its_waiter_not_the_poller():
+    """ test a retry policy raising fails only its own waiter and the poller keeps serving the others """
+    class BrokenPolicy(RetryPolicy):
+        def next_delay(self, attempts, elapsed, delays):
+            raise RuntimeError('broken policy')
+
+    poller = RulePoller(lambda resource_ids: {}, ttl=0)
+    broken = poller.register(['eipalloc-1'], done=lambda found: False, result=lambda found: None,
+                             policy=BrokenPolicy(wait_period=0))
+
+    with pytest.raises(RuntimeError, match='broken policy'):
+        broken.result(timeout=5)
+    assert poller.wait(['eipalloc-2'], done=lambda found: False, result=lambda found: 'timeout',
+                       wait_period=0, max_attempts=2) == 'timeout'
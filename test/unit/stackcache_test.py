@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+from potemkin import cli, stackcache
+from potemkin.cloudformationstack import CloudFormationStack
+from potemkin.teardown import BackgroundTeardown
+from potemkin.waiters import FixedDelay
+
+
+def _cached_test(cloudformation, template, seen, **kwargs):
+    stack = CloudFormationStack(template, stack_name_stem='TestStack', wait_strategy=FixedDelay(0), cache=True,
+                                **kwargs)
+    stack._cloudformation_client = cloudformation
+    return stack(lambda outputs, name: seen.append((name, outputs)))
+
+
+def test_cached_stack_reused_by_later_session(cloudformation, template):
+    """ test a cached stack survives its test and is found again by fingerprint tag """
+    seen = []
+    _cached_test(cloudformation, template, seen)()
+    _cached_test(cloudformation, template, seen)()
+    _cached_test(cloudformation, template, seen, parameters={'A': '1'})()
+
+    assert len(cloudformation.created) == 2
+    assert cloudformation.deleted == []
+    assert seen[0] == seen[1]
+    tags = stackcache.stack_tags(cloudformation.stacks[seen[0][0]])
+    assert tags[stackcache.STEM_TAG] == 'TestStack'
+
+
+def test_expired_cached_stack_evicted_and_replaced(cloudformation, template, monkeypatch):
+    """ test a matching stack older than cache_max_age is deleted instead of reused """
+    teardowns = BackgroundTeardown()
+    monkeypatch.setattr('potemkin.cloudformationstack.background_teardowns', teardowns)
+    seen = []
+    _cached_test(cloudformation, template, seen)()
+    expired = seen[0][0]
+    cloudformation.stacks[expired]['CreationTime'] -= timedelta(hours=25)
+
+    _cached_test(cloudformation, template, seen, cache_max_age=24)()
+    teardowns.wait()
+
+    assert len(cloudformation.created) == 2
+    assert cloudformation.deleted == [expired]
+    assert seen[1][0] != expired
+
+
+def test_purge_cache_deletes_only_cached_stacks_older_than(cloudformation, template, monkeypatch):
+    """ test purge-cache leaves uncached and young stacks alone """
+    monkeypatch.setattr(cli, '_cloudformation_client', lambda profile, region: cloudformation)
+    seen = []
+    _cached_test(cloudformation, template, seen)()
+    _cached_test(cloudformation, template, seen, parameters={'A': '1'})()
+    cloudformation.create_stack(StackName='Uncached', TemplateBody='', Parameters=[])
+    old = seen[0][0]
+    cloudformation.stacks[old]['CreationTime'] = datetime.now(timezone.utc) - timedelta(hours=3)
+
+    assert cli.main(['purge-cache', '--older-than', '2', '--dry-run']) == 0
+    assert cloudformation.deleted == []
+
+    assert cli.main(['purge-cache', '--older-than', '2']) == 0
+    assert cloudformation.deleted == [old]
+
+    cli.main(['purge-cache'])
+    assert sorted(cloudformation.deleted) == sorted(cloudformation.created[:2])
@@ -0,0 +1,40 @@
+import pytest
+
+from potemkin.cloudformationstack import CloudFormationStack, StackCreationError
+from potemkin.stackevents import StackEventStream
+from potemkin.teardown import BackgroundTeardown
+from conftest import FakeCloudFormation
+
+
+def test_events_never_read_twice(cloudformation):
+    """ test the cursor only returns events newer than the previous read, oldest first """
+    cloudformation.create_stack(StackName='TestStack1', TemplateBody='', Parameters=[])
+    events = StackEventStream(cloudformation, 'TestStack1')
+
+    first = events.new_events()
+    cloudformation._event('TestStack1', 'Later', 'AWS::SNS::Topic', 'CREATE_IN_PROGRESS')
+    second = events.new_events()
+
+    assert [event['ResourceStatus'] for event in first] == [
+        'CREATE_IN_PROGRESS', 'CREATE_IN_PROGRESS', 'CREATE_COMPLETE', 'CREATE_COMPLETE'
+    ]
+    assert [event['LogicalResourceId'] for event in second] == ['Later']
+    assert events.new_events() == []
+
+
+def test_first_failed_resource_reported(template, no_wait, monkeypatch):
+    """ test fail_fast raises with the root cause resource and can start deleting the stack in the background """
+    teardowns = BackgroundTeardown()
+    monkeypatch.setattr('potemkin.cloudformationstack.background_teardowns', teardowns)
+    cloudformation = FakeCloudFormation(failing_resource='EIP')
+    stack = CloudFormationStack(template, stack_name_stem='TestStack', wait_strategy=no_wait,
+                                delete_failed_stack=True)
+    stack._cloudformation_client = cloudformation
+
+    with pytest.raises(StackCreationError) as error:
+        stack(lambda outputs, name: None)()
+    teardowns.wait()
+
+    assert error.value.logical_resource_id == 'EIP'
+    assert error.value.reason == 'quota exceeded'
+    assert cloudformation.deleted == cloudformation.created
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from potemkin import cloudformationstack
+from potemkin.stackgraph import CloudFormationStackGraph, NodeOutput, StackNode, run_graph
+from potemkin.teardown import wait_for_teardowns
+
+
+@pytest.fixture
+def graph_cloudformation(monkeypatch, cloudformation):
+    monkeypatch.setattr(cloudformationstack, 'client', lambda service, profile=None: cloudformation)
+    return cloudformation
+
+
+def _parameters(cloudformation, stack_name):
+    parameters = cloudformation.stacks[stack_name]['Parameters']
+    return {p['ParameterKey']: p['ParameterValue'] for p in parameters}
+
+
+def test_outputs_feed_downstream_nodes(graph_cloudformation, template, no_wait):
+    """ test a node gets upstream outputs as parameters and is deleted before the node it needs """
+    seen = []
+    graph = CloudFormationStackGraph({
+        'network': StackNode(template),
+        'data': StackNode(template,
+                          parameters={'BucketName': NodeOutput('network', 'BucketNameOut')}),
+        'queue': StackNode(template, parameters={'BucketName': 'queue'})
+    }, stack_name_stem='Graph', wait_strategy=no_wait)
+
+    def test(stack_outputs, stack_names):
+        seen.append(stack_names)
+        assert _parameters(graph_cloudformation, stack_names['data']) == {'BucketName': 'bucket'}
+        assert stack_outputs == {node: {'BucketNameOut': 'bucket'}
+                                 for node in ('network', 'data', 'queue')}
+
+    graph(test)()
+
+    stack_names = seen[0]
+    assert stack_names['data'].startswith('Graphdata')
+    assert sorted(graph_cloudformation.deleted) == sorted(stack_names.values())
+    deleted = graph_cloudformation.deleted
+    assert deleted.index(stack_names['data']) < deleted.index(stack_names['network'])
+
+
+def test_background_teardown_keeps_reverse_order(graph_cloudformation, template, no_wait):
+    """ test a background graph teardown finishes deleting a dependent before what it depends on """
+    deletes = []
+    delete_stack = graph_cloudformation.delete_stack
+
+    def slow_delete(StackName, **kwargs):
+        deletes.append(('start', StackName))
+        time.sleep(0.05)
+        delete_stack(StackName, **kwargs)
+        deletes.append(('end', StackName))
+
+    graph_cloudformation.delete_stack = slow_delete
+    seen = []
+    graph = CloudFormationStackGraph({
+        'network': StackNode(template),
+        'app': StackNode(template, depends_on=['network'])
+    }, wait_strategy=no_wait, background_teardown=True)
+
+    graph(lambda stack_outputs, stack_names: seen.append(stack_names))()
+    wait_for_teardowns()
+
+    app, network = seen[0]['app'], seen[0]['network']
+    assert deletes == [('start', app), ('end', app), ('start', network), ('end', network)]
+
+
+def test_created_nodes_torn_down_when_a_node_fails(graph_cloudformation, template, no_wait):
+    """ test a failed node stops the graph and the stacks already created are deleted """
+    graph = CloudFormationStackGraph({
+        'network': StackNode(template),
+        'app': StackNode('missing.yml', depends_on=['network'])
+    }, wait_strategy=no_wait)
+
+    with pytest.raises(FileNotFoundError):
+        graph(lambda stack_outputs, stack_names: None)()
+
+    assert len(graph_cloudformation.created) == 1
+    assert graph_cloudformation.deleted == graph_cloudformation.created
+
+
+def test_invalid_graphs_rejected(template):
+    """ test cycles and unknown dependencies are rejected when decorating """
+    with pytest.raises(ValueError, match='cycle'):
+        CloudFormationStackGraph({
+            'a': StackNode(template, depends_on=['b']),
+            'b': StackNode(template, parameters={'Name': NodeOutput('a', 'Name')})
+        })
+    with pytest.raises(ValueError, match='unknown'):
+        CloudFormationStackGraph({'a': StackNode(template, depends_on=['c'])})
+
+
+def test_independent_nodes_run_concurrently():
+    """ test nodes without dependencies between them run at once and dependents wait for them """
+    barrier = threading.Barrier(2, timeout=5)
+    finished = []
+
+    def work(node):
+        if node in ('a', 'b'):
+            barrier.wait()
+        finished.append(node)
+        return node.upper()
+
+    results, errors = run_graph({'a': set(), 'b': set(), 'c': {'a', 'b'}}, work)
+
+    assert not errors
+    assert results == {'a': 'A', 'b': 'B', 'c': 'C'}
+    assert finished[-1] == 'c'
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from potemkin.cloudformationstack import CloudFormationStack
+from potemkin.stackpool import StackPool, StackPoolRegistry
+
+
+def test_pool_never_exceeds_size_or_demand():
+    """ test the pool keeps size stacks ahead but does not create more than registered users need """
+    created = []
+    lock = threading.Lock()
+
+    def create():
+        with lock:
+            created.append(f'stack{len(created)}')
+            return created[-1], {}
+
+    pool = StackPool(create, size=2)
+    for _ in range(3):
+        pool.register()
+
+    leased = [pool.lease()[0] for _ in range(3)]
+    deleted = []
+    pool.drain(deleted.append)
+
+    assert sorted(leased) == ['stack0', 'stack1', 'stack2']
+    assert deleted == []
+
+
+def test_pool_creation_error_raised_on_lease():
+    """ test a failed background creation surfaces in the test that leases it """
+    def create():
+        raise Exception('StackCreationError')
+
+    pool = StackPool(create, size=1)
+    pool.register()
+
+    with pytest.raises(Exception, match='StackCreationError'):
+        pool.lease()
+
+
+def test_pooled_stacks_leased_and_drained(cloudformation, template, no_wait, monkeypatch):
+    """ test pooled tests get distinct stacks and unleased stacks are deleted when the pool drains """
+    registry = StackPoolRegistry()
+    monkeypatch.setattr('potemkin.cloudformationstack.stack_pools', registry)
+    seen = []
+    tests = []
+    for _ in range(3):
+        stack = CloudFormationStack(template, stack_name_stem='TestStack', pool_size=2, wait_strategy=no_wait)
+        stack._cloudformation_client = cloudformation
+        tests.append(stack(lambda outputs, name: seen.append(name)))
+
+    registry.warm_all()
+    tests[0]()
+    registry.drain_all()
+
+    assert len(seen) == 1
+    assert sorted(cloudformation.deleted) == sorted(cloudformation.created)
+
+
+def test_share_and_pool_are_exclusive(template):
+    """ test asking for a shared and a pooled stack at once is an error """
+    with pytest.raises(ValueError):
+        CloudFormationStack(template, share=True, pool_size=2)
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from potemkin.cloudformationstack import CloudFormationStack
+from potemkin.teardown import BackgroundTeardown, TeardownError
+
+
+def test_wait_reports_all_failures_together():
+    """ test the session barrier raises one error naming every failed teardown """
+    teardowns = BackgroundTeardown()
+
+    def fail(message):
+        raise Exception(message)
+
+    teardowns.submit('first', fail, 'ENI still attached')
+    teardowns.submit('second', lambda: None)
+    teardowns.submit('third', fail, 'bucket not empty')
+
+    with pytest.raises(TeardownError) as error:
+        teardowns.wait()
+
+    assert [description for description, _ in error.value.failures] == ['first', 'third']
+    assert 'bucket not empty' in str(error.value)
+
+
+def test_test_returns_before_background_delete_completes(cloudformation, template, no_wait, monkeypatch):
+    """ test background_teardown does not block the test on the stack delete """
+    teardowns = BackgroundTeardown()
+    monkeypatch.setattr('potemkin.cloudformationstack.background_teardowns', teardowns)
+    release = threading.Event()
+    delete_stack = cloudformation.delete_stack
+
+    def slow_delete(StackName):
+        release.wait()
+        delete_stack(StackName)
+
+    cloudformation.delete_stack = slow_delete
+    stack = CloudFormationStack(template, stack_name_stem='TestStack', background_teardown=True,
+                                wait_strategy=no_wait)
+    stack._cloudformation_client = cloudformation
+
+    stack(lambda outputs, name: None)()
+
+    assert cloudformation.deleted == []
+    assert teardowns.pending() == 1
+    release.set()
+    teardowns.wait()
+    assert cloudformation.deleted == cloudformation.created
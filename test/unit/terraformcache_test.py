@@ -0,0 +1,58 @@
+import os
+import threading
+
+from potemkin.terraformresources import TerraformResources
+
+
+def _inits(terraform_stub):
+    return [invocation for invocation in terraform_stub() if invocation['args'][0] == 'init']
+
+
+def _applies(terraform_stub):
+    return [invocation for invocation in terraform_stub() if invocation['args'][0] == 'apply']
+
+
+def test_init_runs_once_per_fingerprint(terraform_stub, terraform_root, tmp_path):
+    """ test concurrent and later tests reuse one init and every working copy gets .terraform """
+    tests = [TerraformResources(terraform_root, teardown=False, working_dir=str(tmp_path))(lambda tf_outputs: None)
+             for _ in range(3)]
+    threads = [threading.Thread(target=test) for test in tests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tests[0]()
+
+    assert len(_inits(terraform_stub)) == 1
+    assert all(os.path.isdir(os.path.join(apply['cwd'], '.terraform', 'providers'))
+               for apply in _applies(terraform_stub))
+
+
+def test_init_reruns_when_providers_change(terraform_stub, terraform_root, tmp_path):
+    """ test a new lock file or provider invalidates the cached init, but other edits don't """
+    def run():
+        TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: None)()
+
+    run()
+    with open(os.path.join(terraform_root, 'main.tf'), 'a') as main:
+        main.write('resource "aws_eip" "eip2" {}\n')
+    run()
+    with open(os.path.join(terraform_root, 'main.tf'), 'a') as main:
+        main.write('resource "random_id" "suffix" {}\n')
+    run()
+    with open(os.path.join(terraform_root, '.terraform.lock.hcl'), 'w') as lock:
+        lock.write('provider "registry.terraform.io/hashicorp/aws" {}\n')
+    run()
+
+    assert len(_inits(terraform_stub)) == 3
+
+
+def test_plugin_cache_shared(terraform_stub, terraform_root, tmp_path):
+    """ test terraform runs with the shared plugin cache, and init_cache=False runs init every time """
+    TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: None)()
+    for _ in range(2):
+        TerraformResources(terraform_root, working_dir=str(tmp_path), init_cache=False)(lambda tf_outputs: None)()
+
+    invocations = terraform_stub()
+    assert invocations[0]['plugin_cache'] == str(tmp_path / 'cache' / 'terraform' / 'plugin-cache')
+    assert len(_inits(terraform_stub)) == 3
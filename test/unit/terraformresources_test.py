@@ -0,0 +1,50 @@
+import os
+import threading
+
+from potemkin.terraformresources import TerraformResources
+
+
+def test_each_test_applies_in_its_own_working_copy(terraform_stub, terraform_root, tmp_path):
+    """ test concurrent tests never share a directory or state and the process cwd is left alone """
+    cwd = os.getcwd()
+    outputs = []
+    tests = [
+        TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: outputs.append(tf_outputs))
+        for _ in range(3)
+    ]
+
+    threads = [threading.Thread(target=test) for test in tests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    applies = [invocation for invocation in terraform_stub() if invocation['args'][0] == 'apply']
+    assert os.getcwd() == cwd
+    assert outputs == [{'EIPOutput': 'eipalloc-1'}] * 3
+    assert len({apply['cwd'] for apply in applies}) == 3
+    assert terraform_root not in {apply['cwd'] for apply in applies}
+    assert not os.path.exists(os.path.join(terraform_root, 'terraform.tfstate'))
+    assert all(not os.path.exists(apply['cwd']) for apply in applies)
+
+
+def test_working_copy_kept_without_teardown(terraform_stub, terraform_root, tmp_path):
+    """ test the working copy and its state survive when teardown is disabled """
+    TerraformResources(terraform_root, teardown=False, working_dir=str(tmp_path))(lambda tf_outputs: None)()
+
+    apply = [invocation for invocation in terraform_stub() if invocation['args'][0] == 'apply'][0]
+    assert os.path.exists(os.path.join(apply['cwd'], 'terraform.tfstate'))
+    assert 'destroy' not in [invocation['args'][0] for invocation in terraform_stub()]
+
+
+def test_remote_backend_state_kept_per_working_copy(terraform_stub, terraform_root, tmp_path):
+    """ test each working copy of a root with a remote backend applies in, then deletes, its own workspace """
+    with open(os.path.join(terraform_root, 'backend.tf'), 'w') as backend:
+        backend.write('terraform {\n  backend "s3" {\n    key = "potemkin.tfstate"\n  }\n}\n')
+    for _ in range(2):
+        TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: None)()
+
+    workspaces = [invocation['args'][1:] for invocation in terraform_stub() if invocation['args'][0] == 'workspace']
+    created = [args[1] for args in workspaces if args[0] == 'new']
+    assert len(set(created)) == 2
+    assert [args[1] for args in workspaces if args[0] == 'delete'] == created
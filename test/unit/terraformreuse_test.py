@@ -0,0 +1,26 @@
+from potemkin.terraformresources import ReusedRoots, TerraformResources
+
+
+def _commands(terraform_stub):
+    return [invocation['args'][0] for invocation in terraform_stub()]
+
+
+def test_reuse_skips_apply_without_changes_and_applies_diff(terraform_stub, terraform_root, tmp_path, monkeypatch):
+    """ test reused roots are applied once, only re-applied when the plan has changes and destroyed at the end """
+    roots = ReusedRoots()
+    monkeypatch.setattr('potemkin.terraformresources.reused_roots', roots)
+    outputs = []
+
+    def run(parameters):
+        TerraformResources(terraform_root, parameters=parameters, reuse=True, working_dir=str(tmp_path))(
+            lambda tf_outputs: outputs.append(tf_outputs))()
+
+    run({'BucketName': 'one'})
+    run({'BucketName': 'one'})
+    run({'BucketName': 'two'})
+    assert _commands(terraform_stub) == ['init', 'apply', 'plan', 'plan', 'apply']
+
+    roots.teardown_all()
+    assert _commands(terraform_stub)[-1] == 'destroy'
+    assert outputs == [{'EIPOutput': 'eipalloc-1'}] * 3
+    assert len({invocation['cwd'] for invocation in terraform_stub()[1:]}) == 1
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from potemkin.terraformresources import TerraformResources
+from potemkin.terraformrunner import TerraformError, TerraformRunner
+
+
+def test_outputs_collected_from_apply_stream(terraform_stub, terraform_root, tmp_path):
+    """ test apply -json provides the outputs so terraform output never runs """
+    outputs = []
+    TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: outputs.append(tf_outputs))()
+
+    assert outputs == [{'EIPOutput': 'eipalloc-1'}]
+    assert [invocation['args'][0] for invocation in terraform_stub()] == ['init', 'apply', 'destroy']
+
+
+def test_sensitive_outputs_read_after_apply(terraform_stub, terraform_root, tmp_path, monkeypatch):
+    """ test the apply stream withholding a sensitive value falls back to terraform output -json """
+    monkeypatch.setenv('STUB_SENSITIVE', '1')
+    outputs = []
+    TerraformResources(terraform_root, working_dir=str(tmp_path))(lambda tf_outputs: outputs.append(tf_outputs))()
+
+    assert outputs == [{'EIPOutput': 'eipalloc-1', 'Password': 'hunter2'}]
+    assert [invocation['args'][0] for invocation in terraform_stub()] == ['init', 'apply', 'output', 'destroy']
+
+
+def test_resource_timings_streamed(terraform_stub, terraform_root):
+    """ test per resource timings are picked out of the message stream """
+    result = TerraformRunner().run(['apply', '-auto-approve', '-json'], terraform_root, json_stream=True)
+
+    assert result.resource_timings == {'aws_eip.eip1': 2}
+
+
+def test_deadline_kills_terraform(terraform_stub, terraform_root, monkeypatch):
+    """ test a run past its deadline is killed and reported as a TerraformError """
+    monkeypatch.setenv('STUB_SLEEP', '30')
+    start = time.monotonic()
+
+    with pytest.raises(TerraformError) as error:
+        TerraformRunner(timeout=0.5).run(['apply', '-auto-approve', '-json'], terraform_root, json_stream=True)
+
+    assert error.value.timed_out
+    assert time.monotonic() - start < 10
+
+
+def test_failure_raises_terraform_error(terraform_stub, terraform_root):
+    """ test a failing command raises an exception carrying its stderr instead of raising a string """
+    with pytest.raises(TerraformError) as error:
+        TerraformRunner().run(['fail'], terraform_root)
+
+    assert error.value.returncode == 1
+    assert 'Error: boom' in str(error.value)
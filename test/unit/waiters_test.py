@@ -0,0 +1,83 @@
+import random
+
+from potemkin.waiters import AdaptiveBackoff, FixedDelay, StackWaiter, template_resource_types
+
+
+class FakeClock:
+    """ Deterministic clock: sleeping just moves time forward """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def observed_completion(strategy, completes_at, deadline=300, resource_types=()):
+    """ Simulate a stack settling at completes_at seconds and return when the waiter notices """
+    clock = FakeClock()
+    waiter = StackWaiter(strategy, clock=clock)
+    done, _ = waiter.wait(lambda: (clock.now >= completes_at, None), deadline=deadline,
+                          resource_types=resource_types)
+    assert done
+    return clock.now
+
+
+def test_fixed_delay_reproduces_original_waiter():
+    """ test a 25 second stack costs 40 seconds with the original 20 second waiter """
+    assert observed_completion(FixedDelay(20), completes_at=25) == 40
+
+
+def test_adaptive_backoff_saves_latency_over_fixed_delay():
+    """ test adaptive backoff notices completion sooner across a range of stack durations """
+    stack_durations = random.Random(1)
+    durations = [stack_durations.uniform(10, 300) for _ in range(200)]
+    fixed = [observed_completion(FixedDelay(20), completes_at) - completes_at for completes_at in durations]
+    adaptive = [
+        observed_completion(AdaptiveBackoff(rng=random.Random(0)), completes_at) - completes_at
+        for completes_at in durations
+    ]
+
+    mean_fixed = sum(fixed) / len(fixed)
+    mean_adaptive = sum(adaptive) / len(adaptive)
+    print(f'mean dead time: fixed {mean_fixed:.1f}s adaptive {mean_adaptive:.1f}s')
+    assert mean_adaptive < mean_fixed * 0.75
+    assert observed_completion(AdaptiveBackoff(jitter=0), completes_at=25) < 30
+
+
+def test_resource_hints_postpone_first_poll():
+    """ test the first poll waits for the slowest hinted resource type """
+    polls = []
+    clock = FakeClock()
+    strategy = AdaptiveBackoff(jitter=0, resource_hints={'AWS::EC2::NatGateway': 90, 'AWS::EC2::EIP': 5})
+
+    def poll():
+        polls.append(clock.now)
+        return clock.now >= 95, None
+
+    StackWaiter(strategy, clock=clock).wait(poll, deadline=300,
+                                            resource_types={'AWS::EC2::NatGateway', 'AWS::EC2::EIP'})
+
+    assert polls[0] == 90
+    assert len(polls) <= 4
+
+
+def test_deadline_bounds_total_wait():
+    """ test the wait gives up once the deadline is spent rather than after a number of attempts """
+    clock = FakeClock()
+    done, _ = StackWaiter(AdaptiveBackoff(jitter=0), clock=clock).wait(lambda: (False, None), deadline=60)
+
+    assert not done
+    assert clock.now == 60
+
+
+def test_template_resource_types_yml_and_json():
+    """ test resource types are found in both template formats """
+    yml = 'Resources:\n  EIP:\n    Type: AWS::EC2::EIP\n  Bucket:\n    Type: "AWS::S3::Bucket"\n'
+    json_template = '{"Resources": {"EIP": {"Type": "AWS::EC2::EIP"}}}'
+
+    assert template_resource_types(yml) == {'AWS::EC2::EIP', 'AWS::S3::Bucket'}
+    assert template_resource_types(json_template) == {'AWS::EC2::EIP'}